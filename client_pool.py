@@ -0,0 +1,82 @@
+"""
+提供商客戶端池
+按 (提供商, 同步/異步, API Key) 復用客戶端和其中的 HTTP 連接池，
+閒置超時或超出數量的客戶端從池中移除；每個客戶端只持有自己的 Key，不修改任何全局配置
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+from google import genai
+from openai import OpenAI, AsyncOpenAI
+
+# ============ 配置 ============
+
+# 客戶端閒置多久後從池中移除（秒）
+CLIENT_IDLE_TIMEOUT = int(os.environ.get("HOMEPAGE_CLIENT_IDLE_TIMEOUT", "300"))
+# 最多保留的客戶端數量，超出時移除最久未使用的
+CLIENT_POOL_MAX_SIZE = int(os.environ.get("HOMEPAGE_CLIENT_POOL_MAX_SIZE", "64"))
+
+
+def _create_client(provider, kind, api_key):
+    if provider == "Gemini":
+        # genai.Client 同時提供同步接口和 .aio 異步接口
+        return genai.Client(api_key=api_key)
+    if provider == "OpenAI":
+        # 重試統一由 provider_limits 負責（限流、Retry-After、釋放並發名額），關閉 SDK 自帶的重試，
+        # 否則兩層重試相乘，SDK 退避期間還佔着並發信號量
+        client_class = AsyncOpenAI if kind == "async" else OpenAI
+        return client_class(api_key=api_key, max_retries=0)
+    raise ValueError(f"未知的提供商: {provider}")
+
+
+class ClientPool:
+    """客戶端池：LRU + 閒置超時
+
+    移出池的客戶端不主動關閉：取走它的請求（例如還在讀的流）可能仍在使用，
+    等最後一個引用釋放後由垃圾回收關閉連接
+    """
+
+    def __init__(self, idle_timeout=CLIENT_IDLE_TIMEOUT, max_size=CLIENT_POOL_MAX_SIZE):
+        self.idle_timeout = idle_timeout
+        self.max_size = max_size
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, provider, api_key, kind="sync"):
+        """取得（或創建）該 Key 的客戶端"""
+        # 池中只用 Key 的哈希做鍵，日誌和調試輸出裡不會出現明文 Key
+        key = (provider, kind, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.pop(key, None)
+            self._sweep(now)
+            if entry is None:
+                client = _create_client(provider, kind, api_key)
+            else:
+                client = entry[0]
+            self._clients[key] = (client, now)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+        return client
+
+    def _sweep(self, now):
+        """移除閒置超時的客戶端"""
+        expired = [k for k, (_, used) in self._clients.items() if now - used > self.idle_timeout]
+        for k in expired:
+            del self._clients[k]
+
+    def clear(self):
+        """清空客戶端池"""
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+# 全進程共用的客戶端池
+client_pool = ClientPool()
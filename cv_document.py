@@ -0,0 +1,99 @@
+"""
+簡歷的中間表示
+解析得到的 JSON 在渲染前只規範化一次：字段統一為 HTML 轉義過的字符串，
+可選字段是否存在預先算好（has_date、has_tags…），缺失或類型不對的字段補成空值；
+所有主題都從同一份 Document 渲染，不再各自對原始字典反覆 .get() 和判斷
+
+Document、Section、Item 都是具名元組：不可變、沒有實例字典；
+Section.digest 是章節內容的哈希，fragment_cache 用它快取各主題渲染好的章節
+"""
+
+import hashlib
+import html
+import re
+from collections import namedtuple
+
+from cv_schema import SECTION_TYPES
+
+DEFAULT_SECTION_TYPE = "text-content"
+# 沒有 name 字段時 <title> 使用的標題；name 為空字符串時標題也為空（與原來的模板一致）
+DEFAULT_PAGE_TITLE = "Academic Homepage"
+
+# 需要轉義的字符；大多數字段一個都沒有，先查一遍比直接轉義快
+HTML_SPECIAL = re.compile("[&<>\"']")
+
+Item = namedtuple("Item", [
+    "title", "subtitle", "date", "description", "tags",
+    "has_subtitle", "has_date", "has_description", "has_tags",
+])
+
+Section = namedtuple("Section", ["title", "type", "items", "digest"])
+
+Document = namedtuple("Document", [
+    "name", "title", "email", "website", "bio", "sections",
+    "has_title", "has_email", "has_website", "has_bio", "page_title",
+])
+
+
+def escape(value):
+    """轉義後的字符串；None 和空值為空字符串"""
+    if value is None:
+        return ""
+    text = (value if isinstance(value, str) else str(value)).strip()
+    return html.escape(text) if HTML_SPECIAL.search(text) else text
+
+
+def _tags(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        return ()
+    return tuple(tag for tag in (escape(tag) for tag in value) if tag)
+
+
+def normalize_item(item):
+    """規範化一個條目；模型偶爾把條目寫成字符串，當作只有描述的條目"""
+    if not isinstance(item, dict):
+        item = {"description": item}
+    title = escape(item.get("title"))
+    subtitle = escape(item.get("subtitle"))
+    date = escape(item.get("date"))
+    description = escape(item.get("description"))
+    tags = _tags(item.get("tags"))
+    return Item(title, subtitle, date, description, tags,
+                bool(subtitle), bool(date), bool(description), bool(tags))
+
+
+def section_digest(title, section_type, items):
+    """章節內容的哈希：標題、類型和全部條目的字段都參與（用控制字符分隔，拼接後只哈希一次）"""
+    text = "\x1e".join(
+        ["\x1f".join((title, section_type))]
+        + ["\x1f".join((item.title, item.subtitle, item.date, item.description) + item.tags) for item in items]
+    )
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def normalize_section(section):
+    title = escape(section.get("title"))
+    section_type = section.get("type")
+    section_type = section_type if section_type in SECTION_TYPES else DEFAULT_SECTION_TYPE
+    items = section.get("items")
+    items = tuple(normalize_item(item) for item in items if item is not None) if isinstance(items, list) else ()
+    return Section(title, section_type, items, section_digest(title, section_type, items))
+
+
+def normalize(data):
+    """把解析結果（字典）規範化為 Document；已經是 Document 時原樣返回"""
+    if isinstance(data, Document):
+        return data
+    data = data if isinstance(data, dict) else {}
+    name, title, email, website, bio = (
+        escape(data.get(field)) for field in ("name", "title", "email", "website", "bio")
+    )
+    sections = data.get("sections")
+    sections = tuple(
+        normalize_section(section) for section in sections if isinstance(section, dict)
+    ) if isinstance(sections, list) else ()
+    page_title = name if "name" in data else DEFAULT_PAGE_TITLE
+    return Document(name, title, email, website, bio, sections,
+                    bool(title), bool(email), bool(website), bool(bio), page_title)
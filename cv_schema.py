@@ -0,0 +1,85 @@
+"""
+簡歷 JSON 結構
+三個應用的提示詞描述的都是同一份結構；這裡是它的 JSON Schema，
+並由它生成 OpenAI 的 response_format 和 Gemini 的 response_schema，讓模型直接輸出合法 JSON
+"""
+
+import copy
+
+SECTION_TYPES = ["timeline", "grid-list", "text-content", "gallery"]
+
+ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "subtitle": {"type": "string"},
+        "date": {"type": "string"},
+        "description": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+SECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "type": {"type": "string", "enum": SECTION_TYPES},
+        "items": {"type": "array", "items": ITEM_SCHEMA},
+    },
+}
+
+# 字段順序即輸出順序：頂層字段在前、sections 在後，流式預覽能先顯示姓名和簡介
+CV_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "title": {"type": "string"},
+        "email": {"type": "string"},
+        "website": {"type": "string"},
+        "bio": {"type": "string"},
+        "sections": {"type": "array", "items": SECTION_SCHEMA},
+    },
+}
+
+
+def _walk(schema, visit):
+    """深拷貝並對每一層 schema 調用 visit(node)"""
+    node = copy.deepcopy(schema)
+
+    def walk(item):
+        visit(item)
+        for child in item.get("properties", {}).values():
+            walk(child)
+        if "items" in item:
+            walk(item["items"])
+
+    walk(node)
+    return node
+
+
+def _openai_strict(node):
+    # strict 模式要求每個對象列出全部必填字段並禁止額外字段
+    if node.get("type") == "object":
+        node["required"] = list(node["properties"])
+        node["additionalProperties"] = False
+
+
+def _gemini_types(node):
+    # Gemini 的 Schema 使用大寫類型名，用 property_ordering 固定輸出順序
+    node["type"] = node["type"].upper()
+    if node["type"] == "OBJECT":
+        node["required"] = list(node["properties"])
+        node["property_ordering"] = list(node["properties"])
+
+
+def openai_response_format(schema=CV_SCHEMA, name="academic_cv"):
+    """OpenAI chat.completions 的 response_format（Structured Outputs）"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "schema": _walk(schema, _openai_strict), "strict": True},
+    }
+
+
+def gemini_response_schema(schema=CV_SCHEMA):
+    """Gemini GenerateContentConfig 的 response_schema"""
+    return _walk(schema, _gemini_types)
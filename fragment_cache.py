@@ -0,0 +1,83 @@
+"""
+章節片段快取
+渲染好的章節 HTML 按 (主題, 章節內容哈希) 記住：修改一條發表後重新生成，
+或流式預覽每來一個章節就重新渲染整頁時，沒有變化的章節直接取用快取的片段，只重建改動的章節
+
+章節內容哈希在 cv_document 規範化時計算（Section.digest），各主題共用
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# ============ 配置 ============
+
+# 快取的章節片段數和總字符數上限，超出時淘汰最久未使用的片段
+SECTION_CACHE_ENTRIES = int(os.environ.get("HOMEPAGE_SECTION_CACHE_ENTRIES", "1024"))
+SECTION_CACHE_CHARS = int(os.environ.get("HOMEPAGE_SECTION_CACHE_CHARS", str(32 * 1024 * 1024)))
+
+
+class FragmentCache:
+    """有界的 LRU；多個執行緒同時渲染主題，因此加鎖"""
+
+    def __init__(self, max_entries=SECTION_CACHE_ENTRIES, max_chars=SECTION_CACHE_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment):
+        # 單個超過上限的片段不快取，否則會把其他片段全部擠掉
+        if len(fragment) > self.max_chars:
+            return
+        with self._lock:
+            previous = self._fragments.pop(key, None)
+            if previous is not None:
+                self.chars -= len(previous)
+            self._fragments[key] = fragment
+            self.chars += len(fragment)
+            while len(self._fragments) > self.max_entries or self.chars > self.max_chars:
+                _, evicted = self._fragments.popitem(last=False)
+                self.chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.chars = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._fragments), "chars": self.chars}
+
+
+# 全進程共用的章節片段
+section_cache = FragmentCache()
+
+
+def cached_section(theme, section, render):
+    """章節的 HTML 片段：命中時直接返回，否則用 render(section) 渲染並記住
+
+    theme 區分同一章節在不同主題（或同一主題不同位置）下的渲染結果；
+    render 可以返回字符串，也可以逐段產出片段（拼接後快取）
+    """
+    key = (theme, section.digest)
+    fragment = section_cache.get(key)
+    if fragment is None:
+        fragment = render(section)
+        if not isinstance(fragment, str):
+            fragment = "".join(fragment)
+        section_cache.put(key, fragment)
+    return fragment
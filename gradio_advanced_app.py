@@ -4,78 +4,59 @@
 """
 
 import gradio as gr
-import google.generativeai as genai
-from openai import OpenAI
-import base64
 import json
-from pdf2image import convert_from_path
-import io
 from PIL import Image
 import os
 import zipfile
-import shutil
+import tempfile
+import time
+import asyncio
+from providers import (call_gemini_async, call_openai_async,
+                       stream_gemini_async, stream_openai_async, call_replay_async, stream_replay_async,
+                       PROVIDER_MAX_CONCURRENCY)
+from resume_pipeline import parse_resume_stream, parse_resume_auto, describe_parse, describe_progress, record_usage
+from provider_router import AUTO_PROVIDER
+from replay_provider import REPLAY_PROVIDER, REPLAY_MODEL
+from cv_document import normalize
+from fragment_cache import cached_section
+from html_stream import write_zip_entry
 
 # ============ 模板：中英文雙語高級版 ============
 
-def generate_advanced_template(data):
-    """生成支持中英文、動畫、特效的完整模板"""
-    
-    # 準備雙語數據
-    bilingual_data = {
-        "zh": {
-            "name": data.get("name", ""),
-            "title": data.get("title", ""),
-            "email": data.get("email", ""),
-            "website": data.get("website", ""),
-            "bio": data.get("bio", ""),
-            "sections": data.get("sections", [])
-        },
-        "en": {
-            "name": data.get("name", ""),
-            "title": data.get("title", "") if data.get("title") else "Researcher",
-            "email": data.get("email", ""),
-            "website": data.get("website", ""),
-            "bio": data.get("bio", ""),
-            "sections": data.get("sections", [])
-        }
-    }
-    
-    # 生成 sections HTML
-    sections_html = ""
-    for i, section in enumerate(data.get("sections", [])):
-        section_type = section.get("type", "text-content")
-        title = section.get("title", "")
-        items = section.get("items", [])
-        
-        items_html = ""
-        for item in items:
-            items_html += f'''
+def _advanced_section(section, i):
+    """逐段產出一個章節；條目的動畫延遲和章節錨點取決於它的位置 i"""
+    yield f'''
+        <section class="section" id="section-{i}">
+            <h2 class="section-title" data-aos="fade-right" data-lang-zh="{section.title}" data-lang-en="{section.title}">{section.title}</h2>
+            <div class="timeline">
+                '''
+    for item in section.items:
+        yield f'''
             <div class="timeline-item" data-aos="fade-up" data-aos-delay="{i*100}">
                 <div class="item-content">
-                    <h3 class="item-title" data-lang-zh="{item.get('title', '')}" data-lang-en="{item.get('title', '')}">{item.get('title', '')}</h3>
-                    <p class="item-subtitle">{item.get('subtitle', '')}</p>
-                    <p class="item-date">{item.get('date', '')}</p>
-                    {f'<p class="item-description">{item["description"]}</p>' if item.get('description') else ''}
+                    <h3 class="item-title" data-lang-zh="{item.title}" data-lang-en="{item.title}">{item.title}</h3>
+                    <p class="item-subtitle">{item.subtitle}</p>
+                    <p class="item-date">{item.date}</p>
+                    {f'<p class="item-description">{item.description}</p>' if item.has_description else ''}
                 </div>
             </div>
             '''
-        
-        sections_html += f'''
-        <section class="section" id="section-{i}">
-            <h2 class="section-title" data-aos="fade-right" data-lang-zh="{title}" data-lang-en="{title}">{title}</h2>
-            <div class="timeline">
-                {items_html}
+    yield '''
             </div>
         </section>
         '''
+
+
+def iter_advanced_template(data):
+    """逐段產出完整模板：頁頭（含 CSS）、各章節、頁尾（含 JS），整頁不在內存裡拼接"""
+    document = normalize(data)
     
-    # 完整 HTML
-    html = f'''<!DOCTYPE html>
+    yield f'''<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{data.get('name', 'Academic Homepage')}</title>
+    <title>{document.page_title}</title>
     <style>
         * {{ margin: 0; padding: 0; box-sizing: border-box; }}
         
@@ -357,17 +338,23 @@ def generate_advanced_template(data):
     <div class="container">
         <!-- Hero -->
         <div class="hero">
-            <h1 id="name">{data.get('name', '')}</h1>
-            <div class="typewriter" id="title">{data.get('title', '') or 'Researcher'}</div>
-            <p class="bio" id="bio">{data.get('bio', '')}</p>
+            <h1 id="name">{document.name}</h1>
+            <div class="typewriter" id="title">{document.title or 'Researcher'}</div>
+            <p class="bio" id="bio">{document.bio}</p>
             <div class="contact-buttons">
-                {f'<a href="mailto:{data["email"]}" class="btn btn-primary">📧 Email</a>' if data.get('email') else ''}
-                {f'<a href="https://{data["website"]}" target="_blank" class="btn btn-primary">🌐 Website</a>' if data.get('website') else ''}
+                {f'<a href="mailto:{document.email}" class="btn btn-primary">📧 Email</a>' if document.has_email else ''}
+                {f'<a href="https://{document.website}" target="_blank" class="btn btn-primary">🌐 Website</a>' if document.has_website else ''}
             </div>
         </div>
         
         <!-- Sections -->
-        {sections_html}
+        '''
+    
+    # 各章節（同一位置上內容沒變的章節直接取快取的片段）
+    for i, section in enumerate(document.sections):
+        yield cached_section(("advanced", i), section, lambda section, i=i: _advanced_section(section, i))
+    
+    yield '''
     </div>
     
     <script>
@@ -378,21 +365,21 @@ def generate_advanced_template(data):
         canvas.height = window.innerHeight;
         
         const particles = [];
-        for (let i = 0; i < 50; i++) {{
-            particles.push({{
+        for (let i = 0; i < 50; i++) {
+            particles.push({
                 x: Math.random() * canvas.width,
                 y: Math.random() * canvas.height,
                 vx: (Math.random() - 0.5) * 0.5,
                 vy: (Math.random() - 0.5) * 0.5,
                 radius: Math.random() * 2
-            }});
-        }}
+            });
+        }
         
-        function animateParticles() {{
+        function animateParticles() {
             ctx.clearRect(0, 0, canvas.width, canvas.height);
             ctx.fillStyle = '#00d4ff';
             
-            particles.forEach(p => {{
+            particles.forEach(p => {
                 p.x += p.vx;
                 p.y += p.vy;
                 
@@ -402,16 +389,16 @@ def generate_advanced_template(data):
                 ctx.beginPath();
                 ctx.arc(p.x, p.y, p.radius, 0, Math.PI * 2);
                 ctx.fill();
-            }});
+            });
             
             requestAnimationFrame(animateParticles);
-        }}
+        }
         
         animateParticles();
         
         // ============ 點擊波紋效果 ============
-        document.querySelectorAll('.item-content').forEach(item => {{
-            item.addEventListener('click', function(e) {{
+        document.querySelectorAll('.item-content').forEach(item => {
+            item.addEventListener('click', function(e) {
                 const ripple = document.createElement('span');
                 ripple.classList.add('ripple');
                 const rect = this.getBoundingClientRect();
@@ -421,23 +408,23 @@ def generate_advanced_template(data):
                 ripple.style.top = e.clientY - rect.top - size/2 + 'px';
                 this.appendChild(ripple);
                 setTimeout(() => ripple.remove(), 600);
-            }});
-        }});
+            });
+        });
         
         // ============ 語言切換 ============
         const langBtns = document.querySelectorAll('.lang-btn');
         let currentLang = 'zh';
         
-        langBtns.forEach(btn => {{
-            btn.addEventListener('click', () => {{
+        langBtns.forEach(btn => {
+            btn.addEventListener('click', () => {
                 currentLang = btn.dataset.lang;
                 langBtns.forEach(b => b.classList.remove('active'));
                 btn.classList.add('active');
                 
                 // 這裡可以添加切換文本的邏輯
                 // 現在只是演示功能
-            }});
-        }});
+            });
+        });
         
         // ============ 打字機效果 ============
         const title = document.getElementById('title');
@@ -445,42 +432,42 @@ def generate_advanced_template(data):
         title.textContent = '';
         let i = 0;
         
-        function typeWriter() {{
-            if (i < text.length) {{
+        function typeWriter() {
+            if (i < text.length) {
                 title.textContent += text.charAt(i);
                 i++;
                 setTimeout(typeWriter, 100);
-            }}
-        }}
+            }
+        }
         
         setTimeout(typeWriter, 500);
         
         // ============ 響應式調整 ============
-        window.addEventListener('resize', () => {{
+        window.addEventListener('resize', () => {
             canvas.width = window.innerWidth;
             canvas.height = window.innerHeight;
-        }});
+        });
     </script>
 </body>
 </html>'''
-    
-    return html
+
+
+def generate_advanced_template(data):
+    """生成支持中英文、動畫、特效的完整模板"""
+    return "".join(iter_advanced_template(data))
 
 
 # ============ 生成 GitHub Pages 項目 ============
 
-def generate_github_pages_project(data, output_dir="homepage_project"):
-    """生成完整的 GitHub Pages 項目文件夾"""
-    
-    # 創建目錄
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
+def generate_github_pages_project(data, zip_path=None, document=None):
+    """打包完整的 GitHub Pages 項目；document 為已規範化的 data，預覽和項目共用一份
+
+    index.html 由模板逐段產出、直接流式寫入 ZIP 條目，不先寫到磁盤再讀回；
+    不指定 zip_path 時每次請求使用獨立的臨時目錄，同時進行的請求不會互相覆蓋。返回 ZIP 路徑
+    """
     
-    # 生成 index.html
-    html = generate_advanced_template(data)
-    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
-        f.write(html)
+    if zip_path is None:
+        zip_path = os.path.join(tempfile.mkdtemp(prefix="homepage_"), "homepage_project.zip")
     
     # 生成 README.md
     readme = f"""# {data.get('name', 'Academic')} Homepage
@@ -512,39 +499,22 @@ git push -u origin main
 Made with ❤️
 """
     
-    with open(os.path.join(output_dir, "README.md"), "w", encoding="utf-8") as f:
-        f.write(readme)
-    
-    # 創建 ZIP
-    zip_path = f"{output_dir}.zip"
+    # 創建 ZIP：index.html 流式寫入，README.md 直接寫入
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(output_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, output_dir)
-                zipf.write(file_path, arcname)
+        write_zip_entry(zipf, "index.html", iter_advanced_template(document or data))
+        zipf.writestr("README.md", readme)
     
-    return output_dir, zip_path
+    return zip_path
 
 
 # ============ PDF 處理（從之前的代碼複製）============
 
-def pdf_to_images(pdf_file):
-    """將 PDF 轉換為圖片列表"""
-    try:
-        images = convert_from_path(pdf_file, dpi=150)
-        return images
-    except Exception as e:
-        raise Exception(f"PDF 轉換失敗: {str(e)}")
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+OPENAI_MODEL = "gpt-4o"
+PROVIDER_MODELS = {"Gemini": GEMINI_MODEL, "OpenAI": OPENAI_MODEL, REPLAY_PROVIDER: REPLAY_MODEL}
 
 
-def parse_with_gemini(images, api_key):
-    """使用 Gemini Vision API 解析簡歷"""
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = """分析這份學術簡歷，提取所有信息並返回 JSON 格式：
+GEMINI_PROMPT = """分析這份學術簡歷，提取所有信息並返回 JSON 格式：
 {
   "name": "姓名",
   "title": "職稱",
@@ -562,89 +532,104 @@ def parse_with_gemini(images, api_key):
 
 返回純 JSON。"""
 
-        response = model.generate_content([prompt] + images)
-        text = response.text.strip()
-        if text.startswith("```json"):
-            text = text[7:-3].strip()
-        elif text.startswith("```"):
-            text = text[3:-3].strip()
-        
-        data = json.loads(text)
-        return data, None
+OPENAI_PROMPT = "分析這份學術簡歷，提取所有信息並返回 JSON 格式。"
+
+
+async def parse_with_gemini_async(images, api_key, page_texts=None):
+    """使用 Gemini Vision API 解析簡歷"""
+    try:
+        return await call_gemini_async(api_key, GEMINI_MODEL, GEMINI_PROMPT, images, page_texts), None
     except Exception as e:
         return None, f"Gemini 解析失敗: {str(e)}"
 
 
-def parse_with_openai(images, api_key):
+async def parse_with_openai_async(images, api_key, page_texts=None):
     """使用 OpenAI GPT-4o Vision API 解析簡歷"""
     try:
-        client = OpenAI(api_key=api_key)
-        
-        image_contents = []
-        for img in images:
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            image_contents.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{img_str}"}
-            })
-        
-        prompt = "分析這份學術簡歷，提取所有信息並返回 JSON 格式。"
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": [{"type": "text", "text": prompt}, *image_contents]}],
-            max_tokens=4000
-        )
-        
-        text = response.choices[0].message.content.strip()
-        if text.startswith("```json"):
-            text = text[7:-3].strip()
-        
-        data = json.loads(text)
-        return data, None
+        return await call_openai_async(api_key, OPENAI_MODEL, OPENAI_PROMPT, images, page_texts), None
     except Exception as e:
         return None, f"OpenAI 解析失敗: {str(e)}"
 
 
+def stream_with_gemini(images, api_key, page_texts=None):
+    """流式調用 Gemini，逐段返回響應文本"""
+    return stream_gemini_async(api_key, GEMINI_MODEL, GEMINI_PROMPT, images, page_texts)
+
+
+def stream_with_openai(images, api_key, page_texts=None):
+    """流式調用 OpenAI，逐段返回響應文本"""
+    return stream_openai_async(api_key, OPENAI_MODEL, OPENAI_PROMPT, images, page_texts)
+
+
+async def parse_with_replay_async(images, api_key, page_texts=None):
+    """離線回放錄製的響應（不需要 API Key，用於壓測和離線演示）"""
+    try:
+        return await call_replay_async(api_key, REPLAY_MODEL, GEMINI_PROMPT, images, page_texts), None
+    except Exception as e:
+        return None, f"回放失敗: {str(e)}"
+
+
+def stream_with_replay(images, api_key, page_texts=None):
+    """流式回放錄製的響應"""
+    return stream_replay_async(api_key, REPLAY_MODEL, GEMINI_PROMPT, images, page_texts)
+
+
+ASYNC_PARSERS = {"Gemini": parse_with_gemini_async, "OpenAI": parse_with_openai_async,
+                 REPLAY_PROVIDER: parse_with_replay_async}
+STREAMERS = {"Gemini": stream_with_gemini, "OpenAI": stream_with_openai, REPLAY_PROVIDER: stream_with_replay}
+PROMPTS = {"Gemini": GEMINI_PROMPT, "OpenAI": OPENAI_PROMPT, REPLAY_PROVIDER: GEMINI_PROMPT}
+
+
 # ============ Gradio 處理函數 ============
 
-def process_and_generate(pdf_file, provider, api_key, progress=gr.Progress()):
-    """處理簡歷並生成 GitHub Pages 項目"""
+async def process_and_generate(pdf_file, provider, api_key, fast_preview=False, progress=gr.Progress()):
+    """處理簡歷並生成 GitHub Pages 項目（流式：每解析出一個章節就更新一次預覽）"""
     
     if pdf_file is None:
-        return None, None, None, "❌ 請上傳 PDF 文件"
+        yield None, None, None, "❌ 請上傳 PDF 文件"
+        return
     
-    if not api_key:
-        return None, None, None, "❌ 請輸入 API Key"
+    if not api_key and provider != REPLAY_PROVIDER:
+        yield None, None, None, "❌ 請輸入 API Key"
+        return
     
     try:
-        # 步驟 1: 轉換 PDF
-        progress(0.2, desc="📄 轉換 PDF...")
-        images = pdf_to_images(pdf_file)
-        
-        # 步驟 2: AI 解析
-        progress(0.4, desc=f"🤖 使用 {provider} 解析...")
-        data, error = parse_with_gemini(images, api_key) if provider == "Gemini" else parse_with_openai(images, api_key)
+        # 步驟 1-2: 讀取 PDF 並用 AI 解析（同一份簡歷直接讀快取）
+        if provider == AUTO_PROVIDER:
+            # 自動模式：按延遲和錯誤率選擇提供商，需要完整 JSON 才能判斷勝負，因此不流式
+            data, error, info = await parse_resume_auto(pdf_file, api_key, ASYNC_PARSERS, PROVIDER_MODELS,
+                                                        PROMPTS, progress)
+        else:
+            async for data, error, info, done in parse_resume_stream(pdf_file, provider, api_key, STREAMERS[provider],
+                                                                     PROVIDER_MODELS[provider], PROMPTS[provider], progress,
+                                                                     draft=fast_preview):
+                if not done:
+                    yield (generate_advanced_template(data), None, json.dumps(data, ensure_ascii=False, indent=2),
+                           describe_progress(data, info))
         
         if error:
-            return None, None, None, f"❌ {error}"
+            record_usage(info, error=error)
+            yield None, None, None, f"❌ {error}"
+            return
         
         # 步驟 3: 生成項目
         progress(0.7, desc="✨ 生成 GitHub Pages 項目...")
-        output_dir, zip_path = generate_github_pages_project(data)
+        render_started = time.perf_counter()
+        # 規範化、渲染和打包都是 CPU / 磁盤工作，放到執行緒裡做，不阻塞事件循環
+        document = await asyncio.to_thread(normalize, data)
+        zip_path = await asyncio.to_thread(generate_github_pages_project, data, document=document)
         
         # 步驟 4: 生成預覽
         progress(0.9, desc="🎨 準備預覽...")
-        html_preview = generate_advanced_template(data)
+        html_preview = await asyncio.to_thread(generate_advanced_template, document)
+        record_usage(info, time.perf_counter() - render_started)
         
         progress(1.0, desc="✅ 完成！")
         
-        return html_preview, zip_path, json.dumps(data, ensure_ascii=False, indent=2), "✅ 成功！已生成 GitHub Pages 項目"
+        yield html_preview, zip_path, json.dumps(data, ensure_ascii=False, indent=2), f"✅ 成功！已生成 GitHub Pages 項目{describe_parse(info)}"
         
     except Exception as e:
-        return None, None, None, f"❌ 錯誤: {str(e)}"
+        yield None, None, None, f"❌ 錯誤: {str(e)}"
 
 
 # ============ Gradio 界面 ============
@@ -663,9 +648,10 @@ with gr.Blocks(title="🎓 高級學術主頁生成器", theme=gr.themes.Soft())
     
     with gr.Row():
         with gr.Column(scale=1):
-            provider = gr.Radio(["Gemini", "OpenAI"], value="Gemini", label="🤖 AI 提供商", info="推薦 Gemini（免費）")
+            provider = gr.Radio(["Gemini", "OpenAI", REPLAY_PROVIDER, AUTO_PROVIDER], value="Gemini", label="🤖 AI 提供商", info="推薦 Gemini（免費）；「自動」按速度選擇，可填入 Gemini 和 OpenAI 兩個 Key（逗號分隔）；Replay 離線回放錄製的響應，不需要 Key")
             api_key = gr.Textbox(label="🔑 API Key", type="password", placeholder="請輸入 API Key", info="Gemini: https://aistudio.google.com/app/apikey")
             pdf_file = gr.File(label="📄 上傳簡歷 PDF", file_types=[".pdf"], type="filepath")
+            fast_preview = gr.Checkbox(label="⚡ 快速預覽", value=False, info="先用低解析度出草稿，再用完整解析度精修")
             submit_btn = gr.Button("✨ 生成主頁項目", variant="primary", size="lg")
             status = gr.Textbox(label="📊 狀態", interactive=False)
         
@@ -689,8 +675,10 @@ with gr.Blocks(title="🎓 高級學術主頁生成器", theme=gr.themes.Soft())
     
     submit_btn.click(
         fn=process_and_generate,
-        inputs=[pdf_file, provider, api_key],
-        outputs=[html_preview, zip_file, json_output, status]
+        inputs=[pdf_file, provider, api_key, fast_preview],
+        outputs=[html_preview, zip_file, json_output, status],
+        # 處理函數是異步的，多個解析可以同時等待提供商響應
+        concurrency_limit=PROVIDER_MAX_CONCURRENCY
     )
     
     gr.Markdown("""
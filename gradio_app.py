@@ -5,38 +5,28 @@
 """
 
 import gradio as gr
-import google.generativeai as genai
-from openai import OpenAI
-import base64
 from pathlib import Path
 import json
-from pdf2image import convert_from_path
-import io
 from PIL import Image
 import tempfile
 import os
+import asyncio
+import time
+from providers import (call_gemini_async, call_openai_async,
+                       stream_gemini_async, stream_openai_async, call_replay_async, stream_replay_async,
+                       PROVIDER_MAX_CONCURRENCY)
+from resume_pipeline import parse_resume_stream, parse_resume_auto, describe_parse, describe_progress, record_usage
+from provider_router import AUTO_PROVIDER
+from replay_provider import REPLAY_PROVIDER, REPLAY_MODEL
 
 # ============ AI 解析函數 ============
 
-def pdf_to_images(pdf_file):
-    """將 PDF 轉換為圖片列表"""
-    try:
-        # Gradio 傳入的 pdf_file 是文件路徑字符串，直接使用即可
-        # 轉換 PDF 為圖片
-        images = convert_from_path(pdf_file, dpi=150)
-        
-        return images
-    except Exception as e:
-        raise Exception(f"PDF 轉換失敗: {str(e)}")
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+OPENAI_MODEL = "gpt-4o"
+PROVIDER_MODELS = {"Gemini": GEMINI_MODEL, "OpenAI": OPENAI_MODEL, REPLAY_PROVIDER: REPLAY_MODEL}
 
 
-def parse_with_gemini(images, api_key):
-    """使用 Gemini Vision API 解析簡歷"""
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = """你是一個專業的學術簡歷解析專家。請仔細分析這份學術簡歷/CV 並提取所有信息。
+GEMINI_PROMPT = """你是一個專業的學術簡歷解析專家。請仔細分析這份學術簡歷/CV 並提取所有信息。
 
 請按照以下格式返回 JSON：
 
@@ -71,47 +61,7 @@ def parse_with_gemini(images, api_key):
 
 請仔細識別所有章節並提取完整信息。返回純 JSON，不要有其他文本。"""
 
-        # 準備圖片內容
-        contents = [prompt]
-        for img in images:
-            contents.append(img)
-        
-        # 調用 API
-        response = model.generate_content(contents)
-        
-        # 解析 JSON
-        text = response.text.strip()
-        if text.startswith("```json"):
-            text = text[7:-3].strip()
-        elif text.startswith("```"):
-            text = text[3:-3].strip()
-        
-        data = json.loads(text)
-        return data, None
-        
-    except Exception as e:
-        return None, f"Gemini 解析失敗: {str(e)}"
-
-
-def parse_with_openai(images, api_key):
-    """使用 OpenAI GPT-4o Vision API 解析簡歷"""
-    try:
-        client = OpenAI(api_key=api_key)
-        
-        # 將圖片轉為 base64
-        image_contents = []
-        for img in images:
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            image_contents.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{img_str}"
-                }
-            })
-        
-        prompt = """你是一個專業的學術簡歷解析專家。請仔細分析這份學術簡歷/CV 並提取所有信息。
+OPENAI_PROMPT = """你是一個專業的學術簡歷解析專家。請仔細分析這份學術簡歷/CV 並提取所有信息。
 
 請按照以下格式返回 JSON：
 
@@ -140,36 +90,52 @@ def parse_with_openai(images, api_key):
 
 請仔細識別所有章節並提取完整信息。返回純 JSON，不要有其他文本。"""
 
-        # 調用 API
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        *image_contents
-                    ]
-                }
-            ],
-            max_tokens=4000,
-            temperature=0.1
-        )
-        
-        # 解析 JSON
-        text = response.choices[0].message.content.strip()
-        if text.startswith("```json"):
-            text = text[7:-3].strip()
-        elif text.startswith("```"):
-            text = text[3:-3].strip()
-        
-        data = json.loads(text)
-        return data, None
-        
+
+async def parse_with_gemini_async(images, api_key, page_texts=None):
+    """使用 Gemini Vision API 解析簡歷（page_texts 為文字層頁面，可只發送文字）"""
+    try:
+        return await call_gemini_async(api_key, GEMINI_MODEL, GEMINI_PROMPT, images, page_texts), None
+    except Exception as e:
+        return None, f"Gemini 解析失敗: {str(e)}"
+
+
+async def parse_with_openai_async(images, api_key, page_texts=None):
+    """使用 OpenAI GPT-4o Vision API 解析簡歷（page_texts 為文字層頁面，可只發送文字）"""
+    try:
+        return await call_openai_async(api_key, OPENAI_MODEL, OPENAI_PROMPT, images, page_texts, temperature=0.1), None
     except Exception as e:
         return None, f"OpenAI 解析失敗: {str(e)}"
 
 
+def stream_with_gemini(images, api_key, page_texts=None):
+    """流式調用 Gemini，逐段返回響應文本"""
+    return stream_gemini_async(api_key, GEMINI_MODEL, GEMINI_PROMPT, images, page_texts)
+
+
+def stream_with_openai(images, api_key, page_texts=None):
+    """流式調用 OpenAI，逐段返回響應文本"""
+    return stream_openai_async(api_key, OPENAI_MODEL, OPENAI_PROMPT, images, page_texts, temperature=0.1)
+
+
+async def parse_with_replay_async(images, api_key, page_texts=None):
+    """離線回放錄製的響應（不需要 API Key，用於壓測和離線演示）"""
+    try:
+        return await call_replay_async(api_key, REPLAY_MODEL, GEMINI_PROMPT, images, page_texts), None
+    except Exception as e:
+        return None, f"回放失敗: {str(e)}"
+
+
+def stream_with_replay(images, api_key, page_texts=None):
+    """流式回放錄製的響應"""
+    return stream_replay_async(api_key, REPLAY_MODEL, GEMINI_PROMPT, images, page_texts)
+
+
+ASYNC_PARSERS = {"Gemini": parse_with_gemini_async, "OpenAI": parse_with_openai_async,
+                 REPLAY_PROVIDER: parse_with_replay_async}
+STREAMERS = {"Gemini": stream_with_gemini, "OpenAI": stream_with_openai, REPLAY_PROVIDER: stream_with_replay}
+PROMPTS = {"Gemini": GEMINI_PROMPT, "OpenAI": OPENAI_PROMPT, REPLAY_PROVIDER: GEMINI_PROMPT}
+
+
 # ============ 生成 HTML ============
 
 def generate_html(data):
@@ -470,61 +436,58 @@ def generate_html(data):
 
 # ============ Gradio 界面 ============
 
-def process_resume(pdf_file, provider, api_key, progress=gr.Progress()):
-    """處理簡歷並生成主頁"""
+async def process_resume(pdf_file, provider, api_key, fast_preview=False, progress=gr.Progress()):
+    """處理簡歷並生成主頁（流式：每解析出一個章節就更新一次 JSON 預覽）"""
     
     if pdf_file is None:
-        return None, None, None, "❌ 請上傳 PDF 文件", None
+        yield None, None, None, "❌ 請上傳 PDF 文件", None
+        return
     
-    if not api_key:
-        return None, None, None, "❌ 請輸入 API Key", None
+    if not api_key and provider != REPLAY_PROVIDER:
+        yield None, None, None, "❌ 請輸入 API Key", None
+        return
     
     try:
-        # 步驟 1: 轉換 PDF
-        progress(0.2, desc="📄 正在轉換 PDF 為圖片...")
-        images = pdf_to_images(pdf_file)
-        
-        # 步驟 2: AI 解析
-        progress(0.4, desc=f"🤖 正在使用 {provider} 解析簡歷...")
-        if provider == "Gemini":
-            data, error = parse_with_gemini(images, api_key)
+        # 步驟 1-2: 讀取 PDF 並用 AI 解析（同一份簡歷直接讀快取）
+        if provider == AUTO_PROVIDER:
+            # 自動模式：按延遲和錯誤率選擇提供商，需要完整 JSON 才能判斷勝負，因此不流式
+            data, error, info = await parse_resume_auto(pdf_file, api_key, ASYNC_PARSERS, PROVIDER_MODELS,
+                                                        PROMPTS, progress)
         else:
-            data, error = parse_with_openai(images, api_key)
+            async for data, error, info, done in parse_resume_stream(pdf_file, provider, api_key, STREAMERS[provider],
+                                                                     PROVIDER_MODELS[provider], PROMPTS[provider], progress,
+                                                                     draft=fast_preview):
+                if not done:
+                    partial = json.dumps(data, ensure_ascii=False, indent=2)
+                    yield None, None, None, describe_progress(data, info), partial
         
         if error:
-            return None, None, None, f"❌ {error}", None
+            record_usage(info, error=error)
+            yield None, None, None, f"❌ {error}", None
+            return
         
         # 步驟 3: 生成多個主題
         progress(0.7, desc="✨ 正在生成 3 種精美主頁...")
+        render_started = time.perf_counter()
         
         # 導入模板生成器
-        from template_generator import template_gradient_purple, template_dark_minimal, template_academic_light
-        
-        # 生成各個模板
-        html1 = template_gradient_purple(data)
-        html2 = template_dark_minimal(data)
-        html3 = template_academic_light(data)
-        
-        # 保存文件
-        file1 = "homepage_gradient_purple.html"
-        file2 = "homepage_dark_minimal.html"
-        file3 = "homepage_academic_light.html"
+        from template_generator import generate_all_themes
         
-        with open(file1, "w", encoding="utf-8") as f:
-            f.write(html1)
-        with open(file2, "w", encoding="utf-8") as f:
-            f.write(html2)
-        with open(file3, "w", encoding="utf-8") as f:
-            f.write(html3)
+        # 逐個主題流式寫入文件（順序：紫色漸變、暗黑極簡、輕簡學術），整頁不在內存裡拼成字符串
+        # 每次請求寫到獨立的臨時目錄，同時進行的請求不會互相覆蓋；渲染和寫盤放到執行緒裡，不阻塞事件循環
+        output_dir = tempfile.mkdtemp(prefix="homepage_")
+        files = await asyncio.to_thread(generate_all_themes, data, output_dir=output_dir)
+        file1, file2, file3 = files.values()
+        record_usage(info, time.perf_counter() - render_started)
         
         progress(1.0, desc="✅ 完成！")
         
         json_output = json.dumps(data, ensure_ascii=False, indent=2)
         
-        return file1, file2, file3, "✅ 生成成功！已創建 3 種主題", json_output
+        yield file1, file2, file3, f"✅ 生成成功！已創建 3 種主題{describe_parse(info)}", json_output
         
     except Exception as e:
-        return None, None, None, f"❌ 錯誤: {str(e)}", None
+        yield None, None, None, f"❌ 錯誤: {str(e)}", None
 
 
 # 創建 Gradio 界面
@@ -544,10 +507,10 @@ with gr.Blocks(title="🎓 學術主頁生成器", theme=gr.themes.Soft()) as de
     with gr.Row():
         with gr.Column(scale=1):
             provider = gr.Radio(
-                choices=["Gemini", "OpenAI"],
+                choices=["Gemini", "OpenAI", REPLAY_PROVIDER, AUTO_PROVIDER],
                 value="Gemini",
                 label="🤖 AI 提供商",
-                info="推薦使用 Gemini（免費）"
+                info="推薦使用 Gemini（免費）；「自動」按速度選擇，可填入 Gemini 和 OpenAI 兩個 Key（逗號分隔）；Replay 離線回放錄製的響應，不需要 Key"
             )
             
             api_key = gr.Textbox(
@@ -563,6 +526,12 @@ with gr.Blocks(title="🎓 學術主頁生成器", theme=gr.themes.Soft()) as de
                 type="filepath"
             )
             
+            fast_preview = gr.Checkbox(
+                label="⚡ 快速預覽",
+                value=False,
+                info="先用低解析度出草稿，再用完整解析度精修"
+            )
+            
             submit_btn = gr.Button("✨ 生成 3 種主頁", variant="primary", size="lg")
         
         with gr.Column(scale=1):
@@ -581,8 +550,10 @@ with gr.Blocks(title="🎓 學術主頁生成器", theme=gr.themes.Soft()) as de
     
     submit_btn.click(
         fn=process_resume,
-        inputs=[pdf_file, provider, api_key],
-        outputs=[html_file1, html_file2, html_file3, status, json_output]
+        inputs=[pdf_file, provider, api_key, fast_preview],
+        outputs=[html_file1, html_file2, html_file3, status, json_output],
+        # 處理函數是異步的，多個解析可以同時等待提供商響應
+        concurrency_limit=PROVIDER_MAX_CONCURRENCY
     )
     
     gr.Markdown("""
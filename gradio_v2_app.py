@@ -4,39 +4,45 @@
 """
 
 import gradio as gr
-import google.generativeai as genai
-from openai import OpenAI
-import base64
 import json
-from pdf2image import convert_from_path
-import io
 from PIL import Image
 import os
 import zipfile
-import shutil
+import tempfile
+import time
+import asyncio
+from providers import (call_gemini_async, call_openai_async,
+                       stream_gemini_async, stream_openai_async, call_replay_async, stream_replay_async,
+                       PROVIDER_MAX_CONCURRENCY)
+from resume_pipeline import parse_resume_stream, parse_resume_auto, describe_parse, describe_progress, record_usage
+from provider_router import AUTO_PROVIDER
+from replay_provider import REPLAY_PROVIDER, REPLAY_MODEL
+from cv_document import normalize
+from fragment_cache import cached_section
+from html_stream import write_zip_entry
 
 # ============ 模板 1: 深色科技風 ============
 
-def template_dark_tech(data):
-    """深色背景 + 科技感 + 粒子動畫"""
-    sections_html = ""
-    for section in data.get("sections", []):
-        title = section.get("title", "")
-        items = section.get("items", [])
-        items_html = ""
-        for item in items:
-            items_html += f'''
+def _dark_tech_section(section):
+    yield f'<section><h2>{section.title}</h2>'
+    for item in section.items:
+        yield f'''
             <div class="item">
-                <h3>{item.get('title', '')}</h3>
-                <p class="sub">{item.get('subtitle', '')}</p>
-                <p class="date">{item.get('date', '')}</p>
-                {f'<p class="desc">{item["description"]}</p>' if item.get('description') else ''}
+                <h3>{item.title}</h3>
+                <p class="sub">{item.subtitle}</p>
+                <p class="date">{item.date}</p>
+                {f'<p class="desc">{item.description}</p>' if item.has_description else ''}
             </div>'''
-        sections_html += f'<section><h2>{title}</h2>{items_html}</section>'
+    yield '</section>'
+
+
+def iter_dark_tech(data):
+    """深色背景 + 科技感 + 粒子動畫（逐段產出，章節取快取的片段）"""
+    document = normalize(data)
     
-    return f'''<!DOCTYPE html>
+    yield f'''<!DOCTYPE html>
 <html lang="zh"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>{data.get('name', '')}</title>
+<title>{document.name}</title>
 <style>
 *{{margin:0;padding:0;box-sizing:border-box}}
 body{{font-family:-apple-system,sans-serif;background:linear-gradient(135deg,#0f172a,#1e293b);color:#f8fafc;min-height:100vh;padding:2rem}}
@@ -57,40 +63,48 @@ h3{{color:#00d4ff;margin-bottom:0.3rem}}
 </style></head>
 <body><div class="container">
 <div class="hero">
-<h1>{data.get('name', '')}</h1>
-<p class="title">{data.get('title', '')}</p>
-<p class="bio">{data.get('bio', '')}</p>
+<h1>{document.name}</h1>
+<p class="title">{document.title}</p>
+<p class="bio">{document.bio}</p>
 <div class="contact">
-{f'<a href="mailto:{data["email"]}">📧 Email</a>' if data.get('email') else ''}
-{f'<a href="https://{data["website"]}" target="_blank">🌐 Website</a>' if data.get('website') else ''}
+{f'<a href="mailto:{document.email}">📧 Email</a>' if document.has_email else ''}
+{f'<a href="https://{document.website}" target="_blank">🌐 Website</a>' if document.has_website else ''}
 </div>
 </div>
-{sections_html}
+'''
+    for section in document.sections:
+        yield cached_section("v2_dark_tech", section, _dark_tech_section)
+    yield '''
 </div></body></html>'''
 
 
+def template_dark_tech(data):
+    """深色背景 + 科技感 + 粒子動畫"""
+    return "".join(iter_dark_tech(data))
+
+
 # ============ 模板 2: 紫色漸變風 ============
 
-def template_gradient_purple(data):
-    """紫色漸變背景 + 玻璃態卡片"""
-    sections_html = ""
-    for section in data.get("sections", []):
-        title = section.get("title", "")
-        items = section.get("items", [])
-        items_html = ""
-        for item in items:
-            items_html += f'''
+def _gradient_purple_section(section):
+    yield f'<section><h2>{section.title}</h2><div class="grid">'
+    for item in section.items:
+        yield f'''
             <div class="card">
-                <h3>{item.get('title', '')}</h3>
-                <p class="sub">{item.get('subtitle', '')}</p>
-                <span class="date">{item.get('date', '')}</span>
-                {f'<p class="desc">{item["description"]}</p>' if item.get('description') else ''}
+                <h3>{item.title}</h3>
+                <p class="sub">{item.subtitle}</p>
+                <span class="date">{item.date}</span>
+                {f'<p class="desc">{item.description}</p>' if item.has_description else ''}
             </div>'''
-        sections_html += f'<section><h2>{title}</h2><div class="grid">{items_html}</div></section>'
+    yield '</div></section>'
+
+
+def iter_gradient_purple(data):
+    """紫色漸變背景 + 玻璃態卡片（逐段產出，章節取快取的片段）"""
+    document = normalize(data)
     
-    return f'''<!DOCTYPE html>
+    yield f'''<!DOCTYPE html>
 <html lang="zh"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>{data.get('name', '')}</title>
+<title>{document.name}</title>
 <style>
 *{{margin:0;padding:0;box-sizing:border-box}}
 body{{font-family:-apple-system,sans-serif;background:linear-gradient(135deg,#667eea,#764ba2);min-height:100vh;padding:2rem}}
@@ -112,42 +126,50 @@ h3{{color:#333;margin-bottom:0.5rem}}
 </style></head>
 <body><div class="container">
 <div class="hero">
-<h1>{data.get('name', '')}</h1>
-<p class="title">{data.get('title', '')}</p>
-<p class="bio">{data.get('bio', '')}</p>
+<h1>{document.name}</h1>
+<p class="title">{document.title}</p>
+<p class="bio">{document.bio}</p>
 <div class="contact">
-{f'<a href="mailto:{data["email"]}">📧 {data["email"]}</a>' if data.get('email') else ''}
-{f'<a href="https://{data["website"]}" target="_blank">🌐 {data["website"]}</a>' if data.get('website') else ''}
+{f'<a href="mailto:{document.email}">📧 {document.email}</a>' if document.has_email else ''}
+{f'<a href="https://{document.website}" target="_blank">🌐 {document.website}</a>' if document.has_website else ''}
 </div>
 </div>
-{sections_html}
+'''
+    for section in document.sections:
+        yield cached_section("v2_gradient_purple", section, _gradient_purple_section)
+    yield '''
 </div></body></html>'''
 
 
+def template_gradient_purple(data):
+    """紫色漸變背景 + 玻璃態卡片"""
+    return "".join(iter_gradient_purple(data))
+
+
 # ============ 模板 3: 極簡學術風 ============
 
-def template_academic_minimal(data):
-    """簡潔白色背景 + 經典學術風格"""
-    sections_html = ""
-    for section in data.get("sections", []):
-        title = section.get("title", "")
-        items = section.get("items", [])
-        items_html = ""
-        for item in items:
-            items_html += f'''
+def _academic_minimal_section(section):
+    yield f'<section><h2>{section.title}</h2>'
+    for item in section.items:
+        yield f'''
             <div class="entry">
-                <div class="meta"><span class="date">{item.get('date', '')}</span></div>
+                <div class="meta"><span class="date">{item.date}</span></div>
                 <div class="content">
-                    <h3>{item.get('title', '')}</h3>
-                    <p class="org">{item.get('subtitle', '')}</p>
-                    {f'<p class="desc">{item["description"]}</p>' if item.get('description') else ''}
+                    <h3>{item.title}</h3>
+                    <p class="org">{item.subtitle}</p>
+                    {f'<p class="desc">{item.description}</p>' if item.has_description else ''}
                 </div>
             </div>'''
-        sections_html += f'<section><h2>{title}</h2>{items_html}</section>'
+    yield '</section>'
+
+
+def iter_academic_minimal(data):
+    """簡潔白色背景 + 經典學術風格（逐段產出，章節取快取的片段）"""
+    document = normalize(data)
     
-    return f'''<!DOCTYPE html>
+    yield f'''<!DOCTYPE html>
 <html lang="zh"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>{data.get('name', '')}</title>
+<title>{document.name}</title>
 <style>
 *{{margin:0;padding:0;box-sizing:border-box}}
 body{{font-family:Georgia,'Times New Roman',serif;background:#fafafa;color:#333;line-height:1.6;padding:2rem}}
@@ -169,39 +191,47 @@ h3{{font-size:1.1rem;color:#34495e;font-weight:600;margin-bottom:0.3rem}}
 @media(max-width:600px){{.entry{{flex-direction:column}}.meta{{width:100%;margin-bottom:0.3rem}}}}
 </style></head>
 <body><div class="container">
-<h1>{data.get('name', '')}</h1>
-<p class="title">{data.get('title', '')}</p>
+<h1>{document.name}</h1>
+<p class="title">{document.title}</p>
 <div class="contact">
-{f'<a href="mailto:{data["email"]}">{data["email"]}</a>' if data.get('email') else ''}
-{f'<a href="https://{data["website"]}" target="_blank">{data["website"]}</a>' if data.get('website') else ''}
+{f'<a href="mailto:{document.email}">{document.email}</a>' if document.has_email else ''}
+{f'<a href="https://{document.website}" target="_blank">{document.website}</a>' if document.has_website else ''}
 </div>
-{f'<p class="bio">{data["bio"]}</p>' if data.get('bio') else ''}
-{sections_html}
+{f'<p class="bio">{document.bio}</p>' if document.has_bio else ''}
+'''
+    for section in document.sections:
+        yield cached_section("v2_academic_minimal", section, _academic_minimal_section)
+    yield '''
 </div></body></html>'''
 
 
+def template_academic_minimal(data):
+    """簡潔白色背景 + 經典學術風格"""
+    return "".join(iter_academic_minimal(data))
+
+
 # ============ 模板 4: 霓虹賽博風 ============
 
-def template_neon_cyber(data):
-    """黑底 + 霓虹綠 + 賽博朋克"""
-    sections_html = ""
-    for section in data.get("sections", []):
-        title = section.get("title", "")
-        items = section.get("items", [])
-        items_html = ""
-        for item in items:
-            items_html += f'''
+def _neon_cyber_section(section):
+    yield f'<section><h2>&gt; {section.title}</h2>'
+    for item in section.items:
+        yield f'''
             <div class="item">
-                <h3>{item.get('title', '')}</h3>
-                <p class="sub">{item.get('subtitle', '')}</p>
-                <p class="date">{item.get('date', '')}</p>
-                {f'<p class="desc">{item["description"]}</p>' if item.get('description') else ''}
+                <h3>{item.title}</h3>
+                <p class="sub">{item.subtitle}</p>
+                <p class="date">{item.date}</p>
+                {f'<p class="desc">{item.description}</p>' if item.has_description else ''}
             </div>'''
-        sections_html += f'<section><h2>&gt; {title}</h2>{items_html}</section>'
+    yield '</section>'
+
+
+def iter_neon_cyber(data):
+    """黑底 + 霓虹綠 + 賽博朋克（逐段產出，章節取快取的片段）"""
+    document = normalize(data)
     
-    return f'''<!DOCTYPE html>
+    yield f'''<!DOCTYPE html>
 <html lang="zh"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>{data.get('name', '')}</title>
+<title>{document.name}</title>
 <style>
 *{{margin:0;padding:0;box-sizing:border-box}}
 body{{font-family:'Courier New',monospace;background:#0a0a0a;color:#e0e0e0;padding:2rem;min-height:100vh}}
@@ -221,17 +251,25 @@ h3{{color:#fff;margin-bottom:0.5rem}}
 .desc{{color:#ccc;line-height:1.6;white-space:pre-wrap}}
 </style></head>
 <body><div class="container">
-<h1>{data.get('name', '')}</h1>
-<p class="title">{data.get('title', '')}</p>
-<p class="bio">{data.get('bio', '')}</p>
+<h1>{document.name}</h1>
+<p class="title">{document.title}</p>
+<p class="bio">{document.bio}</p>
 <div class="contact">
-{f'<a href="mailto:{data["email"]}">EMAIL</a>' if data.get('email') else ''}
-{f'<a href="https://{data["website"]}" target="_blank">WEBSITE</a>' if data.get('website') else ''}
+{f'<a href="mailto:{document.email}">EMAIL</a>' if document.has_email else ''}
+{f'<a href="https://{document.website}" target="_blank">WEBSITE</a>' if document.has_website else ''}
 </div>
-{sections_html}
+'''
+    for section in document.sections:
+        yield cached_section("v2_neon_cyber", section, _neon_cyber_section)
+    yield '''
 </div></body></html>'''
 
 
+def template_neon_cyber(data):
+    """黑底 + 霓虹綠 + 賽博朋克"""
+    return "".join(iter_neon_cyber(data))
+
+
 # ============ 模板映射 ============
 
 TEMPLATES = {
@@ -241,23 +279,23 @@ TEMPLATES = {
     "💚 霓虹賽博風": ("黑底霓虹 + 賽博朋克 + 極客風格", template_neon_cyber),
 }
 
+# 各模板的流式版本：逐段產出 HTML，生成項目時直接寫入 ZIP 條目
+TEMPLATE_STREAMS = {
+    "🌙 深色科技風": iter_dark_tech,
+    "🌈 紫色漸變風": iter_gradient_purple,
+    "📖 極簡學術風": iter_academic_minimal,
+    "💚 霓虹賽博風": iter_neon_cyber,
+}
+
 
 # ============ PDF 處理 ============
 
-def pdf_to_images(pdf_file):
-    try:
-        images = convert_from_path(pdf_file, dpi=150)
-        return images
-    except Exception as e:
-        raise Exception(f"PDF 轉換失敗: {str(e)}")
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+OPENAI_MODEL = "gpt-4o"
+PROVIDER_MODELS = {"Gemini": GEMINI_MODEL, "OpenAI": OPENAI_MODEL, REPLAY_PROVIDER: REPLAY_MODEL}
 
 
-def parse_with_gemini(images, api_key):
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = """分析這份學術簡歷，提取所有信息並返回 JSON 格式：
+GEMINI_PROMPT = """分析這份學術簡歷，提取所有信息並返回 JSON 格式：
 {
   "name": "姓名",
   "title": "職稱",
@@ -270,50 +308,59 @@ def parse_with_gemini(images, api_key):
 }
 返回純 JSON。"""
 
-        response = model.generate_content([prompt] + images)
-        text = response.text.strip()
-        if text.startswith("```json"):
-            text = text[7:-3].strip()
-        elif text.startswith("```"):
-            text = text[3:-3].strip()
-        return json.loads(text), None
+OPENAI_PROMPT = "分析學術簡歷，返回 JSON"
+
+
+async def parse_with_gemini_async(images, api_key, page_texts=None):
+    try:
+        return await call_gemini_async(api_key, GEMINI_MODEL, GEMINI_PROMPT, images, page_texts), None
     except Exception as e:
         return None, f"Gemini 解析失敗: {str(e)}"
 
 
-def parse_with_openai(images, api_key):
+async def parse_with_openai_async(images, api_key, page_texts=None):
     try:
-        client = OpenAI(api_key=api_key)
-        image_contents = []
-        for img in images:
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            image_contents.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_str}"}})
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": [{"type": "text", "text": "分析學術簡歷，返回 JSON"}, *image_contents]}],
-            max_tokens=4000
-        )
-        text = response.choices[0].message.content.strip()
-        if text.startswith("```json"):
-            text = text[7:-3].strip()
-        return json.loads(text), None
+        return await call_openai_async(api_key, OPENAI_MODEL, OPENAI_PROMPT, images, page_texts), None
     except Exception as e:
         return None, f"OpenAI 解析失敗: {str(e)}"
 
 
+def stream_with_gemini(images, api_key, page_texts=None):
+    return stream_gemini_async(api_key, GEMINI_MODEL, GEMINI_PROMPT, images, page_texts)
+
+
+def stream_with_openai(images, api_key, page_texts=None):
+    return stream_openai_async(api_key, OPENAI_MODEL, OPENAI_PROMPT, images, page_texts)
+
+
+async def parse_with_replay_async(images, api_key, page_texts=None):
+    """離線回放錄製的響應（不需要 API Key，用於壓測和離線演示）"""
+    try:
+        return await call_replay_async(api_key, REPLAY_MODEL, GEMINI_PROMPT, images, page_texts), None
+    except Exception as e:
+        return None, f"回放失敗: {str(e)}"
+
+
+def stream_with_replay(images, api_key, page_texts=None):
+    """流式回放錄製的響應"""
+    return stream_replay_async(api_key, REPLAY_MODEL, GEMINI_PROMPT, images, page_texts)
+
+
+ASYNC_PARSERS = {"Gemini": parse_with_gemini_async, "OpenAI": parse_with_openai_async,
+                 REPLAY_PROVIDER: parse_with_replay_async}
+STREAMERS = {"Gemini": stream_with_gemini, "OpenAI": stream_with_openai, REPLAY_PROVIDER: stream_with_replay}
+PROMPTS = {"Gemini": GEMINI_PROMPT, "OpenAI": OPENAI_PROMPT, REPLAY_PROVIDER: GEMINI_PROMPT}
+
+
 # ============ 生成項目 ============
 
-def generate_project(data, template_func, output_dir="homepage_project"):
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
-    
-    html = template_func(data)
-    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
-        f.write(html)
+def generate_project(data, iter_template, zip_path=None, document=None):
+    """打包 GitHub Pages 項目：index.html 由模板逐段產出、直接流式寫入 ZIP 條目，不先寫到磁盤再讀回
+
+    document 為已規範化的 data，預覽和項目共用一份；不指定 zip_path 時每次請求使用獨立的臨時目錄，同時進行的請求不會互相覆蓋；返回 ZIP 路徑
+    """
+    if zip_path is None:
+        zip_path = os.path.join(tempfile.mkdtemp(prefix="homepage_"), "homepage_project.zip")
     
     readme = f"""# {data.get('name', '')} Homepage
 
@@ -322,44 +369,54 @@ def generate_project(data, template_func, output_dir="homepage_project"):
 2. Settings → Pages → Source: main
 3. 訪問 https://username.github.io/repo
 """
-    with open(os.path.join(output_dir, "README.md"), "w", encoding="utf-8") as f:
-        f.write(readme)
-    
-    zip_path = f"{output_dir}.zip"
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(output_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path, os.path.relpath(file_path, output_dir))
+        write_zip_entry(zipf, "index.html", iter_template(document or data))
+        zipf.writestr("README.md", readme)
     
-    return html, zip_path
+    return zip_path
 
 
 # ============ Gradio 處理 ============
 
-def process_resume(pdf_file, provider, api_key, template_choice, progress=gr.Progress()):
+async def process_resume(pdf_file, provider, api_key, template_choice, fast_preview=False, progress=gr.Progress()):
     if pdf_file is None:
-        return None, None, None, "❌ 請上傳 PDF 文件"
-    if not api_key:
-        return None, None, None, "❌ 請輸入 API Key"
+        yield None, None, None, "❌ 請上傳 PDF 文件"
+        return
+    if not api_key and provider != REPLAY_PROVIDER:
+        yield None, None, None, "❌ 請輸入 API Key"
+        return
     
     try:
-        progress(0.2, desc="📄 轉換 PDF...")
-        images = pdf_to_images(pdf_file)
-        
-        progress(0.4, desc=f"🤖 使用 {provider} 解析...")
-        data, error = parse_with_gemini(images, api_key) if provider == "Gemini" else parse_with_openai(images, api_key)
+        template_func = TEMPLATES[template_choice][1]
+        # 步驟 1-2: 讀取 PDF 並用 AI 解析（同一份簡歷直接讀快取），每完成一個章節就刷新預覽
+        if provider == AUTO_PROVIDER:
+            # 自動模式：按延遲和錯誤率選擇提供商，需要完整 JSON 才能判斷勝負，因此不流式
+            data, error, info = await parse_resume_auto(pdf_file, api_key, ASYNC_PARSERS, PROVIDER_MODELS,
+                                                        PROMPTS, progress)
+        else:
+            async for data, error, info, done in parse_resume_stream(pdf_file, provider, api_key, STREAMERS[provider],
+                                                                     PROVIDER_MODELS[provider], PROMPTS[provider], progress,
+                                                                     draft=fast_preview):
+                if not done:
+                    yield (template_func(data), None, json.dumps(data, ensure_ascii=False, indent=2),
+                           describe_progress(data, info))
         if error:
-            return None, None, None, f"❌ {error}"
+            record_usage(info, error=error)
+            yield None, None, None, f"❌ {error}"
+            return
         
         progress(0.7, desc=f"🎨 生成 {template_choice} 模板...")
-        template_func = TEMPLATES[template_choice][1]
-        html, zip_path = generate_project(data, template_func)
+        render_started = time.perf_counter()
+        # 規範化一次，預覽和項目共用；渲染和打包放到執行緒裡，不阻塞事件循環
+        document = await asyncio.to_thread(normalize, data)
+        html = await asyncio.to_thread(template_func, document)
+        zip_path = await asyncio.to_thread(generate_project, data, TEMPLATE_STREAMS[template_choice], document=document)
+        record_usage(info, time.perf_counter() - render_started)
         
         progress(1.0, desc="✅ 完成！")
-        return html, zip_path, json.dumps(data, ensure_ascii=False, indent=2), f"✅ 成功！使用了「{template_choice}」模板"
+        yield html, zip_path, json.dumps(data, ensure_ascii=False, indent=2), f"✅ 成功！使用了「{template_choice}」模板{describe_parse(info)}"
     except Exception as e:
-        return None, None, None, f"❌ 錯誤: {str(e)}"
+        yield None, None, None, f"❌ 錯誤: {str(e)}"
 
 
 # ============ Gradio 界面 ============
@@ -373,9 +430,10 @@ with gr.Blocks(title="🎓 學術主頁生成器 v2", theme=gr.themes.Soft()) as
     with gr.Row():
         with gr.Column(scale=1):
             gr.Markdown("### 📤 第一步：設置")
-            provider = gr.Radio(["Gemini", "OpenAI"], value="Gemini", label="🤖 AI 提供商")
+            provider = gr.Radio(["Gemini", "OpenAI", REPLAY_PROVIDER, AUTO_PROVIDER], value="Gemini", label="🤖 AI 提供商", info="「自動」按速度選擇，可填入 Gemini 和 OpenAI 兩個 Key（逗號分隔）；Replay 離線回放錄製的響應，不需要 Key")
             api_key = gr.Textbox(label="🔑 API Key", type="password", info="Gemini: aistudio.google.com/app/apikey")
             pdf_file = gr.File(label="📄 上傳簡歷 PDF", file_types=[".pdf"], type="filepath")
+            fast_preview = gr.Checkbox(label="⚡ 快速預覽", value=False, info="先用低解析度出草稿，再用完整解析度精修")
             
             gr.Markdown("### 🎨 第二步：選擇模板風格")
             template_choice = gr.Radio(
@@ -418,8 +476,10 @@ with gr.Blocks(title="🎓 學術主頁生成器 v2", theme=gr.themes.Soft()) as
     
     submit_btn.click(
         fn=process_resume,
-        inputs=[pdf_file, provider, api_key, template_choice],
-        outputs=[html_preview, zip_file, json_output, status]
+        inputs=[pdf_file, provider, api_key, template_choice, fast_preview],
+        outputs=[html_preview, zip_file, json_output, status],
+        # 處理函數是異步的，多個解析可以同時等待提供商響應
+        concurrency_limit=PROVIDER_MAX_CONCURRENCY
     )
     
     gr.Markdown("""
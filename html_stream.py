@@ -0,0 +1,61 @@
+"""
+HTML 流式輸出
+模板以生成器逐段產出 HTML；這裡把細碎的片段合併成適中的塊，
+直接寫入文件或 ZIP 條目，整頁不會在內存裡拼成一個字符串（也不會再多一份編碼後的副本）
+"""
+
+import os
+import time
+
+# ============ 配置 ============
+
+# 合併後每塊的字符數
+STREAM_CHUNK_CHARS = int(os.environ.get("HOMEPAGE_STREAM_CHUNK_CHARS", str(64 * 1024)))
+
+
+def buffered(chunks, size=STREAM_CHUNK_CHARS):
+    """把細碎的片段合併成約 size 字符的塊；超過 size 的片段原樣產出"""
+    pending = []
+    pending_chars = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending.append(chunk)
+        pending_chars += len(chunk)
+        if pending_chars >= size:
+            yield "".join(pending)
+            pending = []
+            pending_chars = 0
+    if pending:
+        yield "".join(pending)
+
+
+def write_chunks(write, chunks, encoding=None):
+    """逐塊調用 write，返回 (渲染秒數, 寫入秒數)
+
+    片段是惰性生成的，取下一塊的時間記為渲染，write 的時間記為寫入（同 usage_meter.encode_pages）
+    """
+    rendering = writing = 0.0
+    iterator = buffered(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(iterator, None)
+        written = time.perf_counter()
+        rendering += written - started
+        if chunk is None:
+            return rendering, writing
+        write(chunk.encode(encoding) if encoding else chunk)
+        writing += time.perf_counter() - written
+
+
+def write_file(filename, chunks):
+    """流式寫入 HTML 文件，返回 (渲染秒數, 寫入秒數)"""
+    with open(filename, "w", encoding="utf-8") as f:
+        return write_chunks(f.write, chunks)
+
+
+def write_zip_entry(zipf, arcname, chunks):
+    """流式寫入 ZIP 條目（壓縮方式同 zipf），返回 (渲染秒數, 寫入秒數)"""
+    with zipf.open(arcname, "w") as entry:
+        return write_chunks(entry.write, chunks, "utf-8")
+
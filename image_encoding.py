@@ -0,0 +1,125 @@
+"""
+頁面圖片編碼
+簡歷頁面大多是白底黑字，無損 PNG 體積很大；
+這裡提供灰度、調色板量化和 JPEG / WebP 編碼，並直接從編碼緩衝區生成 base64；
+帶有頁面產物（page_artifacts）的圖片直接取用已經編碼好的結果
+
+基準測試：python image_encoding.py resume.pdf [Gemini|OpenAI]
+"""
+
+import base64
+import io
+import os
+import sys
+import time
+
+# ============ 編碼預設 ============
+
+ENCODING_PRESETS = {
+    # 原來的無損 PNG，保留作對照
+    "png": {"format": "PNG"},
+    # 灰度 + 16 色調色板，文字頁幾乎無損
+    "png-palette": {"format": "PNG", "grayscale": True, "colors": 16},
+    "jpeg": {"format": "JPEG", "grayscale": True, "quality": 80},
+    "webp": {"format": "WEBP", "grayscale": True, "quality": 75},
+}
+# 默認使用的編碼預設：文字頁上調色板 PNG 比 JPEG 小得多（JPEG 的振鈴噪點壓不下去），且沒有壓縮偽影
+IMAGE_ENCODING = os.environ.get("HOMEPAGE_IMAGE_ENCODING", "png-palette")
+# 頁面產物掛在圖片 info 上的鍵
+ARTIFACT_INFO_KEY = "artifact"
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+# ============ 編碼 ============
+
+def encode_image(image, preset=None):
+    """按預設編碼頁面圖片，返回 (memoryview, mime_type)
+
+    返回的是編碼緩衝區本身的視圖（不經 getvalue() 複製），
+    可以直接交給 base64 編碼。
+    """
+    options = ENCODING_PRESETS[preset or IMAGE_ENCODING]
+    fmt = options["format"]
+
+    if options.get("grayscale"):
+        if image.mode != "L":
+            image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if options.get("colors"):
+        image = image.quantize(colors=options["colors"])
+
+    save_options = {}
+    if "quality" in options:
+        save_options["quality"] = options["quality"]
+    if fmt == "JPEG":
+        save_options["optimize"] = True
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **save_options)
+    return buffer.getbuffer(), MIME_TYPES[fmt]
+
+
+def to_data_url(image, preset=None):
+    """編碼為 OpenAI 使用的 data URL"""
+    artifact = image.info.get(ARTIFACT_INFO_KEY)
+    if artifact is not None:
+        return artifact.data_url(preset)
+    data, mime_type = encode_image(image, preset)
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def to_blob(image, preset=None):
+    """編碼為 Gemini 使用的 {"mime_type", "data"} 內容塊"""
+    artifact = image.info.get(ARTIFACT_INFO_KEY)
+    if artifact is not None:
+        data, mime_type = artifact.encoded(preset)
+        return {"mime_type": mime_type, "data": data}
+    data, mime_type = encode_image(image, preset)
+    return {"mime_type": mime_type, "data": data.tobytes()}
+
+
+# ============ 基準測試 ============
+
+def benchmark(images, presets=None):
+    """對每種預設統計每頁平均字節數、base64 後字節數和編碼耗時"""
+    results = {}
+    for preset in presets or ENCODING_PRESETS:
+        total_bytes = 0
+        total_b64 = 0
+        started = time.perf_counter()
+        for image in images:
+            data, _ = encode_image(image, preset)
+            total_bytes += len(data)
+            total_b64 += len(base64.b64encode(data))
+        elapsed = time.perf_counter() - started
+        count = max(1, len(images))
+        results[preset] = {
+            "bytes_per_page": total_bytes / count,
+            "base64_bytes_per_page": total_b64 / count,
+            "ms_per_page": elapsed * 1000 / count,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python image_encoding.py resume.pdf [Gemini|OpenAI]")
+        sys.exit(1)
+
+    from pdf_pipeline import iter_page_images
+
+    provider = sys.argv[2] if len(sys.argv) > 2 else None
+    pages = list(iter_page_images(sys.argv[1], provider))
+    print(f"\n📄 {len(pages)} 頁，尺寸 {pages[0].size if pages else '-'}\n")
+
+    print(f"{'預設':<14}{'字節/頁':>12}{'base64/頁':>12}{'毫秒/頁':>10}")
+    for preset, result in benchmark(pages).items():
+        print(f"{preset:<14}{result['bytes_per_page']:>12,.0f}"
+              f"{result['base64_bytes_per_page']:>12,.0f}{result['ms_per_page']:>10.1f}")
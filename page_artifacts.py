@@ -0,0 +1,387 @@
+"""
+頁面產物
+每頁預處理後的圖片只渲染一次：記錄頁面哈希、尺寸，並按需編碼為各種格式（惰性、記憶化），
+在內存裡保留最近用過的頁面（只有編碼結果和元數據，按字節數限制），無損圖片在磁碟上保留一段時間；
+重試、對沖請求、章節補全以及換提供商或提示詞重新解析時直接取用，不再光柵化和編碼。
+
+產物掛在頁面圖片的 info["artifact"] 上隨圖片傳遞，
+image_encoding（編碼）和 replay_provider（頁面哈希）取用它記憶化的結果，不需要改變函數簽名
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from image_encoding import ARTIFACT_INFO_KEY, ENCODING_PRESETS, IMAGE_ENCODING, MIME_TYPES, encode_image
+from page_filter import COVERAGE_INFO_KEY, dhash_hex
+from parse_cache import file_digest
+
+# ============ 配置 ============
+
+ARTIFACT_DIR = os.environ.get("HOMEPAGE_ARTIFACT_DIR", ".page_artifacts")
+# 磁碟上的保留時間（秒），默認 1 天；設為 0 時只在內存裡保留
+ARTIFACT_TTL = int(os.environ.get("HOMEPAGE_ARTIFACT_TTL", str(24 * 3600)))
+# 磁碟總大小上限（字節），超出時淘汰最久未使用的頁面
+ARTIFACT_MAX_BYTES = int(os.environ.get("HOMEPAGE_ARTIFACT_MAX_BYTES", str(500 * 1024 * 1024)))
+# 內存裡保留的頁面數和編碼結果總字節數上限，超出時淘汰最久未使用的頁面
+ARTIFACT_MEMORY_PAGES = int(os.environ.get("HOMEPAGE_ARTIFACT_MEMORY_PAGES", "32"))
+ARTIFACT_MEMORY_BYTES = int(os.environ.get("HOMEPAGE_ARTIFACT_MEMORY_BYTES", str(32 * 1024 * 1024)))
+# 排隊等待寫入磁碟的任務數上限；寫入跟不上時丟棄新任務（只是少存一份），不讓待寫的圖片堆積在內存裡
+ARTIFACT_WRITE_QUEUE = int(os.environ.get("HOMEPAGE_ARTIFACT_WRITE_QUEUE", "16"))
+
+# 磁碟淘汰最多每隔這麼久掃描一次（秒）
+EVICT_INTERVAL = 60
+
+
+# ============ 鍵 ============
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def pdf_digest(pdf_file):
+    """PDF 內容的 SHA-256，按 (路徑, 大小, 修改時間) 記住，同一請求的各段不重複讀文件"""
+    stat = os.stat(pdf_file)
+    identity = (os.path.abspath(pdf_file), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(identity)
+    if digest is None:
+        digest = file_digest(pdf_file)
+        with _digests_lock:
+            if len(_digests) > 256:
+                _digests.clear()
+            _digests[identity] = digest
+    return digest
+
+
+def artifact_key(digest, number, dpi, profile):
+    """頁面產物的鍵：同一份 PDF 的同一頁、同樣的解析度和尺寸限制才能共用"""
+    limits = f"{profile['max_long']}x{profile['max_short']}" if profile else "-"
+    raw = f"{digest}\n{number}\n{dpi}\n{limits}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def artifact_of(image):
+    """圖片對應的頁面產物，沒有時返回 None"""
+    return image.info.get(ARTIFACT_INFO_KEY)
+
+
+# ============ 產物 ============
+
+class PageArtifact:
+    """一頁預處理後的圖片：尺寸、哈希和各格式的編碼結果都只計算一次
+
+    產物本身不持有解碼後的圖片（一頁幾 MB），只弱引用正在使用的那一份；
+    圖片用完被回收後，再次需要時從磁碟上的無損 PNG 讀取
+    """
+
+    def __init__(self, store, key, number, width, height, image=None, page_hash=None, coverage=1.0):
+        self.store = store
+        self.key = key
+        self.number = number
+        self.width = width
+        self.height = height
+        self.coverage = image.info.get(COVERAGE_INFO_KEY, coverage) if image is not None else coverage
+        self._image_ref = None
+        self._hash = page_hash
+        self._encoded = {}
+        self._lock = threading.Lock()
+        if image is not None:
+            self._attach(image)
+
+    def _attach(self, image):
+        image.info[ARTIFACT_INFO_KEY] = self
+        # 從磁碟讀回的 PNG 沒有裁剪信息，空白頁判斷要用到
+        image.info[COVERAGE_INFO_KEY] = self.coverage
+        self._image_ref = weakref.ref(image)
+
+    @property
+    def image(self):
+        """頁面圖片：仍在使用的直接取用，否則從磁碟讀取；都沒有時（未落盤或已淘汰）返回 None"""
+        with self._lock:
+            image = self._image_ref() if self._image_ref is not None else None
+            if image is not None:
+                return image
+            if not self.store.persistent:
+                return None
+            try:
+                image = Image.open(self.store.path(self.key, "png"))
+                image.load()
+            except OSError:
+                return None
+            self._attach(image)
+            return image
+
+    @property
+    def nbytes(self):
+        """內存裡的編碼結果總字節數"""
+        with self._lock:
+            return sum(len(data) for data, _ in self._encoded.values())
+
+    @property
+    def hash(self):
+        """頁面的 dHash（十六進制）"""
+        if self._hash is None:
+            self._hash = dhash_hex(self.image)
+        return self._hash
+
+    def encoded(self, preset=None):
+        """按預設編碼，返回 (bytes, mime_type)；依次查內存、磁碟，都沒有時才編碼"""
+        preset = preset or IMAGE_ENCODING
+        with self._lock:
+            cached = self._encoded.get(preset)
+        if cached is not None:
+            return cached
+
+        mime_type = MIME_TYPES[ENCODING_PRESETS[preset]["format"]]
+        data = self.store.read(self.key, preset)
+        if data is None:
+            view, mime_type = encode_image(self.image, preset)
+            data = view.tobytes()
+            self.store.write(self.key, preset, data)
+        with self._lock:
+            self._encoded[preset] = (data, mime_type)
+        self.store.resize(self)
+        return data, mime_type
+
+    def data_url(self, preset=None):
+        """OpenAI 使用的 data URL；每次從編碼結果生成，不另存一份 base64 副本"""
+        data, mime_type = self.encoded(preset)
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+    def meta(self):
+        return {"number": self.number, "width": self.width, "height": self.height, "hash": self.hash,
+                "coverage": self.coverage}
+
+
+# ============ 存儲 ============
+
+class ArtifactStore:
+    """內存 LRU + 磁碟目錄；磁碟寫入在後台執行緒進行，不阻塞解析
+
+    內存裡的產物只有編碼結果和元數據，圖片要從磁碟讀回，因此只在磁碟保留（ttl > 0）時才快取
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR, ttl=ARTIFACT_TTL, max_bytes=ARTIFACT_MAX_BYTES,
+                 memory_pages=ARTIFACT_MEMORY_PAGES, memory_bytes=ARTIFACT_MEMORY_BYTES,
+                 write_queue=ARTIFACT_WRITE_QUEUE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_pages = memory_pages
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+        self._memory = OrderedDict()
+        self._sizes = {}
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = threading.BoundedSemaphore(write_queue)
+        self._last_evict = 0.0
+
+    @property
+    def persistent(self):
+        return self.ttl > 0
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}.{suffix}")
+
+    def get(self, key):
+        """取得頁面產物，過期或不存在時返回 None"""
+        with self._lock:
+            artifact = self._memory.get(key)
+            if artifact is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return artifact
+
+        artifact = self._load(key)
+        with self._lock:
+            if artifact is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, artifact)
+        return artifact
+
+    def create(self, key, number, image):
+        """為剛渲染好的頁面建立產物"""
+        artifact = PageArtifact(self, key, number, image.width, image.height, image)
+        if self.persistent:
+            with self._lock:
+                self._remember(key, artifact)
+            self._submit(self._persist, artifact, image)
+        return artifact
+
+    def _remember(self, key, artifact):
+        self._forget(key)
+        self._memory[key] = artifact
+        self._sizes[key] = artifact.nbytes
+        self._used_bytes += self._sizes[key]
+        self._shrink()
+
+    def _forget(self, key):
+        if self._memory.pop(key, None) is not None:
+            self._used_bytes -= self._sizes.pop(key)
+
+    def _shrink(self):
+        while self._memory and (len(self._memory) > self.memory_pages or self._used_bytes > self.memory_bytes):
+            self._forget(next(iter(self._memory)))
+
+    def resize(self, artifact):
+        """產物新增了編碼結果；仍在內存裡時重新計算總字節數並按上限淘汰"""
+        with self._lock:
+            if self._memory.get(artifact.key) is not artifact:
+                return
+            size = artifact.nbytes
+            self._used_bytes += size - self._sizes[artifact.key]
+            self._sizes[artifact.key] = size
+            self._shrink()
+
+    def _submit(self, fn, *args):
+        """交給後台寫入；排隊的任務已滿時直接丟棄"""
+        if not self._pending.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1
+            return
+        try:
+            self._writer.submit(fn, *args).add_done_callback(lambda _: self._pending.release())
+        except RuntimeError:
+            # 解釋器退出時執行緒池已關閉
+            self._pending.release()
+
+    def _load(self, key):
+        if not self.persistent:
+            return None
+        path = self.path(key, "json")
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                self._remove_key(key)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            # 更新訪問時間，大小淘汰按最久未使用的順序
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return PageArtifact(self, key, meta["number"], meta["width"], meta["height"], page_hash=meta.get("hash"),
+                            coverage=meta.get("coverage", 1.0))
+
+    def read(self, key, preset):
+        if not self.persistent:
+            return None
+        try:
+            with open(self.path(key, preset), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write(self, key, preset, data):
+        if self.persistent:
+            self._submit(self._write_file, self.path(key, preset), data)
+
+    def _persist(self, artifact, image):
+        """保存無損的頁面圖片和元數據；元數據最後寫，讀到元數據時圖片一定已經完整"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self.path(artifact.key, "png.tmp")
+            image.save(tmp, format="PNG")
+            os.replace(tmp, self.path(artifact.key, "png"))
+            self._write_file(self.path(artifact.key, "json"), json.dumps(artifact.meta()).encode("utf-8"))
+        except Exception as e:
+            print(f"[頁面產物] 保存失敗: {e}")
+            return
+        self.evict()
+
+    def _write_file(self, path, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"[頁面產物] 寫入失敗: {e}")
+
+    def evict(self):
+        """刪除過期頁面，並在超出大小上限時按訪問時間淘汰（按頁面整組刪除）"""
+        now = time.time()
+        if now - self._last_evict < EVICT_INTERVAL:
+            return
+        self._last_evict = now
+        groups = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            key = name.split(".", 1)[0]
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            accessed, size = groups.get(key, (0.0, 0))
+            accessed = stat.st_mtime if name.endswith(".json") else accessed
+            groups[key] = (accessed, size + stat.st_size)
+
+        entries = sorted((accessed, size, key) for key, (accessed, size) in groups.items())
+        total = sum(size for _, size, _ in entries)
+        for accessed, size, key in entries:
+            if now - accessed > self.ttl or total > self.max_bytes:
+                self._remove_key(key)
+                total -= size
+
+    def _remove_key(self, key):
+        for suffix in ["json", "png"] + list(ENCODING_PRESETS):
+            try:
+                os.remove(self.path(key, suffix))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_pages": len(self._memory),
+                    "memory_bytes": self._used_bytes, "dropped": self.dropped}
+
+
+# 全進程共用的頁面產物
+artifact_store = ArtifactStore()
+
+
+# ============ 取用 ============
+
+def iter_artifact_images(keys, render):
+    """按順序產出頁面圖片：已有產物的直接取用，其餘的只渲染缺少的頁面
+
+    keys 為 [(頁碼, 產物鍵)]；render(頁碼列表) 返回這些頁預處理後的圖片迭代器。
+    """
+    artifacts = {number: artifact_store.get(key) for number, key in keys}
+    missing = [number for number, _ in keys if artifacts[number] is None]
+    rendered = iter(render(missing)) if missing else iter(())
+    for number, key in keys:
+        artifact = artifacts[number]
+        if artifact is None:
+            image = next(rendered, None)
+            if image is None:
+                # 超出頁數的頁碼不會被渲染（頁碼有序，只可能在末尾）
+                return
+            artifact_store.create(key, number, image)
+            yield image
+            continue
+        image = artifact.image
+        if image is None:
+            # 圖片還沒落盤（寫入被丟棄或仍在排隊）且已被回收，單獨重新渲染這一頁
+            image = next(iter(render([number])), None)
+            if image is None:
+                return
+            artifact_store.create(key, number, image)
+        yield image
@@ -0,0 +1,118 @@
+"""
+頁面過濾
+在上傳前去掉空白頁（分隔頁）和近似重複頁（附錄中重複的頁面），
+減少送到 Gemini / OpenAI 的圖片數量
+"""
+
+import os
+
+import numpy as np
+
+# ============ 配置 ============
+
+# 是否啟用頁面過濾
+PAGE_FILTER_ENABLED = os.environ.get("HOMEPAGE_PAGE_FILTER", "1") != "0"
+# 亮度低於此值的像素算作墨跡
+INK_THRESHOLD = 200
+# 墨跡像素佔比低於此值視為空白頁
+BLANK_INK_RATIO = 0.002
+# 差異哈希的邊長（HASH_SIZE² 位）
+HASH_SIZE = 16
+# 哈希漢明距離不超過此值才進一步比較縮略圖
+DUPLICATE_MAX_DISTANCE = 8
+# 縮略圖平均灰度差（0–255）不超過此值視為重複頁
+DUPLICATE_MAX_DIFF = 3.0
+THUMBNAIL_SIZE = 64
+
+# 裁掉邊距後的圖片在 info 裡記錄保留部分佔原頁面的面積比例；
+# 墨跡佔比按原頁面計算，只剩頁腳頁碼的空白頁裁剪後不會因為面積變小而顯得「有內容」
+COVERAGE_INFO_KEY = "page_coverage"
+
+
+# ============ 特徵 ============
+
+def ink_ratio(gray):
+    """墨跡像素佔比"""
+    return float((gray < INK_THRESHOLD).mean())
+
+
+def difference_hash(image):
+    """差異哈希（dHash）：相鄰像素的明暗關係，返回布爾數組"""
+    small = np.asarray(image.resize((HASH_SIZE + 1, HASH_SIZE)), dtype=np.int16)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def dhash_hex(image):
+    """dHash 的十六進制表示，用作頁面哈希（與解析度和編碼無關）"""
+    bits = difference_hash(image.convert("L"))
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):0{len(bits) // 4}x}"
+
+
+def page_signature(image):
+    """頁面的比較特徵：墨跡佔比（相對原頁面）、dHash、縮略圖、寬高比"""
+    gray_image = image.convert("L")
+    gray = np.asarray(gray_image)
+    return {
+        "ink": ink_ratio(gray) * image.info.get(COVERAGE_INFO_KEY, 1.0),
+        "hash": difference_hash(gray_image),
+        "thumbnail": np.asarray(gray_image.resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE)), dtype=np.float32),
+        "aspect": image.width / image.height,
+    }
+
+
+def is_near_duplicate(a, b):
+    """兩頁是否近似重複：先比哈希，再確認縮略圖差異"""
+    if abs(a["aspect"] - b["aspect"]) > 0.05 * b["aspect"]:
+        return False
+    if int(np.count_nonzero(a["hash"] != b["hash"])) > DUPLICATE_MAX_DISTANCE:
+        return False
+    return float(np.abs(a["thumbnail"] - b["thumbnail"]).mean()) <= DUPLICATE_MAX_DIFF
+
+
+# ============ 過濾 ============
+
+def filter_pages(images, report=None, page_numbers=None):
+    """逐頁過濾空白頁和近似重複頁（生成器，保持流式）
+
+    report 傳入列表時，每去掉一頁追加一條
+    {"page": 頁碼, "reason": "blank" 或 "duplicate", "duplicate_of": 頁碼}。
+    page_numbers 為圖片對應的原始頁碼，默認從 1 開始編號。
+    """
+    if not PAGE_FILTER_ENABLED:
+        yield from images
+        return
+
+    numbers = iter(page_numbers) if page_numbers is not None else None
+    kept = []
+
+    for index, image in enumerate(images, 1):
+        number = next(numbers, index) if numbers is not None else index
+        signature = page_signature(image)
+
+        if signature["ink"] < BLANK_INK_RATIO:
+            if report is not None:
+                report.append({"page": number, "reason": "blank"})
+            continue
+
+        original = next((n for n, s in kept if is_near_duplicate(signature, s)), None)
+        if original is not None:
+            if report is not None:
+                report.append({"page": number, "reason": "duplicate", "duplicate_of": original})
+            continue
+
+        kept.append((number, signature))
+        yield image
+
+
+def describe_removed(report):
+    """把過濾記錄整理成狀態欄文字"""
+    if not report:
+        return ""
+    blank = [str(r["page"]) for r in report if r["reason"] == "blank"]
+    duplicate = [f"{r['page']}（同第 {r['duplicate_of']} 頁）" for r in report if r["reason"] == "duplicate"]
+    parts = []
+    if blank:
+        parts.append(f"空白頁 {', '.join(blank)}")
+    if duplicate:
+        parts.append(f"重複頁 {', '.join(duplicate)}")
+    return "，已略過" + "；".join(parts)
@@ -0,0 +1,175 @@
+"""
+解析結果快取
+以 PDF 內容哈希 + 提供商 + 模型 + 提示詞版本 + 管線設置為鍵，把解析出的 JSON 存到磁碟；
+同一份簡歷重新上傳（換模板、界面出錯後重試）時不再調用視覺模型
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# ============ 配置 ============
+
+PARSE_CACHE_DIR = os.environ.get("HOMEPAGE_PARSE_CACHE_DIR", ".parse_cache")
+# 條目有效期（秒），默認 7 天；設為 0 時關閉快取
+PARSE_CACHE_TTL = int(os.environ.get("HOMEPAGE_PARSE_CACHE_TTL", str(7 * 24 * 3600)))
+# 快取目錄總大小上限（字節），超出時淘汰最久未使用的條目
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("HOMEPAGE_PARSE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# 淘汰最多每隔這麼久掃描一次目錄（秒）
+EVICT_INTERVAL = 60
+
+
+# ============ 鍵 ============
+
+def file_digest(path):
+    """文件內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prompt_version(prompt):
+    """提示詞的短哈希，提示詞一改舊快取自動失效"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(pdf_digest, provider, model, version, settings=""):
+    """組合快取鍵；settings 為影響解析結果的管線設置（圖片編碼、文字層等）"""
+    raw = "\n".join([pdf_digest, provider, model or "", version, settings])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ============ 快取 ============
+
+class ParseCache:
+    """磁碟上的 JSON 快取，按 TTL 和總大小淘汰，並統計命中率"""
+
+    def __init__(self, directory=PARSE_CACHE_DIR, ttl=PARSE_CACHE_TTL, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """讀取快取，過期或不存在時返回 None"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is None or time.time() - entry.get("created", 0) > self.ttl:
+            if entry is not None:
+                self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 更新訪問時間，大小淘汰按最久未使用的順序
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry["data"]
+
+    def put(self, key, data):
+        """寫入快取（先寫臨時文件再替換，並發寫入不會讀到半個文件）
+
+        磁碟錯誤（滿了、沒有權限）只記日誌：解析已經成功，寫不進快取不應該讓這次請求失敗
+        """
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError as e:
+            print(f"[快取] 寫入失敗: {e}")
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "data": data}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            self._remove(tmp_path)
+            print(f"[快取] 寫入失敗: {e}")
+            return
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """刪除過期條目，並在超出大小上限時按訪問時間淘汰（最多每 EVICT_INTERVAL 秒掃描一次）"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_evict < EVICT_INTERVAL:
+                return
+            self._last_evict = now
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for accessed, size, path in entries:
+            # 未被訪問的時間超過 TTL，創建時間必然也超過了
+            if now - accessed > self.ttl or total > self.max_bytes:
+                self._remove(path)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+
+    def stats(self):
+        """命中 / 未命中 / 淘汰次數"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# 全進程共用的快取
+parse_cache = ParseCache()
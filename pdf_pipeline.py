@@ -0,0 +1,376 @@
+"""
+PDF 處理管線
+逐頁流式光柵化：下游可以在第 1 頁渲染完成後立即開始編碼和上傳，
+同時駐留記憶體的頁數受 max_in_flight 限制；
+長文檔可把頁碼範圍分片交給全進程共享的進程池並行渲染；
+有文字層的頁面（LaTeX / Word 導出）直接讀取文字，只有掃描頁才需要渲染；
+渲染解析度按提供商實際使用的圖片尺寸和每個請求的像素預算選擇，並裁掉空白邊距；
+預處理後的頁面存為頁面產物（page_artifacts），同樣的頁面不會渲染第二次
+"""
+
+import collections
+import math
+import multiprocessing
+import os
+import queue
+import re
+import subprocess
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import ImageOps
+
+from page_artifacts import artifact_key, iter_artifact_images, pdf_digest
+from page_filter import COVERAGE_INFO_KEY
+
+# ============ 配置 ============
+
+RASTER_DPI = 150
+# 已渲染但尚未被下游取走的最大頁數（含正在渲染的頁）
+RASTER_MAX_IN_FLIGHT = int(os.environ.get("HOMEPAGE_RASTER_MAX_IN_FLIGHT", "2"))
+# 並行渲染的進程數（所有請求共用），設為 0 或 1 時關閉並行模式
+RASTER_WORKERS = int(os.environ.get("HOMEPAGE_RASTER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 每個進程池任務渲染的頁數（每個任務啟動一次 pdftoppm）
+RASTER_PAGES_PER_TASK = int(os.environ.get("HOMEPAGE_RASTER_PAGES_PER_TASK", "2"))
+
+# 是否啟用文字層快速路徑（設為 0 時所有頁面都走圖片解析）
+TEXT_LAYER_ENABLED = os.environ.get("HOMEPAGE_TEXT_LAYER", "1") != "0"
+# 一頁至少要有這麼多可見字符才算有文字層，否則視為掃描頁
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("HOMEPAGE_TEXT_LAYER_MIN_CHARS", "80"))
+# 可讀字符佔比下限，用來排除字體編碼缺失導致的亂碼文字層
+TEXT_LAYER_MIN_READABLE = 0.95
+
+# 每個請求所有頁面合計的像素預算
+PAGE_PIXEL_BUDGET = int(os.environ.get("HOMEPAGE_PAGE_PIXEL_BUDGET", str(20_000_000)))
+# 解析度下限，低於此值小字號會無法辨認，即使超出預算也不再降低
+RASTER_MIN_DPI = 90
+# 亮度高於此值的像素視為空白（用於裁邊）
+BLANK_THRESHOLD = 245
+# 裁邊後保留的留白（佔原圖短邊的比例）
+CROP_PADDING = 0.01
+
+# 提供商實際使用的圖片尺寸：超過的部分會被服務端縮小，上傳只是浪費
+# max_long / max_short 分別限制長邊和短邊的像素數
+IMAGE_PROFILES = {
+    # GPT-4o (detail=high) 先縮到 2048 以內，再把短邊縮到 768
+    ("OpenAI", "gpt-4o"): {"max_long": 2048, "max_short": 768},
+    # Gemini 按 768×768 分塊計費，長邊 1536 內一頁最多 2×2 塊
+    ("Gemini", "gemini-2.0-flash-exp"): {"max_long": 1536, "max_short": 1536},
+}
+DEFAULT_IMAGE_PROFILES = {
+    "OpenAI": IMAGE_PROFILES[("OpenAI", "gpt-4o")],
+    "Gemini": IMAGE_PROFILES[("Gemini", "gemini-2.0-flash-exp")],
+}
+# 離線回放按哪個提供商的尺寸渲染頁面，壓測時與實際部署的光柵化和編碼開銷一致
+DEFAULT_IMAGE_PROFILES["Replay"] = DEFAULT_IMAGE_PROFILES[os.environ.get("HOMEPAGE_REPLAY_PROFILE", "Gemini")]
+
+# 解析路徑的顯示名稱
+PATH_LABELS = {
+    "text": "文字層快速路徑",
+    "hybrid": "文字層 + 掃描頁圖片",
+    "vision": "圖片解析",
+}
+
+_DONE = object()
+
+_raster_pool = None
+_raster_pool_lock = threading.Lock()
+# 所有請求合計最多同時提交 RASTER_WORKERS 個任務，避免單個長文檔佔滿隊列
+_raster_slots = threading.BoundedSemaphore(max(1, RASTER_WORKERS))
+
+
+# ============ 流式光柵化 ============
+
+def get_page_count(pdf_file):
+    """讀取 PDF 頁數（只調用 pdfinfo，不渲染）"""
+    return int(pdfinfo_from_path(pdf_file)["Pages"])
+
+
+def get_raster_pool():
+    """取得全進程共享的光柵化進程池（首次調用時創建）"""
+    global _raster_pool
+    with _raster_pool_lock:
+        if _raster_pool is None:
+            # 用 spawn 啟動子進程：Gradio / asyncio 進程裡有很多執行緒（事件循環、執行緒池、鎖），
+            # fork 會把持有中的鎖一起複製到子進程，可能死鎖
+            _raster_pool = ProcessPoolExecutor(max_workers=RASTER_WORKERS,
+                                               mp_context=multiprocessing.get_context("spawn"))
+        return _raster_pool
+
+
+def get_page_size(pdf_file):
+    """讀取第一頁尺寸（單位：pt），讀不到時按 A4 計算"""
+    match = re.match(r"\s*([\d.]+)\s*x\s*([\d.]+)", str(pdfinfo_from_path(pdf_file).get("Page size", "")))
+    if not match:
+        return 595.0, 842.0
+    return float(match.group(1)), float(match.group(2))
+
+
+def iter_pdf_pages(pdf_file, dpi=RASTER_DPI, max_in_flight=None,
+                   page_numbers=None, parallel=None):
+    """按頁碼順序逐頁產出 PIL 圖片
+
+    頁數在調用時立即讀取，損壞的 PDF 會在這裡直接拋錯。
+    page_numbers 為要渲染的頁碼（從 1 開始），默認全部頁。
+    parallel 為 None 時自動選擇：啟用了進程池且頁數超過一個任務時並行渲染。
+    max_in_flight 默認串行為 RASTER_MAX_IN_FLIGHT，並行為 進程數 × 每任務頁數。
+    """
+    page_count = get_page_count(pdf_file)
+    if page_numbers is None:
+        page_numbers = range(1, page_count + 1)
+    page_numbers = sorted(n for n in set(page_numbers) if 1 <= n <= page_count)
+
+    if parallel is None:
+        parallel = RASTER_WORKERS > 1 and len(page_numbers) > RASTER_PAGES_PER_TASK
+
+    if parallel:
+        if max_in_flight is None:
+            max_in_flight = max(1, RASTER_WORKERS) * RASTER_PAGES_PER_TASK
+        return _stream_pages_parallel(pdf_file, dpi, max(1, max_in_flight), page_numbers)
+
+    if max_in_flight is None:
+        max_in_flight = RASTER_MAX_IN_FLIGHT
+    return _stream_pages(pdf_file, dpi, max(1, max_in_flight), page_numbers)
+
+
+def _page_runs(page_numbers, max_length):
+    """把有序頁碼切成連續區間 (first, last)，每段不超過 max_length 頁"""
+    runs = []
+    for number in page_numbers:
+        if runs and number == runs[-1][1] + 1 and number - runs[-1][0] < max_length:
+            runs[-1] = (runs[-1][0], number)
+        else:
+            runs.append((number, number))
+    return runs
+
+
+def _stream_pages(pdf_file, dpi, max_in_flight, page_numbers):
+    slots = threading.Semaphore(max_in_flight)
+    pages = queue.Queue()
+    stop = threading.Event()
+
+    def render():
+        try:
+            for page_number in page_numbers:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                images = convert_from_path(pdf_file, dpi=dpi,
+                                           first_page=page_number, last_page=page_number)
+                if stop.is_set():
+                    return
+                pages.put(images[0])
+            pages.put(_DONE)
+        except Exception as e:
+            pages.put(e)
+
+    worker = threading.Thread(target=render, name="pdf-rasterizer", daemon=True)
+    worker.start()
+
+    try:
+        while True:
+            item = pages.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise Exception(f"PDF 轉換失敗: {str(item)}")
+            yield item
+            # 下游已處理完上一頁，釋放一個渲染名額
+            del item
+            slots.release()
+    finally:
+        stop.set()
+        slots.release(max_in_flight)
+
+
+def _render_page_range(pdf_file, dpi, first_page, last_page):
+    """進程池任務：渲染一段連續頁碼"""
+    return convert_from_path(pdf_file, dpi=dpi, first_page=first_page, last_page=last_page)
+
+
+def _stream_pages_parallel(pdf_file, dpi, max_in_flight, page_numbers):
+    pool = get_raster_pool()
+    ranges = collections.deque(_page_runs(page_numbers, max(1, RASTER_PAGES_PER_TASK)))
+    pending = collections.deque()
+    in_flight = 0
+
+    try:
+        while ranges or pending:
+            # 在頁數上限內盡量多提交；至少保證有一個任務在跑
+            while ranges and (not pending or in_flight + ranges[0][1] - ranges[0][0] + 1 <= max_in_flight):
+                start, end = ranges.popleft()
+                _raster_slots.acquire()
+                try:
+                    future = pool.submit(_render_page_range, pdf_file, dpi, start, end)
+                except Exception:
+                    _raster_slots.release()
+                    raise
+                future.add_done_callback(lambda _: _raster_slots.release())
+                pending.append(future)
+                in_flight += end - start + 1
+
+            try:
+                images = pending.popleft().result()
+            except Exception as e:
+                raise Exception(f"PDF 轉換失敗: {str(e)}")
+
+            while images:
+                image = images.pop(0)
+                yield image
+                del image
+                in_flight -= 1
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# ============ 文字層檢測 ============
+
+def extract_page_texts(pdf_file, page_count):
+    """用 pdftotext -layout 讀取每頁的嵌入文字（保留版面）"""
+    result = subprocess.run(
+        ["pdftotext", "-layout", "-enc", "UTF-8", pdf_file, "-"],
+        capture_output=True, timeout=60, check=True,
+    )
+    # pdftotext 在每頁末尾輸出換頁符
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    return pages[:page_count]
+
+
+def is_text_layer_usable(text):
+    """判斷一頁的文字層是否足以代替圖片"""
+    visible = [c for c in text if not c.isspace()]
+    if len(visible) < TEXT_LAYER_MIN_CHARS:
+        return False
+    garbled = sum(
+        1 for c in visible
+        if c == "\ufffd" or unicodedata.category(c) in ("Cc", "Co", "Cn", "Cs")
+    )
+    return 1 - garbled / len(visible) >= TEXT_LAYER_MIN_READABLE
+
+
+def plan_pages(pdf_file):
+    """決定每頁走文字層還是圖片
+
+    返回 {"path", "page_count", "page_texts": [(頁碼, 文字)], "scanned_pages": [頁碼]}；
+    讀取文字層失敗時所有頁面都回退到圖片解析。
+    """
+    page_count = get_page_count(pdf_file)
+    texts = []
+    if TEXT_LAYER_ENABLED:
+        try:
+            texts = extract_page_texts(pdf_file, page_count)
+        except Exception:
+            texts = []
+
+    page_texts = []
+    scanned_pages = []
+    for number in range(1, page_count + 1):
+        text = texts[number - 1] if number <= len(texts) else ""
+        if is_text_layer_usable(text):
+            page_texts.append((number, text.strip("\n")))
+        else:
+            scanned_pages.append(number)
+
+    if not scanned_pages:
+        path = "text"
+    elif page_texts:
+        path = "hybrid"
+    else:
+        path = "vision"
+
+    return {
+        "path": path,
+        "page_count": page_count,
+        "page_texts": page_texts,
+        "scanned_pages": scanned_pages,
+    }
+
+
+def format_page_texts(page_texts):
+    """把文字層內容整理成附在提示詞後面的文本"""
+    blocks = [f"=== 第 {number} 頁 ===\n{text}" for number, text in page_texts]
+    return "以下是從 PDF 文字層提取的簡歷內容（保留原始版面），其餘頁面（如有）以圖片附上：\n\n" + "\n\n".join(blocks)
+
+
+# ============ 頁面預處理 ============
+
+def get_image_profile(provider, model=None):
+    """取得提供商 / 模型的圖片尺寸限制"""
+    return IMAGE_PROFILES.get((provider, model)) or DEFAULT_IMAGE_PROFILES.get(provider)
+
+
+def choose_dpi(page_size, page_count, profile=None, pixel_budget=PAGE_PIXEL_BUDGET):
+    """根據提供商限制和像素預算選擇渲染解析度
+
+    取三者中最小的：RASTER_DPI、提供商會保留的最大尺寸、預算平均到每頁的面積；
+    結果不低於 RASTER_MIN_DPI。
+    """
+    width_pt, height_pt = page_size
+    long_pt, short_pt = max(width_pt, height_pt), min(width_pt, height_pt)
+
+    dpi = RASTER_DPI
+    if profile:
+        dpi = min(dpi, profile["max_long"] / long_pt * 72, profile["max_short"] / short_pt * 72)
+    if pixel_budget and page_count:
+        per_page = pixel_budget / page_count
+        dpi = min(dpi, math.sqrt(per_page / (width_pt * height_pt)) * 72)
+    return max(RASTER_MIN_DPI, int(dpi))
+
+
+def crop_margins(image):
+    """裁掉頁面四周的空白邊距，保留少量留白；保留部分佔原頁面的比例記在 info 裡（縮放時隨圖片複製）"""
+    gray = image.convert("L")
+    bbox = ImageOps.invert(gray).point(lambda v: 255 if v > 255 - BLANK_THRESHOLD else 0).getbbox()
+    if not bbox:
+        return image
+    pad = int(min(image.size) * CROP_PADDING)
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - pad), max(0, top - pad),
+            min(image.width, right + pad), min(image.height, bottom + pad))
+    if bbox == (0, 0, image.width, image.height):
+        return image
+    cropped = image.crop(bbox)
+    cropped.info[COVERAGE_INFO_KEY] = cropped.width * cropped.height / (image.width * image.height)
+    return cropped
+
+
+def fit_to_profile(image, profile):
+    """按提供商限制等比縮小（不放大）"""
+    if not profile:
+        return image
+    long_side, short_side = max(image.size), min(image.size)
+    scale = min(1.0, profile["max_long"] / long_side, profile["max_short"] / short_side)
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size)
+
+
+def iter_page_images(pdf_file, provider=None, model=None, page_numbers=None,
+                     pixel_budget=PAGE_PIXEL_BUDGET, max_dpi=None, page_count=None):
+    """預處理後的頁面圖片：按提供商選擇解析度、裁掉空白邊距、限制最終尺寸
+
+    max_dpi 用於快速草稿，可以低於 RASTER_MIN_DPI。
+    page_count 為整個請求要渲染的頁數，像素預算按它平均到每頁；
+    分段解析時各段只渲染其中一部分頁面，但預算仍是整個請求的（各段解析度也因此一致）。
+    默認為 page_numbers 的頁數，沒有 page_numbers 時為文檔總頁數。
+    """
+    profile = get_image_profile(provider, model)
+    if page_count is None:
+        page_count = len(page_numbers) if page_numbers is not None else get_page_count(pdf_file)
+    dpi = choose_dpi(get_page_size(pdf_file), page_count, profile, pixel_budget)
+    if max_dpi:
+        dpi = min(dpi, max_dpi)
+
+    def render(numbers):
+        pages = iter_pdf_pages(pdf_file, dpi=dpi, page_numbers=numbers)
+        return (fit_to_profile(crop_margins(page), profile) for page in pages)
+
+    # 已經渲染過的頁面（同一份 PDF、同樣的解析度和尺寸限制）直接取用頁面產物
+    digest = pdf_digest(pdf_file)
+    numbers = sorted(set(page_numbers)) if page_numbers is not None else range(1, page_count + 1)
+    keys = [(number, artifact_key(digest, number, dpi, profile)) for number in numbers if number >= 1]
+    return iter_artifact_images(keys, render)
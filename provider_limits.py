@@ -0,0 +1,158 @@
+"""
+提供商調用的重試與限流
+429 / 5xx / 連接錯誤按帶抖動的指數退避重試，並遵守 Retry-After；
+同一進程內所有會話共用按 (提供商, API Key) 劃分的令牌桶，把突發請求攤平
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import os
+import random
+import threading
+import time
+
+import httpx
+from openai import APIConnectionError
+
+# ============ 配置 ============
+
+# 單次調用最多嘗試的次數（含第一次）
+RETRY_MAX_ATTEMPTS = int(os.environ.get("HOMEPAGE_RETRY_MAX_ATTEMPTS", "4"))
+# 退避基數和上限（秒）
+RETRY_BASE_DELAY = float(os.environ.get("HOMEPAGE_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.environ.get("HOMEPAGE_RETRY_MAX_DELAY", "30.0"))
+
+
+def _rate_limit(provider, default):
+    """讀取 "請求數/秒數" 格式的限流配置，例如 HOMEPAGE_RATE_LIMIT_GEMINI=15/60"""
+    value = os.environ.get(f"HOMEPAGE_RATE_LIMIT_{provider.upper()}", default)
+    count, period = value.split("/")
+    return int(count), float(period)
+
+
+# 每個 API Key 的速率：(請求數, 秒數)
+RATE_LIMITS = {
+    "Gemini": _rate_limit("Gemini", "15/60"),
+    "OpenAI": _rate_limit("OpenAI", "60/60"),
+    # 離線回放默認幾乎不限流，壓測時測的是本地吞吐量
+    "Replay": _rate_limit("Replay", "1000/1"),
+}
+# 令牌桶容量：允許不等待直接發出的突發請求數
+RATE_LIMIT_BURST = int(os.environ.get("HOMEPAGE_RATE_LIMIT_BURST", "3"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+# ============ 令牌桶 ============
+
+class TokenBucket:
+    """令牌桶：每 1/rate 秒補充一個令牌，最多存 capacity 個"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """預訂一個令牌，返回需要等待的秒數
+
+        令牌可以透支：排隊的請求依次預訂未來的令牌，
+        等待時間按到達順序遞增，不會在同一時刻一起醒來。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider, api_key):
+    """該提供商 / Key 共用的令牌桶"""
+    key = (provider, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            count, period = RATE_LIMITS.get(provider, (60, 60.0))
+            bucket = _buckets[key] = TokenBucket(count / period, RATE_LIMIT_BURST)
+        return bucket
+
+
+# ============ 重試 ============
+
+def _status_code(exc):
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(exc, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(exc):
+    """429、5xx、超時和連接錯誤可以重試；其他錯誤（Key 無效、請求格式錯誤）直接失敗"""
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(exc, (APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def retry_after(exc):
+    """從響應頭讀取服務端要求的等待秒數，沒有時返回 None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, exc=None):
+    """第 attempt 次失敗後的等待時間：全抖動指數退避，且不少於 Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    server_delay = retry_after(exc) if exc is not None else None
+    if server_delay is not None:
+        delay = max(delay, min(server_delay, RETRY_MAX_DELAY))
+    return delay
+
+
+async def call_with_retry_async(provider, api_key, request):
+    """限流後調用 request()，可重試的錯誤按退避重試
+
+    request() 返回協程，每次重試都會重新調用，應當只發送已經編碼好的請求體。
+    """
+    bucket = get_bucket(provider, api_key)
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        await bucket.acquire_async()
+        try:
+            return await request()
+        except Exception as e:
+            if attempt == RETRY_MAX_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, e))
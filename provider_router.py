@@ -0,0 +1,110 @@
+"""
+提供商自動選擇
+按提供商記錄延遲和錯誤率的指數加權移動平均（EWMA），
+「自動」模式優先使用最快且健康的提供商；可選地在延遲一段時間後向第二個提供商發出對沖請求
+"""
+
+import os
+import re
+import threading
+import time
+
+# ============ 配置 ============
+
+AUTO_PROVIDER = "自動"
+
+# EWMA 平滑係數：越大越看重最近的請求
+ROUTER_EWMA_ALPHA = float(os.environ.get("HOMEPAGE_ROUTER_EWMA_ALPHA", "0.3"))
+# 錯誤率超過此值視為不健康
+ROUTER_ERROR_THRESHOLD = float(os.environ.get("HOMEPAGE_ROUTER_ERROR_THRESHOLD", "0.5"))
+# 不健康的提供商多久之後重新試探（秒）
+ROUTER_PROBE_INTERVAL = float(os.environ.get("HOMEPAGE_ROUTER_PROBE_INTERVAL", "60"))
+# 對沖延遲（秒）：首選提供商這麼久還沒返回就同時請求第二個；不設置則不對沖
+HEDGE_DELAY = float(os.environ["HOMEPAGE_HEDGE_DELAY"]) if os.environ.get("HOMEPAGE_HEDGE_DELAY") else None
+
+
+# ============ 統計 ============
+
+class ProviderStats:
+    """單個提供商的延遲和錯誤率 EWMA"""
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.last_failure = 0.0
+
+    def record(self, seconds, ok, alpha):
+        self.samples += 1
+        self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+        else:
+            self.last_failure = time.monotonic()
+
+    def observe_latency(self, seconds, alpha):
+        """被取消的對沖請求：只知道延遲不少於 seconds，按此更新延遲，不影響錯誤率"""
+        if self.latency is None or seconds > self.latency:
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+
+    def healthy(self):
+        if self.error_rate < ROUTER_ERROR_THRESHOLD:
+            return True
+        # 長時間沒有新失敗時放行一次試探，否則不健康的提供商永遠不會恢復
+        return time.monotonic() - self.last_failure > ROUTER_PROBE_INTERVAL
+
+
+class ProviderRouter:
+    """全進程共用的提供商統計和排序"""
+
+    def __init__(self, alpha=ROUTER_EWMA_ALPHA):
+        self.alpha = alpha
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider, seconds, ok):
+        with self._lock:
+            self._stats.setdefault(provider, ProviderStats()).record(seconds, ok, self.alpha)
+
+    def record_cancelled(self, provider, seconds):
+        with self._lock:
+            self._stats.setdefault(provider, ProviderStats()).observe_latency(seconds, self.alpha)
+
+    def rank(self, providers):
+        """健康的在前，再按延遲從低到高；還沒有數據的提供商排在最前面以便採樣"""
+        with self._lock:
+            def order(item):
+                position, provider = item
+                stats = self._stats.get(provider)
+                if stats is None or stats.latency is None:
+                    return (0 if stats is None or stats.healthy() else 1, 0.0, position)
+                return (0 if stats.healthy() else 1, stats.latency, position)
+
+            return [provider for _, provider in sorted(enumerate(providers), key=order)]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                provider: {"latency": stats.latency, "error_rate": stats.error_rate, "samples": stats.samples}
+                for provider, stats in self._stats.items()
+            }
+
+
+router = ProviderRouter()
+
+
+# ============ API Key ============
+
+def split_api_keys(text):
+    """從輸入框中識別各提供商的 Key（逗號、空白或換行分隔）
+
+    OpenAI 的 Key 以 sk- 開頭，Gemini 的以 AIza 開頭；
+    只使用用戶自己填寫的 Key，不讀取服務器環境變量，否則公開部署的應用會用運營者的 Key 為任何人付費。
+    """
+    keys = {}
+    for token in re.split(r"[\s,;]+", text or ""):
+        if token.startswith("sk-"):
+            keys.setdefault("OpenAI", token)
+        elif token.startswith("AIza"):
+            keys.setdefault("Gemini", token)
+    return keys
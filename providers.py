@@ -0,0 +1,307 @@
+"""
+AI 提供商調用層
+Gemini / OpenAI 的請求構造、異步與流式調用和 JSON 解析；
+各應用的 parse_with_* 只提供自己的模型和提示詞。
+客戶端從 client_pool 按 Key 取用，不修改任何全局配置；
+請求體只編碼一次，限流和重試（provider_limits）都重用它；
+兩個提供商都按 cv_schema 的結構化輸出生成，解析失敗時先在本地修復（tolerant_json）；
+Replay 是不連網的回放提供商（replay_provider），錄製模式下真實響應會按頁面哈希保存下來；
+圖片字節數、token 用量和各階段耗時記到當前請求的 usage_meter 上
+"""
+
+import asyncio
+import os
+import weakref
+
+from google.genai import types
+
+from client_pool import client_pool
+from cv_schema import gemini_response_schema, openai_response_format
+from image_encoding import to_blob, to_data_url
+from provider_limits import call_with_retry_async
+from pdf_pipeline import format_page_texts
+from replay_provider import REPLAY_CHUNK_DELAY, REPLAY_PROVIDER
+import replay_provider
+import tolerant_json
+import usage_meter
+
+# ============ 配置 ============
+
+# 單個進程內同時進行的異步提供商請求上限
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get("HOMEPAGE_PROVIDER_CONCURRENCY", "16"))
+# 使用提供商的結構化輸出（JSON Schema 約束）
+STRUCTURED_OUTPUT = os.environ.get("HOMEPAGE_STRUCTURED_OUTPUT", "1") != "0"
+
+# 每個事件循環一個信號量（asyncio 原語不能跨循環使用）
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def provider_semaphore():
+    """當前事件循環的並發信號量"""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(PROVIDER_MAX_CONCURRENCY)
+    return semaphore
+
+
+# ============ 請求與響應 ============
+
+def parse_json_text(text):
+    """解析模型返回的 JSON；不標準時（代碼塊、單引號、尾隨逗號、截斷…）在本地修復"""
+    return tolerant_json.loads(text)
+
+
+def gemini_config():
+    """Gemini 的生成配置：要求輸出符合簡歷結構的 JSON"""
+    if not STRUCTURED_OUTPUT:
+        return None
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=gemini_response_schema(),
+    )
+
+
+def gemini_contents(prompt, images, page_texts=None):
+    """Gemini 的內容列表：提示詞、文字層頁面、逐頁編碼的圖片"""
+    contents = [prompt]
+    if page_texts:
+        contents.append(format_page_texts(page_texts))
+    for blob in usage_meter.encode_pages(images, to_blob, lambda blob: len(blob["data"])):
+        contents.append(types.Part.from_bytes(data=blob["data"], mime_type=blob["mime_type"]))
+    return contents
+
+
+def openai_messages(prompt, images, page_texts=None):
+    """OpenAI 的消息列表：提示詞、文字層頁面、逐頁編碼的 data URL"""
+    content = [{"type": "text", "text": prompt}]
+    if page_texts:
+        content.append({"type": "text", "text": format_page_texts(page_texts)})
+    for url in usage_meter.encode_pages(images, to_data_url):
+        content.append({"type": "image_url", "image_url": {"url": url}})
+    return [{"role": "user", "content": content}]
+
+
+def _openai_options(max_tokens, temperature):
+    options = {"max_tokens": max_tokens}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if STRUCTURED_OUTPUT:
+        options["response_format"] = openai_response_format()
+    return options
+
+
+def _gemini_usage(model, response):
+    metadata = getattr(response, "usage_metadata", None)
+    usage_meter.record_call(model, getattr(metadata, "prompt_token_count", 0),
+                            getattr(metadata, "candidates_token_count", 0))
+
+
+def _openai_usage(model, usage):
+    usage_meter.record_call(model, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+
+# ============ 異步調用 ============
+# 渲染和編碼是 CPU 工作，放到執行緒裡做；等待提供商響應時不佔用任何執行緒
+# 並發信號量只在請求進行時持有，退避等待期間讓給其他請求
+
+async def call_gemini_async(api_key, model, prompt, images, page_texts=None):
+    """調用 Gemini 並返回解析後的 JSON"""
+    hashes = []
+    contents = await asyncio.to_thread(gemini_contents, prompt, replay_provider.recording(images, hashes), page_texts)
+    client = client_pool.get("Gemini", api_key)
+
+    async def request():
+        async with provider_semaphore():
+            return await client.aio.models.generate_content(model=model, contents=contents, config=gemini_config())
+
+    with usage_meter.measure("provider"):
+        response = await call_with_retry_async("Gemini", api_key, request)
+    _gemini_usage(model, response)
+    replay_provider.record(hashes, page_texts, response.text, "Gemini", model)
+    return parse_json_text(response.text)
+
+
+async def call_openai_async(api_key, model, prompt, images, page_texts=None, max_tokens=4000, temperature=None):
+    """調用 OpenAI 並返回解析後的 JSON"""
+    hashes = []
+    messages = await asyncio.to_thread(openai_messages, prompt, replay_provider.recording(images, hashes), page_texts)
+    client = client_pool.get("OpenAI", api_key, kind="async")
+
+    async def request():
+        async with provider_semaphore():
+            return await client.chat.completions.create(
+                model=model, messages=messages, **_openai_options(max_tokens, temperature)
+            )
+
+    with usage_meter.measure("provider"):
+        response = await call_with_retry_async("OpenAI", api_key, request)
+    _openai_usage(model, response.usage)
+    text = response.choices[0].message.content
+    replay_provider.record(hashes, page_texts, text, "OpenAI", model)
+    return parse_json_text(text)
+
+
+# ============ 流式調用 ============
+# 逐段產出響應文本，交給 stream_json 增量解析
+# 只有在收到第一段之前失敗才重試；已經開始輸出後的錯誤直接拋出，避免重複內容
+# 並發信號量在每次嘗試時獲取，失敗即釋放，退避等待期間不佔用名額；
+# 成功打開後一直持有到流結束，由調用方釋放
+
+def _holding(semaphore, request):
+    """包裝 request：先獲取信號量，出錯時釋放；成功返回時名額保持佔用"""
+
+    async def attempt():
+        await semaphore.acquire()
+        try:
+            return await request()
+        except BaseException:
+            semaphore.release()
+            raise
+
+    return attempt
+
+
+async def _open_stream(provider, api_key, open_request, semaphore):
+    """打開流並取出第一段，返回 (stream, first)；空響應時 first 為 None
+
+    成功返回時持有 semaphore 的一個名額，調用方讀完流後負責 release()
+    """
+
+    async def request():
+        stream = await open_request()
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+
+    return await call_with_retry_async(provider, api_key, _holding(semaphore, request))
+
+
+async def stream_gemini_async(api_key, model, prompt, images, page_texts=None):
+    """流式調用 Gemini，逐段產出響應文本"""
+    hashes = []
+    contents = await asyncio.to_thread(gemini_contents, prompt, replay_provider.recording(images, hashes), page_texts)
+    client = client_pool.get("Gemini", api_key)
+    parts = []
+
+    with usage_meter.measure("provider"):
+        semaphore = provider_semaphore()
+        stream, chunk = await _open_stream(
+            "Gemini", api_key,
+            lambda: client.aio.models.generate_content_stream(model=model, contents=contents, config=gemini_config()),
+            semaphore,
+        )
+        try:
+            if chunk is None:
+                return
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+            # 每段都帶有截至目前的累計用量，以最後一段為準
+            last = chunk
+            async for chunk in stream:
+                last = chunk
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+        finally:
+            semaphore.release()
+    _gemini_usage(model, last)
+    replay_provider.record(hashes, page_texts, "".join(parts), "Gemini", model)
+
+
+def _openai_delta(chunk):
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+async def stream_openai_async(api_key, model, prompt, images, page_texts=None, max_tokens=4000, temperature=None):
+    """流式調用 OpenAI，逐段產出響應文本"""
+    hashes = []
+    messages = await asyncio.to_thread(openai_messages, prompt, replay_provider.recording(images, hashes), page_texts)
+    client = client_pool.get("OpenAI", api_key, kind="async")
+    parts = []
+    usage = None
+
+    with usage_meter.measure("provider"):
+        semaphore = provider_semaphore()
+        # include_usage：最後一段（choices 為空）帶有整次請求的用量
+        stream, chunk = await _open_stream(
+            "OpenAI", api_key,
+            lambda: client.chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True},
+                **_openai_options(max_tokens, temperature)
+            ),
+            semaphore,
+        )
+        try:
+            if chunk is None:
+                return
+            text = _openai_delta(chunk)
+            if text:
+                parts.append(text)
+                yield text
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                text = _openai_delta(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        finally:
+            semaphore.release()
+    _openai_usage(model, usage)
+    replay_provider.record(hashes, page_texts, "".join(parts), "OpenAI", model)
+
+
+# ============ 離線回放 ============
+# 和 Gemini 一樣編碼圖片（壓測時計入編碼耗時），但不發送；
+# 延遲、錯誤注入都經過同一套限流和重試，回放 Replay 錄製或合成的響應
+
+def replay_contents(prompt, images, page_texts, hashes):
+    return gemini_contents(prompt, replay_provider.hashing(images, hashes), page_texts)
+
+
+async def call_replay_async(api_key, model, prompt, images, page_texts=None):
+    """回放錄製的響應並返回解析後的 JSON"""
+    hashes = []
+    await asyncio.to_thread(replay_contents, prompt, images, page_texts, hashes)
+
+    async def request():
+        async with provider_semaphore():
+            await asyncio.sleep(replay_provider.simulated_latency())
+            replay_provider.maybe_fail()
+            return replay_provider.replay_text(hashes, page_texts)
+
+    with usage_meter.measure("provider"):
+        text = await call_with_retry_async(REPLAY_PROVIDER, api_key or REPLAY_PROVIDER, request)
+    usage_meter.record_call(model, 0, 0)
+    return parse_json_text(text)
+
+
+async def stream_replay_async(api_key, model, prompt, images, page_texts=None):
+    """流式回放：延遲之後逐段產出；錯誤只在第一段之前注入，與真實流的重試語義一致"""
+    hashes = []
+    await asyncio.to_thread(replay_contents, prompt, images, page_texts, hashes)
+
+    async def request():
+        await asyncio.sleep(replay_provider.simulated_latency())
+        replay_provider.maybe_fail()
+        return replay_provider.chunks(replay_provider.replay_text(hashes, page_texts))
+
+    with usage_meter.measure("provider"):
+        semaphore = provider_semaphore()
+        parts = await call_with_retry_async(REPLAY_PROVIDER, api_key or REPLAY_PROVIDER, _holding(semaphore, request))
+        try:
+            for i, part in enumerate(parts):
+                if i:
+                    await asyncio.sleep(REPLAY_CHUNK_DELAY)
+                yield part
+        finally:
+            semaphore.release()
+    usage_meter.record_call(model, 0, 0)
+
+
+# 按提供商名索引，供不經過應用提示詞的調用（例如章節補全、快速預覽草稿）使用
+ASYNC_CALLS = {"Gemini": call_gemini_async, "OpenAI": call_openai_async, REPLAY_PROVIDER: call_replay_async}
@@ -0,0 +1,126 @@
+"""
+離線壓測
+用 Replay 提供商並發跑完整流程：讀取 PDF、光柵化、編碼、（回放的）解析、渲染三個主題、打包 ZIP，
+統計各階段耗時和整體吞吐量，不需要網絡和 API Key
+
+用法: python replay_bench.py resume.pdf [--runs 20] [--concurrency 4] [--latency 0] [--error-rate 0] [--vision]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+import zipfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="離線壓測解析、渲染和打包的吞吐量")
+    parser.add_argument("pdf")
+    parser.add_argument("--runs", type=int, default=20, help="總請求數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時進行的請求數")
+    parser.add_argument("--latency", default="0", help="回放延遲（秒），可寫範圍如 0.5-3")
+    parser.add_argument("--error-rate", default="0", help="錯誤注入概率")
+    parser.add_argument("--vision", action="store_true", help="忽略文字層，全部頁面走光柵化和圖片編碼")
+    return parser.parse_args()
+
+
+args = parse_args()
+# 配置在模塊導入時讀取，必須先設置環境變量；壓測不使用解析快取，
+# 頁面產物也不落盤、不快取（每個進程都是空的存儲），每次請求都重新光柵化和編碼
+os.environ["HOMEPAGE_PARSE_CACHE_TTL"] = "0"
+os.environ["HOMEPAGE_ARTIFACT_TTL"] = "0"
+os.environ.setdefault("HOMEPAGE_USAGE_LOG", "")
+os.environ["HOMEPAGE_REPLAY_LATENCY"] = args.latency
+os.environ["HOMEPAGE_REPLAY_ERROR_RATE"] = args.error_rate
+if args.vision:
+    os.environ["HOMEPAGE_TEXT_LAYER"] = "0"
+
+from cv_document import normalize  # noqa: E402
+from fragment_cache import section_cache  # noqa: E402
+from page_artifacts import artifact_store  # noqa: E402
+from providers import call_replay_async  # noqa: E402
+from replay_provider import REPLAY_MODEL, REPLAY_PROVIDER, replay_store  # noqa: E402
+from resume_pipeline import parse_resume_async  # noqa: E402
+from html_stream import write_zip_entry  # noqa: E402
+from template_generator import THEME_STREAMS  # noqa: E402
+
+
+async def parser(images, api_key, page_texts=None):
+    try:
+        return await call_replay_async(api_key, REPLAY_MODEL, "", images, page_texts), None
+    except Exception as e:
+        return None, f"回放失敗: {str(e)}"
+
+
+async def run_once(index, semaphore):
+    async with semaphore:
+        started = time.perf_counter()
+        # 每次使用不同的提示詞版本，避免相同請求被合併成一次
+        data, error, info = await parse_resume_async(args.pdf, REPLAY_PROVIDER, "", parser, REPLAY_MODEL,
+                                                     f"bench-{index}")
+        parsed = time.perf_counter()
+        if error:
+            return {"error": error}
+
+        document = normalize(data)
+
+        def pack():
+            # 各主題流式渲染，直接寫入 ZIP 條目；渲染和壓縮交替進行，分別計時
+            buffer = io.BytesIO()
+            render_seconds = zip_seconds = 0.0
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for name, iter_theme in THEME_STREAMS.items():
+                    rendering, writing = write_zip_entry(zipf, f"{name}.html", iter_theme(document))
+                    render_seconds += rendering
+                    zip_seconds += writing
+            return buffer.tell(), render_seconds, zip_seconds
+
+        size, render_seconds, zip_seconds = await asyncio.to_thread(pack)
+        return {
+            "parse": parsed - started,
+            "render": render_seconds,
+            "zip": zip_seconds,
+            "stages": info["usage"].as_dict()["stages"],
+            "pages": info.get("text_pages", 0) + info.get("image_pages", 0),
+            "bytes": size,
+        }
+
+
+async def main():
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_once(i, semaphore) for i in range(args.runs)))
+    elapsed = time.perf_counter() - started
+
+    ok = [result for result in results if "error" not in result]
+    failed = len(results) - len(ok)
+    pages = sum(result["pages"] for result in ok)
+    print(f"\n📊 {len(ok)}/{len(results)} 成功，並發 {args.concurrency}，總耗時 {elapsed:.2f} 秒")
+    print(f"   吞吐量: {len(ok) / elapsed:.2f} 份/秒，{pages / elapsed:.1f} 頁/秒")
+    if ok:
+        for stage in ("parse", "render", "zip"):
+            values = sorted(result[stage] for result in ok)
+            print(f"   {stage:<7} 平均 {sum(values) / len(values) * 1000:8.1f} ms"
+                  f"   p95 {values[int(0.95 * (len(values) - 1))] * 1000:8.1f} ms")
+        # 解析內部的階段（usage_meter 計量，分段並行時為各段之和）
+        for stage in ("plan", "rasterize", "encode", "provider"):
+            total = sum(result["stages"].get(stage, 0.0) for result in ok)
+            print(f"     └ {stage:<9} 平均 {total / len(ok) * 1000:8.1f} ms")
+        print(f"   ZIP 平均 {sum(result['bytes'] for result in ok) / len(ok):,.0f} 字節")
+    stats = replay_store.stats()
+    print(f"   回放錄製 命中/未命中 = {stats['hits']}/{stats['misses']}")
+    stats = artifact_store.stats()
+    print(f"   頁面產物 命中/未命中 = {stats['hits']}/{stats['misses']}")
+    stats = section_cache.stats()
+    print(f"   章節片段 命中/未命中 = {stats['hits']}/{stats['misses']}")
+    if failed:
+        print(f"   ❌ 失敗 {failed} 次，例如: {next(result['error'] for result in results if 'error' in result)}")
+
+
+if __name__ == "__main__":
+    if not os.path.exists(args.pdf):
+        print(f"找不到文件: {args.pdf}")
+        sys.exit(1)
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+"""
+離線回放提供商
+不連網地重放錄製好的模型響應，和 Gemini / OpenAI 一樣可以在界面上選擇；
+錄製以頁面圖片的哈希（和文字層頁面）為鍵，可配置人為延遲和錯誤注入，
+用於在 CI 或離線主機上壓測光柵化、編碼、渲染和打包的端到端吞吐量。
+
+錄製：設置 HOMEPAGE_REPLAY_RECORD=1 後正常使用 Gemini / OpenAI，
+每次響應都會按頁面寫入 HOMEPAGE_REPLAY_DIR；沒有錄製的頁面回放一份合成的簡歷
+"""
+
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from page_artifacts import artifact_of
+from page_filter import dhash_hex
+
+# ============ 配置 ============
+
+REPLAY_PROVIDER = "Replay"
+REPLAY_MODEL = "replay"
+
+REPLAY_DIR = os.environ.get("HOMEPAGE_REPLAY_DIR", ".replay_fixtures")
+# 是否把真實提供商的響應錄製下來
+REPLAY_RECORD = os.environ.get("HOMEPAGE_REPLAY_RECORD", "0") != "0"
+
+
+def _latency(value):
+    """讀取延遲配置：固定秒數 "1.5" 或範圍 "0.5-3"，返回 (最小, 最大)"""
+    low, _, high = value.partition("-")
+    return float(low), float(high or low)
+
+
+# 每次請求的人為延遲（秒）
+REPLAY_LATENCY = _latency(os.environ.get("HOMEPAGE_REPLAY_LATENCY", "1.0"))
+# 流式回放每段之間的延遲（秒）和每段的字符數
+REPLAY_CHUNK_DELAY = float(os.environ.get("HOMEPAGE_REPLAY_CHUNK_DELAY", "0.02"))
+REPLAY_CHUNK_SIZE = int(os.environ.get("HOMEPAGE_REPLAY_CHUNK_SIZE", "200"))
+# 錯誤注入：每次請求以此概率失敗（可重試的 429 / 503），用於驗證重試和故障轉移
+REPLAY_ERROR_RATE = float(os.environ.get("HOMEPAGE_REPLAY_ERROR_RATE", "0"))
+# 隨機數種子，設置後延遲和錯誤序列可以重現
+REPLAY_SEED = os.environ.get("HOMEPAGE_REPLAY_SEED")
+
+_random = random.Random(REPLAY_SEED)
+_random_lock = threading.Lock()
+
+
+class ReplayError(Exception):
+    """注入的提供商錯誤，帶 status_code，重試邏輯與真實錯誤一致"""
+
+    def __init__(self, status_code):
+        super().__init__(f"回放注入的錯誤（HTTP {status_code}）")
+        self.status_code = status_code
+
+
+# ============ 鍵 ============
+
+def page_hash(image):
+    """頁面圖片的 dHash（十六進制）：與渲染解析度和編碼無關，同一頁在不同提供商的尺寸下鍵相同"""
+    artifact = artifact_of(image)
+    return artifact.hash if artifact is not None else dhash_hex(image)
+
+
+def fixture_key(hashes, page_texts=None):
+    """一次請求的錄製鍵：按順序的頁面圖片哈希和文字層頁面"""
+    digest = hashlib.sha256()
+    for value in hashes:
+        digest.update(f"image:{value}\n".encode("utf-8"))
+    for number, text in page_texts or []:
+        digest.update(f"text:{number}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def hashing(images, hashes):
+    """逐頁產出圖片並把哈希追加到 hashes；編碼時順帶計算，不需要再讀一遍頁面"""
+    for image in images:
+        hashes.append(page_hash(image))
+        yield image
+
+
+def recording(images, hashes):
+    """錄製模式下同 hashing，否則原樣返回 images"""
+    return hashing(images, hashes) if REPLAY_RECORD else images
+
+
+# ============ 錄製 ============
+
+class ReplayStore:
+    """磁碟上的錄製：每個鍵一個 JSON 文件，並統計回放命中率"""
+
+    def __init__(self, directory=REPLAY_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """讀取錄製的響應文本，不存在時返回 None"""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                text = json.load(f)["response"]
+        except (OSError, ValueError, KeyError):
+            text = None
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def put(self, key, entry):
+        """原子寫入：先寫臨時文件再替換，並發錄製時不會讀到半個文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            print(f"[回放] 寫入錄製失敗: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+replay_store = ReplayStore()
+
+
+def record(hashes, page_texts, text, provider, model):
+    """錄製模式下保存一次真實響應"""
+    if not REPLAY_RECORD or not text:
+        return
+    replay_store.put(fixture_key(hashes, page_texts), {
+        "pages": list(hashes),
+        "page_texts": [number for number, _ in page_texts or []],
+        "provider": provider,
+        "model": model,
+        "recorded": time.time(),
+        "response": text,
+    })
+
+
+# ============ 回放 ============
+
+def synthetic_response(hashes, page_texts=None):
+    """沒有錄製時的合成簡歷：每頁一個章節，內容由頁面決定，同一輸入總是得到同一輸出"""
+    sections = []
+    pages = [f"第 {i} 頁（{value[:8]}）" for i, value in enumerate(hashes, 1)]
+    pages += [
+        " ".join(text.split()[:8]) or f"第 {number} 頁"
+        for number, text in page_texts or []
+    ]
+    for i, label in enumerate(pages, 1):
+        sections.append({
+            "title": f"Section {i}",
+            "type": "timeline",
+            "items": [{
+                "title": label,
+                "subtitle": "Replay",
+                "date": "2020 - 2024",
+                "description": f"Synthetic entry replayed offline for page {i}.",
+                "tags": ["replay"],
+            }],
+        })
+    return json.dumps({
+        "name": "Replay Candidate",
+        "title": "Offline Replay",
+        "email": "replay@example.com",
+        "website": "",
+        "bio": "Synthetic CV used to exercise the pipeline without a provider.",
+        "sections": sections,
+    }, ensure_ascii=False)
+
+
+def replay_text(hashes, page_texts=None):
+    """錄製的響應文本，沒有錄製時返回合成簡歷"""
+    text = replay_store.get(fixture_key(hashes, page_texts))
+    return text if text is not None else synthetic_response(hashes, page_texts)
+
+
+def simulated_latency():
+    low, high = REPLAY_LATENCY
+    with _random_lock:
+        return _random.uniform(low, high)
+
+
+def maybe_fail():
+    """按 REPLAY_ERROR_RATE 拋出注入的錯誤"""
+    with _random_lock:
+        failed = _random.random() < REPLAY_ERROR_RATE
+        status = _random.choice((429, 503))
+    if failed:
+        raise ReplayError(status)
+
+
+def chunks(text):
+    """把響應切成流式回放的片段"""
+    size = max(1, REPLAY_CHUNK_SIZE)
+    return [text[i:i + size] for i in range(0, len(text), size)]
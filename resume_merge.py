@@ -0,0 +1,113 @@
+"""
+分段解析結果的合併
+長簡歷按頁分段並行解析後，按分段順序把結果合併成一份：
+同名章節（包括跨頁延續的章節）合併為一個，重複條目只保留第一次出現的；
+兩階段解析時把精修結果逐步蓋到草稿上
+"""
+
+import re
+
+# 章節標題末尾的「（續）」「(cont.)」之類的延續標記
+CONTINUATION_MARK = re.compile(r"\s*[(（]\s*(續|续|接上頁|cont\.?|continued)\s*[)）]\s*$", re.IGNORECASE)
+
+
+def normalize_text(value):
+    """比較用的文本：合併空白、忽略大小寫"""
+    return " ".join(str(value or "").split()).casefold()
+
+
+def section_key(section):
+    return normalize_text(CONTINUATION_MARK.sub("", str(section.get("title") or "")))
+
+
+def item_key(item):
+    """條目去重鍵：標題 + 副標題 + 時間；三者都為空時用描述"""
+    if not isinstance(item, dict):
+        return ("", normalize_text(item))
+    key = tuple(normalize_text(item.get(field)) for field in ("title", "subtitle", "date"))
+    if not any(key):
+        key = ("", "", "", normalize_text(item.get("description")))
+    return key
+
+
+def merge_shards(results):
+    """按分段順序合併解析結果，結果與分段完成的先後無關
+
+    - 頂層字段（name、email…）取第一個非空值
+    - 分段開頭沒有標題的章節視為上一段最後一個章節的延續
+    - 同名章節合併條目，按 item_key 去重
+    """
+    merged = {}
+    sections = []
+    seen = []
+    index = {}
+
+    for data in results:
+        if not isinstance(data, dict):
+            continue
+        for field, value in data.items():
+            if field != "sections" and value and not merged.get(field):
+                merged[field] = value
+
+        for position, section in enumerate(data.get("sections") or []):
+            if not isinstance(section, dict):
+                continue
+            key = section_key(section)
+            if not key and position == 0 and sections:
+                target = len(sections) - 1
+            else:
+                target = index.get(key)
+
+            if target is None:
+                target = len(sections)
+                sections.append({field: value for field, value in section.items() if field != "items"})
+                sections[target]["items"] = []
+                seen.append(set())
+                index[key] = target
+            else:
+                # 補上前一段沒有給出的字段（例如 type）
+                for field, value in section.items():
+                    if field != "items" and value and not sections[target].get(field):
+                        sections[target][field] = value
+
+            for item in section.get("items") or []:
+                item_id = item_key(item)
+                if item_id not in seen[target]:
+                    seen[target].add(item_id)
+                    sections[target]["items"].append(item)
+
+    merged["sections"] = sections
+    return merged
+
+
+def overlay(draft, refined):
+    """把精修的部分結果蓋到草稿上：已經精修完的字段和章節替換草稿，其餘保留草稿"""
+    if not refined:
+        return draft
+    data = dict(draft)
+    data.update({field: value for field, value in refined.items() if field != "sections" and value})
+    sections = list(draft.get("sections") or [])
+    index = {section_key(section): i for i, section in enumerate(sections) if isinstance(section, dict)}
+    for section in refined.get("sections") or []:
+        if not isinstance(section, dict):
+            continue
+        i = index.get(section_key(section))
+        if i is None:
+            index[section_key(section)] = len(sections)
+            sections.append(section)
+        else:
+            sections[i] = section
+    data["sections"] = sections
+    return data
+
+
+def count_changes(draft, refined):
+    """精修相對草稿改動了多少處：頂層字段和章節（按標題對應）各算一處"""
+    changes = sum(
+        1 for field in set(draft) | set(refined)
+        if field != "sections" and draft.get(field) != refined.get(field)
+    )
+    before = {section_key(s): s for s in draft.get("sections") or [] if isinstance(s, dict)}
+    after = {section_key(s): s for s in refined.get("sections") or [] if isinstance(s, dict)}
+    changes += sum(1 for key in set(before) | set(after) if before.get(key) != after.get(key))
+    return changes
@@ -0,0 +1,535 @@
+"""
+簡歷解析流程
+三個 Gradio 應用共用：查快取 → 讀取文字層 → 渲染並過濾掃描頁 → 調用解析函數 → 寫快取
+長簡歷按頁分段並行解析再合併，耗時取決於最慢的一段，單次輸出也不會被截斷
+同時提交的相同請求（同一份 PDF、提供商、模型和提示詞）只解析一次
+「自動」模式按各提供商的延遲和錯誤率選擇，並可對沖請求第二個提供商
+解析後檢查沒有內容的章節，只把它們來源的頁面重新發給模型補全
+快速預覽模式先用低解析度（和更便宜的模型）出草稿，再用完整解析度精修
+各應用只需提供自己的解析函數和提示詞；異步和流式處理函數共用同一套步驟
+每次請求的頁數、字節數、token、各階段耗時和費用由 usage_meter 計量，應用渲染完成後調用 record_usage
+"""
+
+import asyncio
+import os
+import time
+
+from image_encoding import IMAGE_ENCODING
+from page_filter import filter_pages, describe_removed
+from parse_cache import parse_cache, file_digest, prompt_version, cache_key
+from pdf_pipeline import iter_page_images, plan_pages, PATH_LABELS, TEXT_LAYER_ENABLED
+from provider_router import AUTO_PROVIDER, HEDGE_DELAY, router, split_api_keys
+from providers import parse_json_text, ASYNC_CALLS, STRUCTURED_OUTPUT
+from resume_merge import merge_shards, overlay, count_changes
+from section_repair import (find_defects, merge_repaired, relevant_pages, repair_prompt, section_pages,
+                            SECTION_REPAIR_ENABLED)
+from single_flight import single_flight
+from stream_json import SectionStreamParser
+import usage_meter
+
+# ============ 配置 ============
+
+# 頁數達到此值時按頁分段並行解析（0 表示不分段）
+SHARD_MIN_PAGES = int(os.environ.get("HOMEPAGE_SHARD_MIN_PAGES", "8"))
+# 每段的頁數
+SHARD_PAGES = int(os.environ.get("HOMEPAGE_SHARD_PAGES", "4"))
+
+# 快速預覽草稿的渲染解析度上限
+DRAFT_DPI = int(os.environ.get("HOMEPAGE_DRAFT_DPI", "72"))
+# 草稿使用的模型；設為空字符串則與精修使用同一模型
+DRAFT_MODELS = {
+    "Gemini": os.environ.get("HOMEPAGE_DRAFT_MODEL_GEMINI", "gemini-2.0-flash-lite"),
+    "OpenAI": os.environ.get("HOMEPAGE_DRAFT_MODEL_OPENAI", "gpt-4o-mini"),
+}
+
+# 影響解析結果的管線設置，和提示詞一樣參與快取鍵：改了其中任何一項，舊的快取結果自動失效
+PIPELINE_SETTINGS = f"encoding={IMAGE_ENCODING} text_layer={int(TEXT_LAYER_ENABLED)} structured={int(STRUCTURED_OUTPUT)}"
+
+
+def _noop_progress(*args, **kwargs):
+    pass
+
+
+async def parse_resume_async(pdf_file, provider, api_key, parser, model, prompt, progress=None):
+    """解析一份簡歷 PDF
+
+    parser 為應用的 parse_with_*_async，
+    簽名為 parser(images, api_key, page_texts) -> (data, error)。
+    返回 (data, error, info)，info 記錄解析路徑、耗時、略過的頁面和快取命中情況。
+
+    讀文件、哈希和讀文字層放到執行緒裡做，不阻塞事件循環。
+    相同請求正在進行時直接等待它的結果。
+    """
+    progress = progress or _noop_progress
+    key = await asyncio.to_thread(_request_key, pdf_file, provider, model, prompt, progress)
+    _notify_shared(key, progress)
+    (data, error, info), shared = await single_flight.run(
+        key, lambda: _parse_async(key, pdf_file, provider, api_key, parser, model, progress)
+    )
+    return data, error, _shared_info(info, shared)
+
+
+async def _parse_async(key, pdf_file, provider, api_key, parser, model, progress):
+    info = _new_info(provider, model)
+    data = await asyncio.to_thread(_lookup_cache, key, info)
+    if data is not None:
+        return data, None, info
+
+    shards, plan = await asyncio.to_thread(_prepare_pages, pdf_file, provider, model, info, progress)
+    results = await asyncio.gather(*(parser(images, api_key, page_texts) for images, page_texts in shards))
+    data, error = results[0] if len(results) == 1 else _merge_results(results, plan)
+    if not error:
+        data = await _repair_async(data, pdf_file, provider, api_key, model, plan, info, progress)
+    return await asyncio.to_thread(_finish, key, data, error, info)
+
+
+async def parse_resume_stream(pdf_file, provider, api_key, streamer, model, prompt, progress=None, draft=False):
+    """流式解析：每完成一個頂層字段或章節就產出一次目前的部分數據
+
+    streamer 為應用的 stream_with_gemini / stream_with_openai，
+    簽名為 streamer(images, api_key, page_texts)，返回逐段產出文本的異步迭代器。
+    產出 (data, error, info, done)；done 為 False 時 data 是部分數據，
+    最後一次 done 為 True，與 parse_resume_async 的返回值相同。
+    相同請求正在進行時掛到它上面，從它目前的部分數據開始接收。
+    draft 為 True 時同時發出一個低解析度的草稿請求，草稿先到就先顯示，
+    精修的章節陸續替換草稿中的對應章節。
+    """
+    progress = progress or _noop_progress
+    key = await asyncio.to_thread(_request_key, pdf_file, provider, model, prompt, progress)
+    _notify_shared(key, progress, streaming=True)
+    async for (data, error, info, done), shared in single_flight.stream(
+        key, lambda: _parse_stream(key, pdf_file, provider, api_key, streamer, model, prompt, progress, draft)
+    ):
+        yield data, error, _shared_info(info, shared), done
+
+
+async def _parse_stream(key, pdf_file, provider, api_key, streamer, model, prompt, progress, draft):
+    info = _new_info(provider, model)
+    data = await asyncio.to_thread(_lookup_cache, key, info)
+    if data is not None:
+        yield data, None, info, True
+        return
+
+    shards, plan = await asyncio.to_thread(_prepare_pages, pdf_file, provider, model, info, progress)
+    events = _stream_shards(shards, plan, streamer, api_key, provider, info)
+    draft_model = DRAFT_MODELS.get(provider) or model
+    # 純文字層且草稿模型相同時，草稿和精修是同一個請求，沒有必要
+    if draft and (plan["scanned_pages"] or draft_model != model):
+        events = _with_draft(events, _draft(pdf_file, provider, api_key, draft_model, prompt, plan), info)
+
+    async for data, error, done in events:
+        if not done:
+            yield data, None, info, False
+
+    if not error:
+        data = await _repair_async(data, pdf_file, provider, api_key, model, plan, info, progress)
+    data, error, info = await asyncio.to_thread(_finish, key, data, error, info)
+    yield data, error, info, True
+
+
+async def _stream_shards(shards, plan, streamer, api_key, provider, info):
+    """流式調用各段，產出 (data, error, done)；最後一次 done 為 True"""
+    if len(shards) == 1:
+        images, page_texts = shards[0]
+        parser = SectionStreamParser()
+        try:
+            async for chunk in streamer(images, api_key, page_texts):
+                if parser.feed(chunk):
+                    info.setdefault("first_section_seconds", time.time() - info["started"])
+                    yield parser.partial(), None, False
+            # 完整文本為準，增量結果只用於預覽
+            yield parse_json_text(parser.text), None, True
+        except Exception as e:
+            yield None, f"{provider} 解析失敗: {str(e)}", True
+        return
+
+    # 分段模式：每完成一段就把已完成的各段合併成預覽
+    results = [None] * len(shards)
+    tasks = [
+        asyncio.ensure_future(_collect_stream(i, streamer, images, api_key, page_texts, provider))
+        for i, (images, page_texts) in enumerate(shards)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            i, data, error = await next_done
+            if error:
+                yield None, error, True
+                return
+            results[i] = (data, None)
+            info.setdefault("first_section_seconds", time.time() - info["started"])
+            yield merge_shards(r[0] for r in results if r), None, False
+    finally:
+        for task in tasks:
+            task.cancel()
+    data, error = _merge_results(results, plan)
+    yield data, error, True
+
+
+async def _draft(pdf_file, provider, api_key, model, prompt, plan):
+    """快速草稿：低解析度圖片、可選更便宜的模型；失敗時返回 None，不影響精修"""
+
+    def images():
+        if not plan["scanned_pages"]:
+            return []
+        pages = iter_page_images(pdf_file, provider, model, page_numbers=plan["scanned_pages"], max_dpi=DRAFT_DPI)
+        return filter_pages(pages, None, plan["scanned_pages"])
+
+    try:
+        draft_images = await asyncio.to_thread(images)
+        return await ASYNC_CALLS[provider](api_key, model, prompt, draft_images, plan["page_texts"])
+    except Exception as e:
+        print(f"[草稿] {provider} 失敗: {e}")
+        return None
+
+
+async def _with_draft(events, draft_request, info):
+    """把草稿插入精修的結果流：草稿先到就先產出，之後精修的部分結果蓋在草稿上"""
+    draft_task = asyncio.ensure_future(draft_request)
+    next_event = asyncio.ensure_future(events.__anext__())
+    draft = refined = None
+    try:
+        while True:
+            waiting = {next_event} if draft_task is None else {next_event, draft_task}
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if draft_task in done:
+                draft, draft_task = draft_task.result(), None
+                if isinstance(draft, dict) and next_event not in done:
+                    info["draft_seconds"] = time.time() - info["started"]
+                    yield _overlay_draft(draft, refined), None, False
+
+            if next_event in done:
+                try:
+                    data, error, finished = next_event.result()
+                except StopAsyncIteration:
+                    return
+                if finished:
+                    if isinstance(draft, dict) and isinstance(data, dict) and "draft_seconds" in info:
+                        info["draft_changes"] = count_changes(draft, data)
+                    yield data, error, True
+                    return
+                refined = data
+                yield _overlay_draft(draft, refined), None, False
+                next_event = asyncio.ensure_future(events.__anext__())
+    finally:
+        if draft_task is not None:
+            draft_task.cancel()
+        if not next_event.done():
+            # 等 __anext__ 真正結束後才能關閉生成器
+            next_event.cancel()
+            await asyncio.gather(next_event, return_exceptions=True)
+        await events.aclose()
+
+
+def _overlay_draft(draft, refined):
+    """精修蓋在草稿上；任何一方不是字典（例如模型返回了數組）時用另一方"""
+    if isinstance(draft, dict) and isinstance(refined, dict):
+        return overlay(draft, refined)
+    if isinstance(refined, dict):
+        return refined
+    return draft if isinstance(draft, dict) else refined
+
+
+async def parse_resume_auto(pdf_file, api_key, parsers, models, prompts, progress=None):
+    """「自動」模式：按延遲和錯誤率選擇提供商
+
+    api_key 可以同時包含 Gemini 和 OpenAI 的 Key（見 split_api_keys），
+    parsers / models / prompts 為按提供商名索引的字典。
+    首選提供商超過 HEDGE_DELAY 秒未返回、或者失敗時，請求下一個提供商，
+    先返回有效 JSON 的一方勝出，另一方被取消。返回值與 parse_resume_async 相同。
+    """
+    progress = progress or _noop_progress
+    api_keys = split_api_keys(api_key)
+    candidates = router.rank([provider for provider in parsers if api_keys.get(provider)])
+    if not candidates:
+        return None, "自動模式需要至少一個提供商的 API Key", _new_info(AUTO_PROVIDER, None)
+
+    progress(0.1, desc="🔍 檢查快取...")
+    digest = await asyncio.to_thread(file_digest, pdf_file)
+    keys = {
+        provider: cache_key(digest, provider, models[provider], prompt_version(prompts[provider]), PIPELINE_SETTINGS)
+        for provider in candidates
+    }
+    for provider in candidates:
+        info = _new_info(provider, models[provider])
+        data = await asyncio.to_thread(_lookup_cache, keys[provider], info)
+        if data is not None:
+            info["auto"] = True
+            return data, None, info
+
+    flight_key = (AUTO_PROVIDER,) + tuple(sorted(keys.values()))
+    _notify_shared(flight_key, progress)
+    (data, error, info), shared = await single_flight.run(
+        flight_key, lambda: _race(pdf_file, candidates, keys, api_keys, parsers, models, progress)
+    )
+    return data, error, _shared_info(info, shared)
+
+
+async def _race(pdf_file, candidates, keys, api_keys, parsers, models, progress):
+    async def attempt(provider):
+        info = _new_info(provider, models[provider])
+        info["auto"] = True
+        # 準備頁面也可能失敗（例如渲染出錯），同樣記為這次嘗試失敗，另一個提供商仍然可以勝出
+        try:
+            shards, plan = await asyncio.to_thread(_prepare_pages, pdf_file, provider, models[provider], info, progress)
+            results = await asyncio.gather(*(
+                parsers[provider](images, api_keys[provider], page_texts) for images, page_texts in shards
+            ))
+            data, error = results[0] if len(results) == 1 else _merge_results(results, plan)
+        except Exception as e:
+            data, error = None, f"{provider} 解析失敗: {str(e)}"
+        if not error:
+            data = await _repair_async(data, pdf_file, provider, api_keys[provider], models[provider],
+                                       plan, info, progress)
+        return provider, data, error, info
+
+    remaining = list(candidates)
+    started = {}
+
+    def start_next():
+        provider = remaining.pop(0)
+        task = asyncio.ensure_future(attempt(provider))
+        started[task] = (provider, time.monotonic())
+        return task
+
+    pending = {start_next()}
+    hedged = False
+    failure = None
+    try:
+        while pending:
+            timeout = HEDGE_DELAY if remaining and not hedged else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # 首選提供商太慢：對沖請求下一個
+                hedged = True
+                pending.add(start_next())
+                continue
+            for task in done:
+                provider, data, error, info = task.result()
+                info["hedged"] = hedged
+                if error is None:
+                    return await asyncio.to_thread(_finish, keys[provider], data, None, info)
+                failure = await asyncio.to_thread(_finish, keys[provider], None, error, info)
+            # 失敗時立即換下一個提供商
+            if remaining and not pending:
+                pending.add(start_next())
+    finally:
+        for task in pending:
+            task.cancel()
+            # 輸掉的一方至少比勝者慢，記下已經等待的時間，避免它一直因為「沒有數據」被排在首位
+            provider, since = started[task]
+            router.record_cancelled(provider, time.monotonic() - since)
+    return failure
+
+
+async def _collect_stream(index, streamer, images, api_key, page_texts, provider):
+    """讀完一段的流式響應，返回 (分段序號, data, error)"""
+    try:
+        chunks = [chunk async for chunk in streamer(images, api_key, page_texts)]
+        return index, parse_json_text("".join(chunks)), None
+    except Exception as e:
+        return index, None, f"{provider} 解析失敗: {str(e)}"
+
+
+def _repair_request(data, pdf_file, provider, model, plan):
+    """章節補全的請求內容；沒有空章節時返回 None"""
+    defects = find_defects(data) if SECTION_REPAIR_ENABLED else []
+    if not defects:
+        return None
+    page_texts, scanned = relevant_pages(defects, plan)
+    images = []
+    if scanned:
+        # 按整個請求的掃描頁數選解析度，與解析時一致，可以直接取用已有的頁面產物
+        pages = iter_page_images(pdf_file, provider, model, page_numbers=scanned,
+                                 page_count=len(plan["scanned_pages"]))
+        images = filter_pages(pages, None, scanned)
+    return defects, repair_prompt(defects), images, page_texts
+
+
+async def _repair_async(data, pdf_file, provider, api_key, model, plan, info, progress):
+    """步驟 2.5: 只重新提取沒有內容的章節，失敗時保留原結果"""
+    request = await asyncio.to_thread(_repair_request, data, pdf_file, provider, model, plan)
+    if request is None:
+        return data
+    defects, prompt, images, page_texts = request
+    progress(0.6, desc=f"🩹 補全 {len(defects)} 個沒有內容的章節...")
+    try:
+        fixed = await ASYNC_CALLS[provider](api_key, model, prompt, images, page_texts)
+    except Exception as e:
+        print(f"[補全] {provider} 失敗: {e}")
+        return data
+    return _apply_repair(data, defects, fixed, info)
+
+
+def _apply_repair(data, defects, fixed, info):
+    data, repaired = merge_repaired(data, defects, fixed)
+    info["repaired"] = repaired
+    print(f"[補全] 空章節={len(defects)} 已補全={len(repaired)}")
+    return data
+
+
+def _merge_results(results, plan):
+    """合併各段的 (data, error)，任何一段失敗則整體失敗；各章節的來源頁面記到 plan 上，章節補全只發這些頁"""
+    for data, error in results:
+        if error:
+            return None, error
+    shard_data = [data for data, _ in results]
+    plan["section_pages"] = section_pages(shard_data, plan["shard_pages"])
+    return merge_shards(shard_data), None
+
+
+def _new_info(provider, model):
+    """新請求的 info，同時在當前上下文開始計量用量"""
+    return {
+        "provider": provider,
+        "model": model,
+        "cache": "miss",
+        "path": None,
+        "removed": [],
+        "started": time.time(),
+        "usage": usage_meter.start(provider, model),
+    }
+
+
+def _request_key(pdf_file, provider, model, prompt, progress):
+    """請求的身份：快取和請求合併共用同一個鍵"""
+    progress(0.1, desc="🔍 檢查快取...")
+    return cache_key(file_digest(pdf_file), provider, model, prompt_version(prompt), PIPELINE_SETTINGS)
+
+
+def _notify_shared(key, progress, streaming=False):
+    if single_flight.is_running(key, streaming):
+        progress(0.4, desc="⏳ 同一份簡歷正在解析，等待結果...")
+
+
+def _shared_info(info, shared):
+    """掛在別人任務上的請求拿到的是 info 的副本，並標記為已合併；用量只記在發起的請求上"""
+    if not shared:
+        return info
+    return dict(info, coalesced=True, usage=usage_meter.RequestUsage(info["provider"], info["model"]))
+
+
+def _lookup_cache(key, info):
+    """步驟 1: 查快取，命中時直接返回數據"""
+    data = parse_cache.get(key)
+    if data is not None:
+        info["cache"] = "hit"
+        info["seconds"] = time.time() - info["started"]
+        _log(info)
+    return data
+
+
+def _prepare_pages(pdf_file, provider, model, info, progress):
+    """步驟 2: 讀取文字層，只有掃描頁才轉換為圖片（圖片為惰性生成器）
+
+    返回 (分段列表 [(images, page_texts)], plan)；頁數不足 SHARD_MIN_PAGES 時只有一段。
+    各段的圖片在各自的請求編碼時才渲染，因此渲染也是並行的。
+    """
+    progress(0.2, desc="📄 讀取 PDF...")
+    with usage_meter.measure("plan"):
+        plan = plan_pages(pdf_file)
+    info["path"] = plan["path"]
+    info["text_pages"] = len(plan["page_texts"])
+    info["scanned_pages"] = len(plan["scanned_pages"])
+
+    page_count = plan["page_count"]
+    if SHARD_MIN_PAGES and page_count >= SHARD_MIN_PAGES:
+        ranges = [range(start, min(start + SHARD_PAGES, page_count + 1))
+                  for start in range(1, page_count + 1, SHARD_PAGES)]
+    else:
+        ranges = [range(1, page_count + 1)]
+    info["shards"] = len(ranges)
+    plan["shard_pages"] = ranges
+
+    shards = []
+    for pages in ranges:
+        page_texts = [(number, text) for number, text in plan["page_texts"] if number in pages]
+        scanned = [number for number in plan["scanned_pages"] if number in pages]
+        images = []
+        if scanned:
+            images = filter_pages(iter_page_images(pdf_file, provider, model, page_numbers=scanned,
+                                                   page_count=len(plan["scanned_pages"])),
+                                  info["removed"], scanned)
+        shards.append((images, page_texts))
+
+    label = PATH_LABELS[plan["path"]]
+    if len(shards) > 1:
+        label += f"，分 {len(shards)} 段並行"
+    progress(0.4, desc=f"🤖 使用 {provider} 解析（{label}）...")
+    return shards, plan
+
+
+def _finish(key, data, error, info):
+    """步驟 3: 記錄耗時，成功時寫入快取"""
+    # 準備頁面前就失敗時還沒有頁數
+    info["image_pages"] = info.get("scanned_pages", 0) - len(info["removed"])
+    info["seconds"] = time.time() - info["started"]
+    router.record(info["provider"], info["seconds"], not error)
+    _log(info)
+    if error:
+        return None, error, info
+    parse_cache.put(key, data)
+    return data, None, info
+
+
+def describe_parse(info):
+    """把 info 整理成附在狀態欄後面的說明"""
+    if info.get("coalesced"):
+        return "（與同時提交的相同請求合併，未重複調用 AI）"
+    if info["cache"] == "hit":
+        return "（快取命中，未調用 AI）"
+    auto = ""
+    if info.get("auto"):
+        auto = f"自動選擇 {info['provider']}{'（已對沖）' if info.get('hedged') else ''}，"
+    shards = f"，分 {info['shards']} 段並行" if info.get("shards", 1) > 1 else ""
+    repaired = f"，補全 {len(info['repaired'])} 個章節" if info.get("repaired") else ""
+    if "draft_changes" in info:
+        repaired = f"，草稿 {info['draft_seconds']:.1f} 秒、精修更新 {info['draft_changes']} 處" + repaired
+    usage = usage_meter.describe_usage(info["usage"])
+    usage = f"，{usage}" if usage else ""
+    return (f"（{auto}{PATH_LABELS[info['path']]}{shards}{repaired}，解析耗時 {info['seconds']:.1f} 秒{usage}）"
+            f"{describe_removed(info['removed'])}")
+
+
+def record_usage(info, render_seconds=None, error=None):
+    """請求結束（渲染完成或失敗）時調用：補上渲染耗時，把這次請求的用量追加到 NDJSON 日誌"""
+    usage = info["usage"]
+    if render_seconds is not None:
+        usage.add_stage("render", render_seconds)
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "provider": info["provider"],
+        "model": info["model"],
+        "path": info.get("path"),
+        "cache": info["cache"],
+        "coalesced": bool(info.get("coalesced")),
+        "auto": bool(info.get("auto")),
+        "shards": info.get("shards", 1),
+        "repaired": len(info.get("repaired") or []),
+        "seconds": round(info.get("seconds", time.time() - info["started"]), 4),
+        "error": error,
+    }
+    entry.update(usage.as_dict())
+    usage_meter.write_log(entry)
+
+
+def describe_progress(data, info):
+    """流式解析過程中的狀態欄文字"""
+    if "draft_seconds" in info:
+        return f"⚡ 草稿預覽已就緒（{info['draft_seconds']:.1f} 秒），高解析度精修中..."
+    return f"⏳ 解析中... 已完成 {len(data['sections'])} 個章節"
+
+
+def _log(info):
+    stats = parse_cache.stats()
+    cache_stats = f"快取={info['cache']} 命中/未命中={stats['hits']}/{stats['misses']}"
+    if info["cache"] == "hit":
+        print(f"[解析] {cache_stats} 耗時={info['seconds']:.3f}s")
+        return
+    usage = info["usage"].as_dict()
+    first = info.get("first_section_seconds")
+    first_stats = f" 首個章節={first:.1f}s" if first is not None else ""
+    print(f"[解析] 提供商={info['provider']} 路徑={info['path']} 分段={info.get('shards', 1)} 文字頁={info.get('text_pages', 0)} "
+          f"圖片頁={info['image_pages']} 略過={len(info['removed'])} "
+          f"{cache_stats} 耗時={info['seconds']:.1f}s{first_stats} "
+          f"圖片字節={usage['encoded_bytes']} tokens={usage['prompt_tokens']}+{usage['completion_tokens']}")
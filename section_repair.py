@@ -0,0 +1,131 @@
+"""
+章節補全
+檢查解析結果裡沒有內容的章節（只有標題、條目為空），
+只把這些章節來源的頁面和一個針對性的提示詞發給模型重新提取，再合併回原來的 JSON
+"""
+
+import os
+
+from resume_merge import normalize_text, section_key
+
+# ============ 配置 ============
+
+# 是否啟用章節補全
+SECTION_REPAIR_ENABLED = os.environ.get("HOMEPAGE_SECTION_REPAIR", "1") != "0"
+# 一次最多補全的章節數
+REPAIR_MAX_SECTIONS = int(os.environ.get("HOMEPAGE_REPAIR_MAX_SECTIONS", "3"))
+
+REPAIR_PROMPT = """以下是一份學術簡歷中的部分頁面。之前從中提取的這些章節沒有內容：
+
+{problems}
+
+請只重新提取上述章節，每個章節給出完整的全部條目（包括時間和完整的描述）。
+按下面的格式返回 JSON，sections 中只包含這些章節，其他頂層字段留空：
+
+{{"sections": [{{"title": "章節標題", "type": "timeline", "items": [{{"title": "", "subtitle": "", "date": "", "description": "", "tags": []}}]}}]}}
+
+返回純 JSON。"""
+
+
+# ============ 檢查 ============
+
+def has_content(item):
+    """條目是否有內容：有標題或描述；模型偶爾把條目寫成字符串，非空即算"""
+    if isinstance(item, dict):
+        return bool(item.get("title") or item.get("description"))
+    return bool(str(item or "").strip())
+
+
+def find_defects(data):
+    """返回沒有內容的章節 [{"index", "key", "title", "problems"}]，按章節順序
+
+    只補全沒有條目或條目全為空的章節；缺少時間之類的不算（很多條目本來就沒有時間），
+    否則幾乎每份簡歷都會多一次請求
+    """
+    defects = []
+    for index, section in enumerate(data.get("sections") or []):
+        if not isinstance(section, dict):
+            continue
+        if not any(has_content(item) for item in section.get("items") or []):
+            defects.append({"index": index, "key": section_key(section), "title": section.get("title") or "",
+                            "problems": ["沒有條目"]})
+    return defects[:REPAIR_MAX_SECTIONS]
+
+
+# ============ 重新提取 ============
+
+def section_pages(results, shard_pages):
+    """各章節來自哪些頁面 {章節鍵: {頁碼}}：產出該章節的各分段的頁碼範圍
+
+    results 為按分段順序的解析結果，shard_pages 為對應的頁碼範圍；
+    與 merge_shards 一致，分段開頭沒有標題的章節算作上一段最後一個章節的延續
+    """
+    sources = {}
+    last = None
+    for data, pages in zip(results, shard_pages):
+        if not isinstance(data, dict):
+            continue
+        for position, section in enumerate(data.get("sections") or []):
+            if not isinstance(section, dict):
+                continue
+            key = section_key(section)
+            if not key and position == 0 and last is not None:
+                key = last
+            sources.setdefault(key, set()).update(pages)
+            last = key
+    return sources
+
+
+def relevant_pages(defects, plan):
+    """找出各章節所在的頁面，返回 (page_texts, scanned_pages)
+
+    章節的來源頁面：分段解析時為產出它的分段（plan["section_pages"]），否則為全部頁面；
+    來源頁面的文字層中出現章節標題時，只取標題所在頁及其下一頁（仍限於來源頁面），
+    掃描頁沒有文字無法定位，找不到標題時取全部來源頁面。
+    """
+    all_pages = {number for number, _ in plan["page_texts"]} | set(plan["scanned_pages"])
+    sources = plan.get("section_pages") or {}
+    texts = [(number, normalize_text(text)) for number, text in plan["page_texts"]]
+    selected = set()
+    for defect in defects:
+        source = sources.get(defect["key"]) or all_pages
+        title = normalize_text(defect["title"])
+        hits = [number for number, text in texts if number in source and title and title in text]
+        if hits:
+            selected.update(page for number in hits for page in (number, number + 1) if page in source)
+        else:
+            selected.update(source)
+
+    page_texts = [(number, text) for number, text in plan["page_texts"] if number in selected]
+    scanned = [number for number in plan["scanned_pages"] if number in selected]
+    return page_texts, scanned
+
+
+def repair_prompt(defects):
+    problems = "\n".join(
+        f"- {defect['title'] or '（無標題章節）'}：{'、'.join(defect['problems'])}" for defect in defects
+    )
+    return REPAIR_PROMPT.format(problems=problems)
+
+
+def merge_repaired(data, defects, fixed):
+    """用重新提取的章節替換沒有內容的章節，返回 (data, 已補全的章節標題)"""
+    candidates = [section for section in (fixed or {}).get("sections") or [] if isinstance(section, dict)]
+    by_key = {section_key(section): section for section in candidates}
+    sections = list(data.get("sections") or [])
+    repaired = []
+
+    for defect in defects:
+        old = sections[defect["index"]]
+        new = by_key.get(section_key(old))
+        if new is None and len(defects) == 1 and len(candidates) == 1:
+            new = candidates[0]
+        if not new or not new.get("items"):
+            continue
+        merged = dict(old)
+        merged.update({field: value for field, value in new.items() if value})
+        merged["title"] = old.get("title") or merged.get("title", "")
+        sections[defect["index"]] = merged
+        repaired.append(defect["title"])
+
+    return dict(data, sections=sections), repaired
@@ -0,0 +1,120 @@
+"""
+請求合併（single-flight）
+相同 PDF、提供商、模型和提示詞版本的解析同時進行時只執行一次，
+後到的請求掛到進行中的任務上，共享它的部分結果和最終結果，不再佔用提供商配額
+"""
+
+import asyncio
+import weakref
+
+_RUN = "run"
+_STREAM = "stream"
+
+
+class _Flight:
+    """一個進行中的任務；訂閱者從最新的值開始接收，中間值可能被跳過，但一定收到最後一個"""
+
+    def __init__(self):
+        self.latest = None
+        self.version = 0
+        self.done = False
+        self.error = None
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, item):
+        async with self._changed:
+            self.latest = item
+            self.version += 1
+            self._changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self._changed:
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.version != seen or self.done)
+                if self.version != seen:
+                    seen = self.version
+                    item = self.latest
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield item
+
+
+class SingleFlight:
+    """按 key 合併同時進行的任務
+
+    任務在獨立的 asyncio.Task 中執行：發起它的請求被取消（例如關閉頁面）時，
+    其他掛在上面的請求仍然會拿到結果。
+    """
+
+    def __init__(self):
+        # 每個事件循環各自一份（asyncio 原語不能跨循環使用）
+        self._flights = weakref.WeakKeyDictionary()
+
+    def _loop_flights(self):
+        loop = asyncio.get_running_loop()
+        flights = self._flights.get(loop)
+        if flights is None:
+            flights = self._flights[loop] = {}
+        return flights
+
+    def is_running(self, key, streaming=False):
+        """是否已有相同 key 的任務在進行；streaming 為 True 時查 stream 的任務，否則查 run 的任務"""
+        return (_STREAM if streaming else _RUN, key) in self._loop_flights()
+
+    async def stream(self, key, factory):
+        """factory() 返回異步迭代器；產出 (item, shared)，shared 表示掛在別人的任務上"""
+        async for item, shared in self._subscribe((_STREAM, key), factory):
+            yield item, shared
+
+    async def run(self, key, factory):
+        """factory() 返回協程；返回 (result, shared)"""
+
+        async def single():
+            yield await factory()
+
+        result = shared = None
+        async for result, shared in self._subscribe((_RUN, key), single):
+            pass
+        return result, shared
+
+    async def _subscribe(self, key, factory):
+        # run 和 stream 的任務產出的值形狀不同，key 按種類分開，相同 key 的兩種任務不會互相掛上
+        flights = self._loop_flights()
+        flight = flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = flights[key] = _Flight()
+            flight.task = asyncio.get_running_loop().create_task(self._run(flights, key, flight, factory))
+
+        async for item in flight.subscribe():
+            yield item, shared
+
+    async def _run(self, flights, key, flight, factory):
+        error = None
+        try:
+            async for item in factory():
+                await flight.publish(item)
+        except Exception as e:
+            error = e
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        finally:
+            # 完成後新請求重新開始（此時通常已經能命中解析快取）
+            if flights.get(key) is flight:
+                del flights[key]
+            await flight.finish(error)
+
+
+# 全進程共用的解析任務合併器
+single_flight = SingleFlight()
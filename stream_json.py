@@ -0,0 +1,121 @@
+"""
+增量 JSON 解析
+邊接收提供商的流式響應邊掃描：頂層字段（name、title…）和 sections 中的每個章節
+一完成就可以拿去渲染預覽，不必等整份 JSON 生成完
+"""
+
+import json
+
+
+class SectionStreamParser:
+    """按字符掃描響應文本，只跟蹤字符串、嵌套深度和頂層鍵
+
+    深度約定：頂層對象為 1，sections 數組為 2，單個章節對象為 3。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.sections = []
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "key"
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._section_start = None
+
+    def feed(self, chunk):
+        """追加一段響應文本，返回是否有新完成的字段或章節"""
+        self.text += chunk
+        text = self.text
+        changed = False
+        i = self._pos
+
+        while i < len(text) and not self._done:
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key = json.loads(text[self._key_start:i + 1])
+            elif not self._started:
+                # 跳過 ```json 之類的前綴
+                if c == "{":
+                    self._started = True
+                    self._depth = 1
+            elif c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._expect == "key":
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif c in "{[":
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+                if self._depth == 3 and c == "{" and self._key == "sections":
+                    self._section_start = i
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._section_start is not None:
+                    changed |= self._emit_section(text[self._section_start:i + 1])
+                    self._section_start = None
+                elif self._depth == 0:
+                    changed |= self._emit_field(text, i)
+                    self._done = True
+            elif self._depth == 1:
+                if c == ":":
+                    self._expect = "value"
+                    self._value_start = None
+                elif c == ",":
+                    changed |= self._emit_field(text, i)
+                    self._expect = "key"
+                elif self._expect == "value" and self._value_start is None and not c.isspace():
+                    # 數字、true / false / null
+                    self._value_start = i
+
+            i += 1
+
+        self._pos = i
+        return changed
+
+    def _emit_field(self, text, end):
+        if self._expect != "value" or self._value_start is None or self._key is None:
+            return False
+        raw = text[self._value_start:end].strip()
+        self._value_start = None
+        # sections 已經逐個章節收集過了
+        if self._key == "sections":
+            return False
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except ValueError:
+            return False
+        return True
+
+    def _emit_section(self, raw):
+        try:
+            section = json.loads(raw)
+        except ValueError:
+            return False
+        if not isinstance(section, dict):
+            return False
+        self.sections.append(section)
+        return True
+
+    def partial(self):
+        """目前已完成的部分數據，結構與完整結果相同"""
+        data = dict(self.fields)
+        data["sections"] = list(self.sections)
+        return data
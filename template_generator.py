@@ -1,75 +1,143 @@
 """
 学术主页模板生成器
 将 JSON 数据应用到多种精美模板
+
+各主题都从 cv_document 规范化后的 Document 渲染（字段已转义、可选字段已判断），
+多个主题共用同一份 Document；渲染好的章节按 (主题, 章节内容哈希) 缓存，
+重新生成时只重建内容有变化的章节
+
+模板在导入时预编译：整页的静态部分（含 CSS）只构建一次，拆成静态片段和槽位；
+每个主题是一组槽位渲染器，把片段追加到同一个列表里，最后只 join 一次，
+渲染耗时与条目数成线性
+
+每个主题另有 iter_* 流式版本，逐段产出 HTML，配合 html_stream 写入文件或 ZIP 条目
+
+基准测试：python template_generator.py --benchmark
 """
 
 import json
+import os
+import re
 import sys
+import time
+
+from cv_document import normalize
+from fragment_cache import cached_section, section_cache
+from html_stream import write_file
+
+# ============ 模板引擎 ============
+
+SLOT = re.compile(r"\{\{(\w+)\}\}")
+
+
+def compile_template(text):
+    """把模板拆成 ((静态片段, 槽位名), ...)，最后一段的槽位名为 None"""
+    parts = SLOT.split(text)
+    return tuple(zip(parts[0::2], parts[1::2] + [None]))
+
+
+def render_into(out, template, slots):
+    """按模板把片段追加到 out：槽位的值为字符串时直接追加，为函数时追加 value() 产出的各段"""
+    append = out.append
+    for static, slot in template:
+        if static:
+            append(static)
+        if slot is not None:
+            value = slots[slot]
+            if callable(value):
+                out.extend(value())
+            elif value:
+                append(value)
+
+
+def iter_render(template, slots):
+    """同 render_into，但逐段产出，供流式输出使用"""
+    for static, slot in template:
+        if static:
+            yield static
+        if slot is not None:
+            value = slots[slot]
+            if callable(value):
+                yield from value()
+            elif value:
+                yield value
+
+
+def each(template, items, slots):
+    """槽位渲染器：对每个条目按 slots(item) 渲染模板"""
+    def render():
+        out = []
+        for item in items:
+            render_into(out, template, slots(item))
+        return out
+    return render
+
+
+def optional(snippet, value):
+    """值非空时才输出的片段，例如 optional('<p class="date">{0}</p>', date)"""
+    return snippet.format(value) if value else ""
+
+
+def cached_sections(theme, document, render_section):
+    """槽位渲染器：逐章节产出缓存的片段，未命中时用 render_section(section) 渲染"""
+    def render():
+        for section in document.sections:
+            yield cached_section(theme, section, render_section)
+    return render
+
+
+def render_page(template, slots):
+    """按模板渲染出字符串（整页或章节片段）"""
+    out = []
+    render_into(out, template, slots)
+    return "".join(out)
+
 
 # ============ 模板 1: 紫色渐变科技风 ============
-def template_gradient_purple(data):
-    """紫色渐变 + 玻璃态 + 动画"""
-    sections_html = ""
-    
-    for section in data.get("sections", []):
-        section_type = section.get("type", "text-content")
-        title = section.get("title", "")
-        items = section.get("items", [])
-        
-        if section_type == "timeline":
-            items_html = ""
-            for item in items:
-                items_html += f'''
+GRADIENT_TIMELINE_SECTION = compile_template('<section><h2 class="section-title">{{title}}</h2><div class="timeline">{{items}}</div></section>')
+GRADIENT_GRID_SECTION = compile_template('<section><h2 class="section-title">{{title}}</h2><div class="grid">{{items}}</div></section>')
+GRADIENT_TEXT_SECTION = compile_template('<section><h2 class="section-title">{{title}}</h2><div class="text-content"><p>{{description}}</p></div></section>')
+
+GRADIENT_TIMELINE_ITEM = compile_template('''
                 <div class="timeline-item">
                     <div class="timeline-marker"></div>
                     <div class="timeline-content">
-                        <h3>{item.get('title', '')}</h3>
-                        <p class="subtitle">{item.get('subtitle', '')}</p>
-                        <p class="date">{item.get('date', '')}</p>
-                        {f'<p class="description">{item["description"]}</p>' if item.get('description') else ''}
+                        <h3>{{title}}</h3>
+                        <p class="subtitle">{{subtitle}}</p>
+                        <p class="date">{{date}}</p>
+                        {{description}}
                     </div>
                 </div>
-                '''
-            sections_html += f'<section><h2 class="section-title">{title}</h2><div class="timeline">{items_html}</div></section>'
-        
-        elif section_type == "grid-list":
-            items_html = ""
-            for item in items:
-                tags = "".join([f'<span class="tag">{tag}</span>' for tag in item.get('tags', [])])
-                items_html += f'''
+                ''')
+
+GRADIENT_GRID_ITEM = compile_template('''
                 <div class="grid-card">
-                    <h3>{item.get('title', '')}</h3>
-                    {f'<p class="subtitle">{item["subtitle"]}</p>' if item.get('subtitle') else ''}
-                    {f'<p class="date">{item["date"]}</p>' if item.get('date') else ''}
-                    {f'<p>{item["description"]}</p>' if item.get('description') else ''}
-                    {f'<div class="tags">{tags}</div>' if tags else ''}
+                    <h3>{{title}}</h3>
+                    {{subtitle}}
+                    {{date}}
+                    {{description}}
+                    {{tags}}
                 </div>
-                '''
-            sections_html += f'<section><h2 class="section-title">{title}</h2><div class="grid">{items_html}</div></section>'
-        
-        else:  # text-content
-            for item in items:
-                if item.get('description'):
-                    sections_html += f'<section><h2 class="section-title">{title}</h2><div class="text-content"><p>{item["description"]}</p></div></section>'
-    
-    return f'''<!DOCTYPE html>
+                ''')
+
+GRADIENT_PURPLE_PAGE = compile_template('''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{data.get('name', 'Academic Homepage')}</title>
+    <title>{{page_title}}</title>
     <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
+        * { margin: 0; padding: 0; box-sizing: border-box; }
         
-        body {{
+        body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             min-height: 100vh;
             padding: 2rem;
             color: #333;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 1200px;
             margin: 0 auto;
             background: rgba(255, 255, 255, 0.95);
@@ -77,21 +145,21 @@ def template_gradient_purple(data):
             padding: 3rem;
             box-shadow: 0 20px 60px rgba(0,0,0,0.3);
             animation: fadeIn 0.8s ease-out;
-        }}
+        }
         
-        @keyframes fadeIn {{
-            from {{ opacity: 0; transform: translateY(20px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
+        @keyframes fadeIn {
+            from { opacity: 0; transform: translateY(20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
         
-        .hero {{
+        .hero {
             text-align: center;
             padding: 2rem 0 3rem;
             border-bottom: 2px solid #eee;
             margin-bottom: 3rem;
-        }}
+        }
         
-        h1 {{
+        h1 {
             font-size: 3.5rem;
             font-weight: 800;
             background: linear-gradient(135deg, #667eea, #764ba2);
@@ -99,25 +167,25 @@ def template_gradient_purple(data):
             -webkit-text-fill-color: transparent;
             margin-bottom: 0.5rem;
             animation: slideDown 0.6s ease-out;
-        }}
+        }
         
-        @keyframes slideDown {{
-            from {{ opacity: 0; transform: translateY(-20px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
+        @keyframes slideDown {
+            from { opacity: 0; transform: translateY(-20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
         
-        .hero .title {{ font-size: 1.3rem; color: #666; margin-bottom: 1rem; }}
-        .hero .bio {{ font-size: 1.1rem; color: #444; max-width: 800px; margin: 1.5rem auto; line-height: 1.8; }}
+        .hero .title { font-size: 1.3rem; color: #666; margin-bottom: 1rem; }
+        .hero .bio { font-size: 1.1rem; color: #444; max-width: 800px; margin: 1.5rem auto; line-height: 1.8; }
         
-        .contact {{
+        .contact {
             display: flex;
             gap: 1.5rem;
             justify-content: center;
             margin-top: 1.5rem;
             flex-wrap: wrap;
-        }}
+        }
         
-        .contact a {{
+        .contact a {
             color: #667eea;
             text-decoration: none;
             font-weight: 600;
@@ -125,23 +193,23 @@ def template_gradient_purple(data):
             border-radius: 50px;
             background: rgba(102, 126, 234, 0.1);
             transition: all 0.3s;
-        }}
+        }
         
-        .contact a:hover {{
+        .contact a:hover {
             background: #667eea;
             color: white;
             transform: translateY(-2px);
             box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
-        }}
+        }
         
-        section {{ margin-bottom: 3rem; animation: slideUp 0.6s ease-out; }}
+        section { margin-bottom: 3rem; animation: slideUp 0.6s ease-out; }
         
-        @keyframes slideUp {{
-            from {{ opacity: 0; transform: translateY(30px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
+        @keyframes slideUp {
+            from { opacity: 0; transform: translateY(30px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
         
-        .section-title {{
+        .section-title {
             font-size: 2rem;
             font-weight: 700;
             color: #333;
@@ -149,9 +217,9 @@ def template_gradient_purple(data):
             padding-bottom: 0.5rem;
             border-bottom: 3px solid #667eea;
             position: relative;
-        }}
+        }
         
-        .section-title::after {{
+        .section-title::after {
             content: '';
             position: absolute;
             bottom: -3px;
@@ -159,15 +227,15 @@ def template_gradient_purple(data):
             width: 60px;
             height: 3px;
             background: #764ba2;
-        }}
+        }
         
         /* Timeline */
-        .timeline {{
+        .timeline {
             position: relative;
             padding-left: 2rem;
-        }}
+        }
         
-        .timeline::before {{
+        .timeline::before {
             content: '';
             position: absolute;
             left: 0;
@@ -175,20 +243,20 @@ def template_gradient_purple(data):
             bottom: 0;
             width: 3px;
             background: linear-gradient(180deg, #667eea, #764ba2);
-        }}
+        }
         
-        .timeline-item {{
+        .timeline-item {
             position: relative;
             margin-bottom: 2rem;
             animation: fadeInLeft 0.5s ease-out;
-        }}
+        }
         
-        @keyframes fadeInLeft {{
-            from {{ opacity: 0; transform: translateX(-20px); }}
-            to {{ opacity: 1; transform: translateX(0); }}
-        }}
+        @keyframes fadeInLeft {
+            from { opacity: 0; transform: translateX(-20px); }
+            to { opacity: 1; transform: translateX(0); }
+        }
         
-        .timeline-marker {{
+        .timeline-marker {
             position: absolute;
             left: -2.6rem;
             top: 0.5rem;
@@ -199,159 +267,194 @@ def template_gradient_purple(data):
             border: 3px solid #fff;
             box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.2);
             transition: all 0.3s;
-        }}
+        }
         
-        .timeline-item:hover .timeline-marker {{
+        .timeline-item:hover .timeline-marker {
             transform: scale(1.2);
             box-shadow: 0 0 0 6px rgba(102, 126, 234, 0.3);
-        }}
+        }
         
-        .timeline-content h3 {{ font-size: 1.3rem; color: #333; margin-bottom: 0.3rem; }}
-        .subtitle {{ color: #666; font-weight: 600; margin-bottom: 0.3rem; }}
-        .date {{ color: #999; font-size: 0.9rem; margin-bottom: 0.5rem; font-style: italic; }}
-        .description {{ color: #555; line-height: 1.6; margin-top: 0.5rem; white-space: pre-wrap; }}
+        .timeline-content h3 { font-size: 1.3rem; color: #333; margin-bottom: 0.3rem; }
+        .subtitle { color: #666; font-weight: 600; margin-bottom: 0.3rem; }
+        .date { color: #999; font-size: 0.9rem; margin-bottom: 0.5rem; font-style: italic; }
+        .description { color: #555; line-height: 1.6; margin-top: 0.5rem; white-space: pre-wrap; }
         
         /* Grid */
-        .grid {{
+        .grid {
             display: grid;
             grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
             gap: 1.5rem;
-        }}
+        }
         
-        .grid-card {{
+        .grid-card {
             background: linear-gradient(135deg, #f8f9fa 0%, #fff 100%);
             padding: 1.5rem;
             border-radius: 12px;
             border-left: 4px solid #667eea;
             transition: all 0.3s;
             animation: fadeInUp 0.5s ease-out;
-        }}
+        }
         
-        @keyframes fadeInUp {{
-            from {{ opacity: 0; transform: translateY(20px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
+        @keyframes fadeInUp {
+            from { opacity: 0; transform: translateY(20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
         
-        .grid-card:hover {{
+        .grid-card:hover {
             transform: translateY(-5px);
             box-shadow: 0 10px 30px rgba(102, 126, 234, 0.2);
             border-left-color: #764ba2;
-        }}
+        }
         
-        .grid-card h3 {{ font-size: 1.2rem; color: #333; margin-bottom: 0.5rem; }}
+        .grid-card h3 { font-size: 1.2rem; color: #333; margin-bottom: 0.5rem; }
         
-        .tags {{
+        .tags {
             margin-top: 1rem;
             display: flex;
             gap: 0.5rem;
             flex-wrap: wrap;
-        }}
+        }
         
-        .tag {{
+        .tag {
             background: linear-gradient(135deg, #667eea, #764ba2);
             color: white;
             padding: 0.3rem 0.8rem;
             border-radius: 20px;
             font-size: 0.85rem;
             transition: transform 0.2s;
-        }}
+        }
         
-        .tag:hover {{
+        .tag:hover {
             transform: scale(1.05);
-        }}
+        }
         
         /* Text Content */
-        .text-content {{
+        .text-content {
             background: linear-gradient(135deg, #f8f9fa 0%, #fff 100%);
             padding: 2rem;
             border-radius: 12px;
             line-height: 1.8;
             color: #444;
             white-space: pre-wrap;
-        }}
-        
-        @media (max-width: 768px) {{
-            body {{ padding: 1rem; }}
-            .container {{ padding: 1.5rem; }}
-            h1 {{ font-size: 2rem; }}
-            .grid {{ grid-template-columns: 1fr; }}
-        }}
+        }
+        
+        @media (max-width: 768px) {
+            body { padding: 1rem; }
+            .container { padding: 1.5rem; }
+            h1 { font-size: 2rem; }
+            .grid { grid-template-columns: 1fr; }
+        }
     </style>
 </head>
 <body>
     <div class="container">
         <div class="hero">
-            <h1>{data.get('name', '')}</h1>
-            {f'<p class="title">{data["title"]}</p>' if data.get('title') else ''}
-            {f'<p class="bio">{data["bio"]}</p>' if data.get('bio') else ''}
+            <h1>{{name}}</h1>
+            {{title}}
+            {{bio}}
             <div class="contact">
-                {f'<a href="mailto:{data["email"]}">📧 Email</a>' if data.get('email') else ''}
-                {f'<a href="https://{data["website"]}" target="_blank">🌐 Website</a>' if data.get('website') else ''}
+                {{email}}
+                {{website}}
             </div>
         </div>
-        {sections_html}
+        {{sections}}
     </div>
 </body>
-</html>'''
+</html>''')
+
+
+def _gradient_timeline_item(item):
+    return {
+        "title": item.title,
+        "subtitle": item.subtitle,
+        "date": item.date,
+        "description": optional('<p class="description">{0}</p>', item.description),
+    }
+
+
+def _gradient_grid_item(item):
+    tags = "".join([f'<span class="tag">{tag}</span>' for tag in item.tags]) if item.has_tags else ""
+    return {
+        "title": item.title,
+        "subtitle": optional('<p class="subtitle">{0}</p>', item.subtitle),
+        "date": optional('<p class="date">{0}</p>', item.date),
+        "description": optional('<p>{0}</p>', item.description),
+        "tags": optional('<div class="tags">{0}</div>', tags),
+    }
+
+
+def _gradient_purple_section(section):
+    if section.type == "timeline":
+        return render_page(GRADIENT_TIMELINE_SECTION,
+                           {"title": section.title, "items": each(GRADIENT_TIMELINE_ITEM, section.items, _gradient_timeline_item)})
+    if section.type == "grid-list":
+        return render_page(GRADIENT_GRID_SECTION,
+                           {"title": section.title, "items": each(GRADIENT_GRID_ITEM, section.items, _gradient_grid_item)})
+    # text-content
+    return "".join(
+        render_page(GRADIENT_TEXT_SECTION, {"title": section.title, "description": item.description})
+        for item in section.items if item.has_description
+    )
+
+
+def iter_gradient_purple(data):
+    """紫色渐变 + 玻璃态 + 动画（逐段产出）"""
+    document = normalize(data)
+    return iter_render(GRADIENT_PURPLE_PAGE, {
+        "page_title": document.page_title,
+        "name": document.name,
+        "title": optional('<p class="title">{0}</p>', document.title),
+        "bio": optional('<p class="bio">{0}</p>', document.bio),
+        "email": optional('<a href="mailto:{0}">📧 Email</a>', document.email),
+        "website": optional('<a href="https://{0}" target="_blank">🌐 Website</a>', document.website),
+        "sections": cached_sections("gradient_purple", document, _gradient_purple_section),
+    })
+
+
+def template_gradient_purple(data):
+    """紫色渐变 + 玻璃态 + 动画"""
+    return "".join(iter_gradient_purple(data))
 
 
 # ============ 模板 2: 暗黑极简风 ============
-def template_dark_minimal(data):
-    """暗黑背景 + 霓虹色彩"""
-    sections_html = ""
-    
-    for section in data.get("sections", []):
-        section_type = section.get("type", "text-content")
-        title = section.get("title", "")
-        items = section.get("items", [])
-        
-        if section_type == "timeline":
-            items_html = ""
-            for item in items:
-                items_html += f'''
+DARK_TIMELINE_SECTION = compile_template('<section><h2>{{title}}</h2>{{items}}</section>')
+DARK_GRID_SECTION = compile_template('<section><h2>{{title}}</h2><div class="grid">{{items}}</div></section>')
+DARK_TEXT_SECTION = compile_template('<section><h2>{{title}}</h2><p class="desc">{{description}}</p></section>')
+
+DARK_TIMELINE_ITEM = compile_template('''
                 <div class="item">
-                    <h3>{item.get('title', '')}</h3>
-                    {f'<p class="sub">{item["subtitle"]}</p>' if item.get('subtitle') else ''}
-                    {f'<p class="date">{item["date"]}</p>' if item.get('date') else ''}
-                    {f'<p class="desc">{item["description"]}</p>' if item.get('description') else ''}
+                    <h3>{{title}}</h3>
+                    {{subtitle}}
+                    {{date}}
+                    {{description}}
                 </div>
-                '''
-            sections_html += f'<section><h2>{title}</h2>{items_html}</section>'
-        
-        elif section_type == "grid-list":
-            items_html = ""
-            for item in items:
-                items_html += f'''
+                ''')
+
+DARK_GRID_ITEM = compile_template('''
                 <div class="card">
-                    <h3>{item.get('title', '')}</h3>
-                    {f'<p>{item["description"]}</p>' if item.get('description') else ''}
+                    <h3>{{title}}</h3>
+                    {{description}}
                 </div>
-                '''
-            sections_html += f'<section><h2>{title}</h2><div class="grid">{items_html}</div></section>'
-        
-        else:
-            for item in items:
-                if item.get('description'):
-                    sections_html += f'<section><h2>{title}</h2><p class="desc">{item["description"]}</p></section>'
-    
-    return f'''<!DOCTYPE html>
+                ''')
+
+DARK_MINIMAL_PAGE = compile_template('''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{data.get('name', '')}</title>
+    <title>{{name}}</title>
     <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
+        * { margin: 0; padding: 0; box-sizing: border-box; }
         
-        body {{
+        body {
             font-family: 'Courier New', monospace;
             background: #0a0a0a;
             color: #e0e0e0;
             padding: 2rem;
             min-height: 100vh;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 900px;
             margin: 0 auto;
             background: rgba(20, 20, 20, 0.9);
@@ -359,262 +462,427 @@ def template_dark_minimal(data):
             border-radius: 10px;
             padding: 3rem;
             box-shadow: 0 0 50px rgba(0, 255, 65, 0.1);
-        }}
+        }
         
-        h1 {{
+        h1 {
             font-size: 3rem;
             color: #00ff41;
             text-transform: uppercase;
             letter-spacing: 0.2rem;
             margin-bottom: 1rem;
             text-shadow: 0 0 10px rgba(0, 255, 65, 0.5);
-        }}
+        }
         
-        .title {{ color: #00d4ff; margin-bottom: 1rem; font-size: 1.2rem; }}
-        .bio {{ color: #ccc; line-height: 1.8; margin-bottom: 2rem; white-space: pre-wrap; }}
+        .title { color: #00d4ff; margin-bottom: 1rem; font-size: 1.2rem; }
+        .bio { color: #ccc; line-height: 1.8; margin-bottom: 2rem; white-space: pre-wrap; }
         
-        .contact {{
+        .contact {
             display: flex;
             gap: 1rem;
             margin-bottom: 3rem;
-        }}
+        }
         
-        .contact a {{
+        .contact a {
             color: #00ff41;
             text-decoration: none;
             padding: 0.5rem 1rem;
             border: 1px solid #00ff41;
             border-radius: 5px;
             transition: all 0.3s;
-        }}
+        }
         
-        .contact a:hover {{
+        .contact a:hover {
             background: #00ff41;
             color: #000;
             box-shadow: 0 0 20px rgba(0, 255, 65, 0.6);
-        }}
+        }
         
-        section {{
+        section {
             margin-bottom: 3rem;
             padding-bottom: 2rem;
             border-bottom: 1px solid #333;
-        }}
+        }
         
-        h2 {{
+        h2 {
             color: #00d4ff;
             font-size: 1.8rem;
             margin-bottom: 1.5rem;
             text-transform: uppercase;
             letter-spacing: 0.1rem;
-        }}
+        }
         
-        .item {{
+        .item {
             margin-bottom: 2rem;
             padding-left: 1.5rem;
             border-left: 2px solid #00ff41;
-        }}
+        }
         
-        h3 {{ color: #fff; margin-bottom: 0.5rem; }}
-        .sub {{ color: #00d4ff; margin-bottom: 0.3rem; }}
-        .date {{ color: #888; font-size: 0.9rem; margin-bottom: 0.5rem; }}
-        .desc {{ color: #ccc; line-height: 1.6; margin-top: 0.5rem; white-space: pre-wrap; }}
+        h3 { color: #fff; margin-bottom: 0.5rem; }
+        .sub { color: #00d4ff; margin-bottom: 0.3rem; }
+        .date { color: #888; font-size: 0.9rem; margin-bottom: 0.5rem; }
+        .desc { color: #ccc; line-height: 1.6; margin-top: 0.5rem; white-space: pre-wrap; }
         
-        .grid {{
+        .grid {
             display: grid;
             grid-template-columns: repeat(auto-fill, minmax(250px, 1fr));
             gap: 1rem;
-        }}
+        }
         
-        .card {{
+        .card {
             background: rgba(0, 255, 65, 0.05);
             border: 1px solid #00ff41;
             padding: 1.5rem;
             border-radius: 8px;
             transition: all 0.3s;
-        }}
+        }
         
-        .card:hover {{
+        .card:hover {
             background: rgba(0, 255, 65, 0.1);
             box-shadow: 0 0 20px rgba(0, 255, 65, 0.2);
-        }}
+        }
         
-        @media (max-width: 768px) {{
-            body {{ padding: 1rem; }}
-            .container {{ padding: 1.5rem; }}
-            h1 {{ font-size: 2rem; }}
-        }}
+        @media (max-width: 768px) {
+            body { padding: 1rem; }
+            .container { padding: 1.5rem; }
+            h1 { font-size: 2rem; }
+        }
     </style>
 </head>
 <body>
     <div class="container">
-        <h1>{data.get('name', '')}</h1>
-        {f'<p class="title">{data["title"]}</p>' if data.get('title') else ''}
-        {f'<p class="bio">{data["bio"]}</p>' if data.get('bio') else ''}
+        <h1>{{name}}</h1>
+        {{title}}
+        {{bio}}
         <div class="contact">
-            {f'<a href="mailto:{data["email"]}">EMAIL</a>' if data.get('email') else ''}
-            {f'<a href="https://{data["website"]}" target="_blank">WEBSITE</a>' if data.get('website') else ''}
+            {{email}}
+            {{website}}
         </div>
-        {sections_html}
+        {{sections}}
     </div>
 </body>
-</html>'''
+</html>''')
+
+
+def _dark_timeline_item(item):
+    return {
+        "title": item.title,
+        "subtitle": optional('<p class="sub">{0}</p>', item.subtitle),
+        "date": optional('<p class="date">{0}</p>', item.date),
+        "description": optional('<p class="desc">{0}</p>', item.description),
+    }
+
+
+def _dark_grid_item(item):
+    return {
+        "title": item.title,
+        "description": optional('<p>{0}</p>', item.description),
+    }
+
+
+def _dark_minimal_section(section):
+    if section.type == "timeline":
+        return render_page(DARK_TIMELINE_SECTION,
+                           {"title": section.title, "items": each(DARK_TIMELINE_ITEM, section.items, _dark_timeline_item)})
+    if section.type == "grid-list":
+        return render_page(DARK_GRID_SECTION,
+                           {"title": section.title, "items": each(DARK_GRID_ITEM, section.items, _dark_grid_item)})
+    return "".join(
+        render_page(DARK_TEXT_SECTION, {"title": section.title, "description": item.description})
+        for item in section.items if item.has_description
+    )
+
+
+def iter_dark_minimal(data):
+    """暗黑背景 + 霓虹色彩（逐段产出）"""
+    document = normalize(data)
+    return iter_render(DARK_MINIMAL_PAGE, {
+        "name": document.name,
+        "title": optional('<p class="title">{0}</p>', document.title),
+        "bio": optional('<p class="bio">{0}</p>', document.bio),
+        "email": optional('<a href="mailto:{0}">EMAIL</a>', document.email),
+        "website": optional('<a href="https://{0}" target="_blank">WEBSITE</a>', document.website),
+        "sections": cached_sections("dark_minimal", document, _dark_minimal_section),
+    })
+
+
+def template_dark_minimal(data):
+    """暗黑背景 + 霓虹色彩"""
+    return "".join(iter_dark_minimal(data))
 
 
 # ============ 模板 3: 轻简学术风 ============
-def template_academic_light(data):
-    """传统学术风格 + 现代优化"""
-    sections_html = ""
-    
-    for section in data.get("sections", []):
-        title = section.get("title", "")
-        items = section.get("items", [])
-        
-        items_html = ""
-        for item in items:
-            items_html += f'''
+ACADEMIC_SECTION = compile_template('<section><h2>{{title}}</h2>{{items}}</section>')
+
+ACADEMIC_ENTRY = compile_template('''
             <div class="entry">
-                <h3>{item.get('title', '')}</h3>
-                {f'<p class="meta">{item.get("subtitle", "")} | {item.get("date", "")}</p>' if item.get('subtitle') or item.get('date') else ''}
-                {f'<p class="desc">{item["description"]}</p>' if item.get('description') else ''}
+                <h3>{{title}}</h3>
+                {{meta}}
+                {{description}}
             </div>
-            '''
-        
-        sections_html += f'<section><h2>{title}</h2>{items_html}</section>'
-    
-    return f'''<!DOCTYPE html>
+            ''')
+
+ACADEMIC_LIGHT_PAGE = compile_template('''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{data.get('name', '')}</title>
+    <title>{{name}}</title>
     <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
+        * { margin: 0; padding: 0; box-sizing: border-box; }
         
-        body {{
+        body {
             font-family: 'Georgia', 'Times New Roman', serif;
             background: #fafafa;
             color: #333;
             line-height: 1.6;
             padding: 2rem;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 800px;
             margin: 0 auto;
             background: white;
             padding: 4rem;
             box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }}
+        }
         
-        h1 {{
+        h1 {
             font-size: 2.5rem;
             color: #2c3e50;
             margin-bottom: 0.5rem;
             font-weight: 600;
-        }}
+        }
         
-        .title {{ color: #7f8c8d; font-size: 1.1rem; margin-bottom: 1rem; }}
-        .bio {{ color: #555; margin: 2rem 0; font-size: 1.05rem; white-space: pre-wrap; }}
+        .title { color: #7f8c8d; font-size: 1.1rem; margin-bottom: 1rem; }
+        .bio { color: #555; margin: 2rem 0; font-size: 1.05rem; white-space: pre-wrap; }
         
-        .contact {{
+        .contact {
             margin-bottom: 3rem;
             padding-bottom: 2rem;
             border-bottom: 2px solid #e0e0e0;
-        }}
+        }
         
-        .contact a {{
+        .contact a {
             color: #3498db;
             text-decoration: none;
             margin-right: 1.5rem;
-        }}
+        }
         
-        .contact a:hover {{
+        .contact a:hover {
             text-decoration: underline;
-        }}
+        }
         
-        section {{
+        section {
             margin-bottom: 2.5rem;
-        }}
+        }
         
-        h2 {{
+        h2 {
             font-size: 1.5rem;
             color: #2c3e50;
             margin-bottom: 1rem;
             padding-bottom: 0.5rem;
             border-bottom: 1px solid #bdc3c7;
-        }}
+        }
         
-        .entry {{
+        .entry {
             margin-bottom: 1.5rem;
-        }}
+        }
         
-        h3 {{
+        h3 {
             font-size: 1.1rem;
             color: #34495e;
             font-weight: 600;
-        }}
+        }
         
-        .meta {{
+        .meta {
             color: #7f8c8d;
             font-size: 0.95rem;
             margin: 0.3rem 0;
-        }}
+        }
         
-        .desc {{
+        .desc {
             color: #555;
             margin-top: 0.5rem;
             white-space: pre-wrap;
-        }}
+        }
         
-        @media (max-width: 768px) {{
-            .container {{ padding: 2rem; }}
-            h1 {{ font-size: 2rem; }}
-        }}
+        @media (max-width: 768px) {
+            .container { padding: 2rem; }
+            h1 { font-size: 2rem; }
+        }
     </style>
 </head>
 <body>
     <div class="container">
-        <h1>{data.get('name', '')}</h1>
-        {f'<p class="title">{data["title"]}</p>' if data.get('title') else ''}
+        <h1>{{name}}</h1>
+        {{title}}
         <div class="contact">
-            {f'<a href="mailto:{data["email"]}">{data["email"]}</a>' if data.get('email') else ''}
-            {f'<a href="https://{data["website"]}" target="_blank">{data["website"]}</a>' if data.get('website') else ''}
+            {{email}}
+            {{website}}
         </div>
-        {f'<p class="bio">{data["bio"]}</p>' if data.get('bio') else ''}
-        {sections_html}
+        {{bio}}
+        {{sections}}
     </div>
 </body>
-</html>'''
+</html>''')
+
+
+def _academic_entry(item):
+    meta = ""
+    if item.has_subtitle or item.has_date:
+        meta = f'<p class="meta">{item.subtitle} | {item.date}</p>'
+    return {
+        "title": item.title,
+        "meta": meta,
+        "description": optional('<p class="desc">{0}</p>', item.description),
+    }
+
 
+def _academic_light_section(section):
+    return render_page(ACADEMIC_SECTION, {
+        "title": section.title,
+        "items": each(ACADEMIC_ENTRY, section.items, _academic_entry),
+    })
+
+
+def iter_academic_light(data):
+    """传统学术风格 + 现代优化（逐段产出）"""
+    document = normalize(data)
+    return iter_render(ACADEMIC_LIGHT_PAGE, {
+        "name": document.name,
+        "title": optional('<p class="title">{0}</p>', document.title),
+        "email": optional('<a href="mailto:{0}">{0}</a>', document.email),
+        "website": optional('<a href="https://{0}" target="_blank">{0}</a>', document.website),
+        "bio": optional('<p class="bio">{0}</p>', document.bio),
+        "sections": cached_sections("academic_light", document, _academic_light_section),
+    })
+
+
+def template_academic_light(data):
+    """传统学术风格 + 现代优化"""
+    return "".join(iter_academic_light(data))
 
 
 # ============ 主函数 ============
-def generate_all_themes(json_data):
-    """生成所有主题"""
+THEMES = {
+    'gradient_purple': ('紫色渐变科技风', template_gradient_purple),
+    'dark_minimal': ('暗黑极简风', template_dark_minimal),
+    'academic_light': ('轻简学术风', template_academic_light),
+}
+
+# 各主题的流式版本：逐段产出 HTML，可直接写入文件或 ZIP 条目（见 html_stream）
+THEME_STREAMS = {
+    'gradient_purple': iter_gradient_purple,
+    'dark_minimal': iter_dark_minimal,
+    'academic_light': iter_academic_light,
+}
+
+def generate_all_themes(json_data, output_dir=None, timings=None):
+    """生成所有主题（只规范化一次，各主题共用同一份 Document）
+
+    逐个主题流式写入文件，整页不在内存里拼接。返回 {主题名: 文件名}，顺序与 THEMES 一致；
+    传入 timings（字典）时按主题名填入 {"render": 秒, "write": 秒}
+    """
     if isinstance(json_data, str):
         data = json.loads(json_data)
     else:
         data = json_data
-    
-    themes = {
-        'gradient_purple': ('紫色渐变科技风', template_gradient_purple),
-        'dark_minimal': ('暗黑极简风', template_dark_minimal),
-        'academic_light': ('轻简学术风', template_academic_light),
+    document = normalize(data)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    files = {theme_id: os.path.join(output_dir or "", f"homepage_{theme_id}.html") for theme_id in THEMES}
+
+    measured = {}
+    for theme_id, iter_theme in THEME_STREAMS.items():
+        render_seconds, write_seconds = write_file(files[theme_id], iter_theme(document))
+        measured[theme_id] = {"render": render_seconds, "write": write_seconds}
+
+    results = {}
+    for theme_id, (theme_name, _) in THEMES.items():
+        results[theme_name] = files[theme_id]
+        if timings is not None:
+            timings[theme_name] = measured[theme_id]
+        print(f"✅ 已生成：{theme_name} → {files[theme_id]}"
+              f"（渲染 {measured[theme_id]['render'] * 1000:.1f} ms，写入 {measured[theme_id]['write'] * 1000:.1f} ms）")
+
+    return results
+
+
+# ============ 基准测试 ============
+def sample_data(item_count):
+    """构造含 item_count 个条目的简历：时间线、卡片（带标签）、文本三类章节各占三分之一"""
+    per_section = max(1, item_count // 3)
+    item = {
+        "title": "A Study of Something Important",
+        "subtitle": "Journal of Examples",
+        "date": "2024",
+        "description": "We propose a method and evaluate it on several benchmarks. " * 3,
+        "tags": ["ml", "vision", "nlp"],
     }
-    
+    return {
+        "name": "Benchmark Author",
+        "title": "Professor",
+        "email": "author@example.com",
+        "website": "example.com",
+        "bio": "Research interests include examples and benchmarks.",
+        "sections": [
+            {"title": "Publications", "type": "timeline", "items": [dict(item) for _ in range(per_section)]},
+            {"title": "Projects", "type": "grid-list", "items": [dict(item) for _ in range(per_section)]},
+            {"title": "Notes", "type": "text-content", "items": [dict(item) for _ in range(per_section)]},
+        ],
+    }
+
+
+def benchmark(item_counts=(100, 200, 400, 800, 1600, 3200), repeat=5):
+    """每个主题在不同条目数下的渲染耗时（取 repeat 次中最快的一次，毫秒）；
+    和 generate_all_themes 一样先规范化一次，只计渲染，每次都清空章节缓存"""
     results = {}
-    for theme_id, (theme_name, template_func) in themes.items():
-        html = template_func(data)
-        filename = f"homepage_{theme_id}.html"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html)
-        results[theme_name] = filename
-        print(f"✅ 已生成：{theme_name} → {filename}")
-    
+    for count in item_counts:
+        document = normalize(sample_data(count))
+        results[count] = {}
+        for theme_id, (_, template_func) in THEMES.items():
+            best = float("inf")
+            for _ in range(repeat):
+                section_cache.clear()
+                started = time.perf_counter()
+                template_func(document)
+                best = min(best, time.perf_counter() - started)
+            results[count][theme_id] = best * 1000
     return results
 
 
+def benchmark_edit(item_count=3200):
+    """修改一个条目后重新生成全部主题的耗时（毫秒）：(无缓存, 有章节缓存)"""
+    data = sample_data(item_count)
+    section_cache.clear()
+    for _, template_func in THEMES.values():
+        template_func(normalize(data))
+    data["sections"][0]["items"][0]["title"] = "An Edited Title"
+
+    timings = []
+    for clear in (True, False):
+        if clear:
+            section_cache.clear()
+        started = time.perf_counter()
+        document = normalize(data)
+        for _, template_func in THEMES.values():
+            template_func(document)
+        timings.append((time.perf_counter() - started) * 1000)
+    return tuple(timings)
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        results = benchmark()
+        print(f"\n{'条目数':>8}" + "".join(f"{theme_id:>18}" for theme_id in next(iter(results.values()))) + f"{'微秒/条目':>12}")
+        for count, timings in results.items():
+            # 线性扩展时每条目耗时大致不变
+            per_item = sum(timings.values()) / len(timings) / count * 1000
+            print(f"{count:>8}" + "".join(f"{ms:>16.2f}ms" for ms in timings.values()) + f"{per_item:>12.2f}")
+        cold, cached = benchmark_edit()
+        print(f"\n修改一个条目后重新生成（3200 条目，含规范化）：无缓存 {cold:.2f}ms，章节缓存 {cached:.2f}ms")
+        sys.exit(0)
+
     if len(sys.argv) > 1:
         # 从文件读取
         with open(sys.argv[1], 'r', encoding='utf-8') as f:
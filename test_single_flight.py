@@ -0,0 +1,56 @@
+"""
+請求合併測試：python -m pytest -q test_single_flight.py
+"""
+
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def test_run_and_stream_on_same_key_do_not_share():
+    """相同 key 的 run 和 stream 同時進行：各自執行自己的任務，拿到各自形狀的結果"""
+    flights = SingleFlight()
+    calls = []
+
+    async def parse():
+        calls.append("run")
+        await asyncio.sleep(0.01)
+        return "data", None, {}
+
+    async def parse_stream():
+        calls.append("stream")
+        yield "partial", None, {}, False
+        await asyncio.sleep(0.01)
+        yield "data", None, {}, True
+
+    async def streamed():
+        return [item async for item in flights.stream("key", parse_stream)]
+
+    async def main():
+        streaming = asyncio.ensure_future(streamed())
+        await asyncio.sleep(0)
+        assert flights.is_running("key", streaming=True)
+        assert not flights.is_running("key")
+        return await asyncio.gather(flights.run("key", parse), streaming)
+
+    (result, shared), items = asyncio.run(main())
+    assert result == ("data", None, {}) and not shared
+    assert items[-1] == (("data", None, {}, True), False)
+    assert sorted(calls) == ["run", "stream"]
+
+
+def test_same_kind_on_same_key_shares_one_task():
+    flights = SingleFlight()
+    calls = []
+
+    async def parse():
+        calls.append("run")
+        await asyncio.sleep(0.01)
+        return "data"
+
+    async def main():
+        return await asyncio.gather(flights.run("key", parse), flights.run("key", parse))
+
+    first, second = asyncio.run(main())
+    assert first == ("data", False) and second == ("data", True)
+    assert calls == ["run"]
@@ -0,0 +1,154 @@
+"""
+容錯 JSON 解析
+模型偶爾仍會輸出不標準的 JSON：代碼塊沒有閉合、前後夾帶說明文字、單引號、
+尾隨逗號、Python 的 True/None、註釋，或者因長度限制被截斷。
+這裡在本地修復這些問題，避免為一個多餘的字符重跑整次解析
+"""
+
+import json
+import re
+
+FENCE = re.compile(r"```(?:json|JSON)?\s*")
+# 裸詞：字母（含中文等 Unicode 字母）或下劃線開頭
+WORD = re.compile(r"[^\W\d][\w\-]*")
+LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_fences(text):
+    """去掉 markdown 代碼塊標記；代碼塊沒有閉合時也能處理"""
+    text = text.strip()
+    if "```" not in text:
+        return text
+    # 取第一段包含 { 的內容：代碼塊前後的說明文字被丟掉，代碼塊沒有閉合也沒關係
+    for part in FENCE.split(text):
+        if "{" in part:
+            return part.strip()
+    return text
+
+
+def _from_object(text):
+    """從第一個 { 開始，丟掉前面的說明文字（後面的由解析時忽略）"""
+    start = text.find("{")
+    return text[start:] if start >= 0 else text
+
+
+def _rewrite(text):
+    """逐字符重寫為標準 JSON
+
+    返回 (完整重寫, 最後一個安全截斷點)：截斷點為最後一個完整值之後的輸出，
+    以及當時未閉合的括號，用於修復被截斷的輸出。
+    """
+    out = []
+    stack = []
+    safe = ([], [])
+    quote = None
+    i = 0
+    n = len(text)
+
+    while i < n:
+        c = text[i]
+        if quote:
+            if c == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                # 單引號字符串裡的 \' 在 JSON 中不需要轉義
+                out.append("'" if quote == "'" and nxt == "'" else c + nxt)
+                i += 2
+                continue
+            if c == quote:
+                out.append('"')
+                quote = None
+            elif c == '"':
+                out.append('\\"')
+            elif c == "\n":
+                out.append("\\n")
+            else:
+                out.append(c)
+            i += 1
+            continue
+
+        if c in "\"'":
+            quote = c
+            out.append('"')
+        elif c == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        elif c == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        elif c in "{[":
+            stack.append(c)
+            out.append(c)
+        elif c in "}]":
+            _trim_comma(out)
+            if stack:
+                out.append(CLOSERS[stack.pop()])
+            safe = (list(out), list(stack))
+            if not stack:
+                # 頂層對象已經結束，後面的說明文字不要
+                return out, stack, safe
+        elif c == ",":
+            _trim_comma(out)
+            safe = (list(out), list(stack))
+            out.append(c)
+        elif c in "eE" and out and out[-1][-1:] in "0123456789.":
+            # 科學計數法的指數部分
+            out.append(c)
+        elif c.isalpha() or c == "_":
+            match = WORD.match(text, i)
+            if match is None:
+                raise ValueError(f"無法識別的字符 {c!r}（位置 {i}）")
+            word = match.group()
+            # 不認識的裸詞（例如沒加引號的鍵）當作字符串
+            out.append(LITERALS.get(word, json.dumps(word)))
+            i += len(word)
+            continue
+        else:
+            out.append(c)
+        i += 1
+
+    if quote:
+        out.append('"')
+    return out, stack, safe
+
+
+def _trim_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _close(out, stack):
+    text = "".join(out).rstrip()
+    if text.endswith(":"):
+        text += " null"
+    text = text.rstrip(",")
+    return text + "".join(CLOSERS[c] for c in reversed(stack))
+
+
+def repair_json(text):
+    """盡力把模型輸出修復為 JSON 對象，無法修復時拋出 ValueError"""
+    body = _from_object(strip_fences(text))
+    try:
+        return json.JSONDecoder(strict=False).raw_decode(body)[0]
+    except ValueError as e:
+        error = e
+
+    out, stack, (safe_out, safe_stack) = _rewrite(body)
+    for candidate in (_close(out, stack), _close(safe_out, safe_stack)):
+        try:
+            return json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+    raise error
+
+
+def loads(text):
+    """先按標準 JSON 解析，失敗時再修復"""
+    try:
+        return json.loads(strip_fences(text))
+    except ValueError:
+        return repair_json(text)
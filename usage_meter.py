@@ -0,0 +1,174 @@
+"""
+請求用量計量
+每次解析請求記錄頁數、像素、發送的圖片字節數、提供商返回的 token 用量、
+各階段耗時和估算費用；請求結束時附在狀態欄後面，並追加到本地 NDJSON 日誌，便於彙總做容量規劃。
+
+計量對象通過 contextvars 傳到提供商調用裡，解析函數的簽名不需要改變：
+異步任務和 asyncio.to_thread 都會繼承它，並行分段、草稿和章節補全的用量記在同一個請求上
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+# ============ 配置 ============
+
+# 用量日誌路徑（每行一個 JSON）；設為空字符串時不寫日誌
+USAGE_LOG = os.environ.get("HOMEPAGE_USAGE_LOG", "usage_log.ndjson")
+
+# 每百萬 token 的價格（美元）：(輸入, 輸出)；可用 HOMEPAGE_MODEL_PRICES（JSON）覆蓋或補充
+MODEL_PRICES = {
+    "gemini-2.0-flash-exp": (0.0, 0.0),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "replay": (0.0, 0.0),
+}
+MODEL_PRICES.update({
+    model: tuple(price) for model, price in json.loads(os.environ.get("HOMEPAGE_MODEL_PRICES", "{}")).items()
+})
+
+_current = contextvars.ContextVar("request_usage", default=None)
+_log_lock = threading.Lock()
+
+
+# ============ 計量 ============
+
+class RequestUsage:
+    """一次請求的用量；多個執行緒和任務同時累加，因此加鎖"""
+
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self.pages = 0
+        self.pixels = 0
+        self.encoded_bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self.cost = 0.0
+        # 有調用的模型不在價格表裡時費用不完整
+        self.priced = True
+        # 各階段累計耗時（秒）；分段並行時是各段之和，可能大於總耗時
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add_page(self, pixels, nbytes):
+        with self._lock:
+            self.pages += 1
+            self.pixels += pixels
+            self.encoded_bytes += nbytes
+
+    def add_call(self, model, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            price = MODEL_PRICES.get(model)
+            if price is None:
+                self.priced = False
+            else:
+                self.cost += (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "pages": self.pages,
+                "pixels": self.pixels,
+                "encoded_bytes": self.encoded_bytes,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "calls": self.calls,
+                "cost_usd": round(self.cost, 6) if self.priced else None,
+                "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            }
+
+
+def start(provider, model):
+    """為當前請求（當前任務或執行緒的上下文）開始計量"""
+    usage = RequestUsage(provider, model)
+    _current.set(usage)
+    return usage
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def measure(stage):
+    """把代碼塊的耗時記到當前請求的 stage 階段；沒有在計量時什麼也不做"""
+    usage = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if usage is not None:
+            usage.add_stage(stage, time.perf_counter() - started)
+
+
+def encode_pages(images, encode, size=len):
+    """逐頁渲染並編碼，產出 encode(image) 的結果
+
+    圖片是惰性生成的，取下一頁的時間記為 rasterize（渲染和頁面過濾），
+    編碼的時間記為 encode，並記錄頁數、像素和編碼後的字節數 size(result)。
+    """
+    usage = _current.get()
+    if usage is None:
+        yield from (encode(image) for image in images)
+        return
+    iterator = iter(images)
+    while True:
+        started = time.perf_counter()
+        image = next(iterator, None)
+        encoding = time.perf_counter()
+        if image is None:
+            usage.add_stage("rasterize", encoding - started)
+            return
+        result = encode(image)
+        usage.add_stage("rasterize", encoding - started)
+        usage.add_stage("encode", time.perf_counter() - encoding)
+        usage.add_page(image.width * image.height, size(result))
+        yield result
+
+
+def record_call(model, prompt_tokens, completion_tokens):
+    """記錄一次提供商調用的 token 用量（提供商沒有返回時記 0）"""
+    usage = _current.get()
+    if usage is not None:
+        usage.add_call(model, prompt_tokens or 0, completion_tokens or 0)
+
+
+# ============ 日誌 ============
+
+def write_log(entry):
+    """追加一行到 NDJSON 用量日誌"""
+    if not USAGE_LOG:
+        return
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    try:
+        with _log_lock, open(USAGE_LOG, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"[用量] 寫入日誌失敗: {e}")
+
+
+def describe_usage(usage):
+    """狀態欄裡的用量摘要"""
+    stats = usage.as_dict()
+    parts = []
+    if stats["pages"]:
+        parts.append(f"{stats['pages']} 頁圖片 {stats['encoded_bytes'] / 1024:,.0f} KB")
+    if stats["calls"]:
+        parts.append(f"{stats['prompt_tokens']:,} + {stats['completion_tokens']:,} tokens")
+    if stats["cost_usd"] is not None and stats["calls"]:
+        parts.append(f"約 ${stats['cost_usd']:.4f}")
+    return "，".join(parts)